@@ -0,0 +1,211 @@
+"""Absenteeism KPIs computed with pandas over a period's raw records.
+
+Presence records, atestados and licenças are read with narrow projections
+into column arrays, intervals are expanded to days with NumPy, and every
+indicator is a group-by over one day-level frame:
+
+    funcionario_id | data | status (P, FJ, FN, A, L)
+
+A day's status follows the same precedence as `/funcionarios/status`:
+licença over atestado over the presence record.
+
+Only the reads run on the event loop: the column arrays and every pandas
+step are built in a worker thread (`asyncio.to_thread`), so a year-long
+report does not stall the other requests of the worker.
+"""
+import asyncio
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import arquivamento
+from codec import bson_date, date_range
+
+PRESENTE, FALTA_JUSTIFICADA, FALTA_NAO_JUSTIFICADA, ATESTADO, LICENCA = "P", "FJ", "FN", "A", "L"
+STATUS = [PRESENTE, FALTA_JUSTIFICADA, FALTA_NAO_JUSTIFICADA, ATESTADO, LICENCA]
+# Higher wins when several sources cover the same day
+PRIORIDADE = {PRESENTE: 1, FALTA_JUSTIFICADA: 1, FALTA_NAO_JUSTIFICADA: 1, ATESTADO: 2, LICENCA: 3}
+DIMENSOES = {"cliente": "cliente_id", "posto": "posto_alocacao", "funcao": "funcao_id"}
+ONE_DAY = np.timedelta64(1, "D")
+
+
+async def drain(cursor) -> List[dict]:
+    """Documents of a projected cursor (or any async iterable of them)."""
+    return [documento async for documento in cursor]
+
+
+def columns(documentos: List[dict], fields: List[str]) -> Dict[str, np.ndarray]:
+    """One object array per field, built by pandas from the projected documents."""
+    frame = pd.DataFrame.from_records(documentos, columns=fields) if documentos else pd.DataFrame(columns=fields)
+    return {field: frame[field].to_numpy(dtype=object) for field in fields}
+
+
+def as_days(values) -> np.ndarray:
+    # BSON dates, or ISO strings on documents not yet migrated by codec.py
+    return pd.to_datetime(pd.Series(values, dtype="object").astype("string").str[:10]).to_numpy("datetime64[D]")
+
+
+def expand_intervals(funcionario_ids: np.ndarray, inicio: np.ndarray, fim: np.ndarray,
+                     periodo_inicio: np.datetime64, periodo_fim: np.datetime64) -> pd.DataFrame:
+    """One row per (funcionario_id, day) covered by inclusive [inicio, fim], clipped to the period."""
+    inicio = np.maximum(inicio, periodo_inicio)
+    fim = np.minimum(fim, periodo_fim)
+    dias = np.maximum((fim - inicio) // ONE_DAY + 1, 0).astype(np.int64)
+    linhas = np.repeat(np.arange(len(dias)), dias)
+    deslocamentos = np.arange(len(linhas)) - np.repeat(np.cumsum(dias) - dias, dias)
+    return pd.DataFrame({
+        "funcionario_id": funcionario_ids[linhas],
+        "data": inicio[linhas] + deslocamentos * ONE_DAY,
+    })
+
+
+async def load_records(db, data_inicio: date, data_fim: date, funcionario_ids: Optional[List[str]] = None):
+    """The period's presença records, atestados and licenças, narrowly projected."""
+    periodo = date_range(data_inicio, data_fim)
+    filtro = {"funcionario_id": {"$in": funcionario_ids}} if funcionario_ids is not None else {}
+    return await asyncio.gather(
+        drain(arquivamento.find(
+            db, "registros_presenca", {**filtro, "data": periodo},
+            {"_id": 0, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1}, data_inicio, data_fim,
+        )),
+        drain(arquivamento.find(
+            db, "atestados",
+            {**filtro, "data_retorno_prevista": {"$gt": bson_date(data_inicio)}, "data_emissao": {"$lte": bson_date(data_fim)}},
+            {"_id": 0, "funcionario_id": 1, "cid": 1, "data_emissao": 1, "data_retorno_prevista": 1, "dias_afastamento": 1},
+            data_inicio, data_fim,
+        )),
+        drain(arquivamento.find(
+            db, "licencas",
+            {**filtro, "data_fim": {"$gte": bson_date(data_inicio)}, "data_inicio": {"$lte": bson_date(data_fim)}},
+            {"_id": 0, "funcionario_id": 1, "data_inicio": 1, "data_fim": 1},
+            data_inicio, data_fim,
+        )),
+    )
+
+
+def build_days(registros: List[dict], atestados: List[dict], licencas: List[dict], data_inicio: date, data_fim: date):
+    """Day-level status frame and the period's atestados (for CID rankings)."""
+    inicio, fim = np.datetime64(data_inicio, "D"), np.datetime64(data_fim, "D")
+
+    registros = columns(registros, ["funcionario_id", "data", "presente", "tipo_falta"])
+    presente = registros["presente"].astype(bool)
+    justificada = registros["tipo_falta"] == "Justificada"
+    dias_registro = pd.DataFrame({
+        "funcionario_id": registros["funcionario_id"],
+        "data": as_days(registros["data"]),
+        "status": np.where(presente, PRESENTE, np.where(justificada, FALTA_JUSTIFICADA, FALTA_NAO_JUSTIFICADA)),
+    })
+
+    atestados = columns(atestados, ["funcionario_id", "cid", "data_emissao", "data_retorno_prevista", "dias_afastamento"])
+    emissao = as_days(atestados["data_emissao"])
+    retorno = as_days(atestados["data_retorno_prevista"])
+    afastamento = np.maximum(pd.to_numeric(pd.Series(atestados["dias_afastamento"], dtype="object"), errors="coerce").fillna(1).to_numpy(np.int64), 1)
+    # As rollups.atestado_days: away until the day before the return, else dias_afastamento
+    fim_atestado = np.where(
+        np.isnat(retorno) | (retorno - ONE_DAY < emissao),
+        emissao + (afastamento - 1) * ONE_DAY,
+        retorno - ONE_DAY,
+    )
+    dias_atestado = expand_intervals(atestados["funcionario_id"], emissao, fim_atestado, inicio, fim)
+    dias_atestado["status"] = ATESTADO
+
+    licencas = columns(licencas, ["funcionario_id", "data_inicio", "data_fim"])
+    dias_licenca = expand_intervals(
+        licencas["funcionario_id"], as_days(licencas["data_inicio"]), as_days(licencas["data_fim"]), inicio, fim,
+    )
+    dias_licenca["status"] = LICENCA
+
+    dias = pd.concat([dias_registro, dias_atestado, dias_licenca], ignore_index=True)
+    dias["prioridade"] = dias["status"].map(PRIORIDADE)
+    dias = (
+        dias.sort_values("prioridade", kind="stable")
+        .drop_duplicates(["funcionario_id", "data"], keep="last")
+        .drop(columns="prioridade")
+    )
+    dias["status"] = pd.Categorical(dias["status"], categories=STATUS)
+    cids = pd.DataFrame({"cid": atestados["cid"], "dias": afastamento})
+    return dias, cids
+
+
+def indicators(dias: pd.DataFrame, chave: str) -> pd.DataFrame:
+    """Counts, absenteeism rate and unjustified-absence streaks per `chave` value."""
+    contagem = pd.crosstab(dias[chave], dias["status"], dropna=False).reindex(columns=STATUS, fill_value=0)
+    resultado = pd.DataFrame({
+        "funcionarios": dias.groupby(chave, observed=True)["funcionario_id"].nunique(),
+        "dias": contagem.sum(axis=1),
+        "presentes": contagem[PRESENTE],
+        "faltas_justificadas": contagem[FALTA_JUSTIFICADA],
+        "faltas_nao_justificadas": contagem[FALTA_NAO_JUSTIFICADA],
+        "dias_atestado": contagem[ATESTADO],
+        "dias_licenca": contagem[LICENCA],
+    }).fillna(0)
+    # Licença days are planned leave, not absenteeism: out of both sides of the ratio
+    ausencias = resultado["faltas_justificadas"] + resultado["faltas_nao_justificadas"] + resultado["dias_atestado"]
+    base = resultado["dias"] - resultado["dias_licenca"]
+    resultado["taxa_absenteismo"] = np.where(base > 0, ausencias / base.where(base > 0, 1), 0.0).round(4)
+
+    # Streaks: consecutive FN days of one funcionario share an id via cumsum over breaks
+    faltas = dias.loc[dias["status"] == FALTA_NAO_JUSTIFICADA, ["funcionario_id", "data", chave]]
+    faltas = faltas.sort_values(["funcionario_id", "data"])
+    quebra = (faltas["funcionario_id"] != faltas["funcionario_id"].shift()) | (faltas["data"].diff() != pd.Timedelta(days=1))
+    faltas = faltas.assign(sequencia=quebra.cumsum())
+    sequencias = faltas.groupby("sequencia").agg(grupo=(chave, "first"), dias=("data", "size"))
+    por_grupo = sequencias.groupby("grupo").agg(
+        max_sequencia_faltas=("dias", "max"),
+        sequencias_faltas=("dias", lambda tamanhos: int((tamanhos >= 2).sum())),
+    )
+    resultado = resultado.join(por_grupo).fillna({"max_sequencia_faltas": 0, "sequencias_faltas": 0})
+    resultado.index.name = "grupo"
+    return resultado.sort_values("taxa_absenteismo", ascending=False).reset_index()
+
+
+def top_cids(cids: pd.DataFrame, limite: int = 10) -> pd.DataFrame:
+    cids = cids.assign(cid=cids["cid"].astype("string").str.strip().str.upper())
+    return (
+        cids.groupby("cid")
+        .agg(atestados=("cid", "size"), dias=("dias", "sum"))
+        .sort_values(["atestados", "dias"], ascending=False)
+        .head(limite)
+        .reset_index()
+    )
+
+
+def records(frame: pd.DataFrame) -> List[dict]:
+    """Plain Python values, ready for pydantic/JSON."""
+    return [
+        {key: (value.item() if isinstance(value, np.generic) else value) for key, value in row.items()}
+        for row in frame.to_dict("records")
+    ]
+
+
+async def absenteeism(db, data_inicio: date, data_fim: date, cliente_id: Optional[str] = None, limite_cids: int = 10) -> dict:
+    funcionarios_query = {"cliente_id": cliente_id} if cliente_id else {}
+    funcionarios = await drain(db.funcionarios.find(
+        funcionarios_query, {"_id": 0, "id": 1, "cliente_id": 1, "posto_alocacao": 1, "funcao_id": 1},
+    ))
+    funcionario_ids = [funcionario["id"] for funcionario in funcionarios] if cliente_id else None
+    registros, atestados, licencas = await load_records(db, data_inicio, data_fim, funcionario_ids)
+    return await asyncio.to_thread(
+        report, funcionarios, registros, atestados, licencas, data_inicio, data_fim, cliente_id, limite_cids,
+    )
+
+
+def report(funcionarios: List[dict], registros: List[dict], atestados: List[dict], licencas: List[dict],
+           data_inicio: date, data_fim: date, cliente_id: Optional[str], limite_cids: int) -> dict:
+    alocacoes = pd.DataFrame(columns(funcionarios, ["id", "cliente_id", "posto_alocacao", "funcao_id"])).set_index("id")
+    dias, cids = build_days(registros, atestados, licencas, data_inicio, data_fim)
+    dias = dias.join(alocacoes, on="funcionario_id", how="inner")
+    for coluna in DIMENSOES.values():
+        dias[coluna] = dias[coluna].fillna("").astype("category")
+
+    totais = indicators(dias.assign(total="total"), "total")
+    return {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "cliente_id": cliente_id,
+        "totais": records(totais.drop(columns="grupo"))[0] if len(totais) else None,
+        **{f"por_{nome}": records(indicators(dias, coluna)) for nome, coluna in DIMENSOES.items()},
+        "top_cids": records(top_cids(cids, limite_cids)),
+    }
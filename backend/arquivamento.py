@@ -0,0 +1,273 @@
+"""Hot/cold archival of closed months of presença, atestados and licenças.
+
+Records of months older than ARQUIVO_MESES_QUENTES are moved from the hot
+collections into one zstd-compressed archive collection per collection and
+year (`arquivo_registros_presenca_2023`, ...), so the hot collections and
+their indexes stay small. `rollups_presenca`, the daily summary behind the
+reports, is never archived.
+
+`arquivo_catalogo` holds one document per archived collection:
+
+    {"_id": "registros_presenca", "arquivado_ate": 2024-01-01, "anos": [2022, 2023]}
+
+Everything dated before `arquivado_ate` may live in the archive tier.
+Read paths call `tiers()` with the start of the range they need and only
+touch archive collections when it reaches back that far. Write paths
+check `arquivado_ate` through `catalog_cache`, a TTLCache that `archive`
+invalidates when it advances the catalog: at once in every worker when
+CACHE_URL is shared, otherwise within ARQUIVO_CATALOG_CACHE_TTL seconds. The catalog is
+advanced before documents move, and each batch is copied before it is
+deleted, so a reader sees every record in at least one tier at all times
+(`merge_sorted` and `paginate` drop the rare duplicate by id).
+
+    python arquivamento.py arquivar [--meses-quentes 13]
+    python arquivamento.py status
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional
+
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+
+from cache import TTLCache, backend_from_url
+from codec import as_date, bson_date
+from indexes import PAGE_ORDER, ensure_collections
+
+logger = logging.getLogger(__name__)
+
+CATALOG = "arquivo_catalogo"
+ARQUIVO_MESES_QUENTES = int(os.environ.get("ARQUIVO_MESES_QUENTES", "13"))
+MOVE_BATCH_SIZE = 1000
+ARQUIVO_CATALOG_CACHE_TTL = float(os.environ.get("ARQUIVO_CATALOG_CACHE_TTL", "60"))
+ARCHIVE_OPTIONS = {"storageEngine": {"wiredTiger": {"configString": "block_compressor=zstd"}}}
+
+# collection -> (field that dates and partitions a record, (end field, operator) that makes it closed)
+ARCHIVED = {
+    "registros_presenca": ("data", None),
+    # The return day is a working day, as in server.atestado_overlap
+    "atestados": ("data_emissao", ("data_retorno_prevista", "$lte")),
+    "licencas": ("data_inicio", ("data_fim", "$lt")),
+}
+
+
+def archive_name(colecao: str, ano: int) -> str:
+    return f"arquivo_{colecao}_{ano}"
+
+
+def archive_indexes(colecao: str) -> List[IndexModel]:
+    campo = ARCHIVED[colecao][0]
+    return [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        IndexModel([("funcionario_id", ASCENDING), (campo, ASCENDING)], name=f"funcionario_id_{campo}"),
+        IndexModel([(campo, ASCENDING)], name=campo),
+    ]
+
+
+def cutoff(hoje: date, meses_quentes: int = ARQUIVO_MESES_QUENTES) -> date:
+    """First day of the oldest month kept hot."""
+    meses = hoje.year * 12 + hoje.month - 1 - meses_quentes
+    return date(meses // 12, meses % 12 + 1, 1)
+
+
+def catalog_cache(backend) -> TTLCache:
+    return TTLCache(backend, CATALOG, ttl=ARQUIVO_CATALOG_CACHE_TTL)
+
+
+async def archived_until(db, colecao: str, cache: Optional[TTLCache] = None) -> Optional[date]:
+    """Records dated before this may be archived; None if nothing ever was."""
+    async def load():
+        entrada = await db[CATALOG].find_one({"_id": colecao}, {"arquivado_ate": 1})
+        return as_date(entrada["arquivado_ate"]).isoformat() if entrada else None
+
+    valor = await cache.get_or_load(colecao, load) if cache else await load()
+    return date.fromisoformat(valor) if valor else None
+
+
+async def tiers(db, colecao: str, desde: Optional[date] = None, ate: Optional[date] = None) -> list:
+    """Collections holding `colecao` records dated in [desde, ate].
+
+    Always the hot collection; archive years only when `desde` (None: all
+    history) is before `arquivado_ate`. One year of slack on the left keeps
+    atestados and licenças that started earlier but reach into the range.
+    """
+    colecoes = [db[colecao]]
+    entrada = await db[CATALOG].find_one({"_id": colecao})
+    if not entrada or (desde and desde >= as_date(entrada["arquivado_ate"])):
+        return colecoes
+    for ano in sorted(entrada.get("anos", [])):
+        if (desde is None or ano >= desde.year - 1) and (ate is None or ano <= ate.year):
+            colecoes.append(db[archive_name(colecao, ano)])
+    return colecoes
+
+
+async def merge_sorted(cursors, sort: List[tuple]):
+    """Merge cursors sorted ascending on the same `sort` keys, dropping repeated ids."""
+    campos = [campo for campo, _ in sort]
+    iterators = [cursor.__aiter__() for cursor in cursors]
+    heap = []
+
+    async def push(posicao):
+        documento = await anext(iterators[posicao], None)
+        if documento is not None:
+            heapq.heappush(heap, (tuple(documento.get(campo) for campo in campos), posicao, documento))
+
+    for posicao in range(len(iterators)):
+        await push(posicao)
+    vistos = set()
+    while heap:
+        _, posicao, documento = heapq.heappop(heap)
+        await push(posicao)
+        if "id" in documento:
+            if documento["id"] in vistos:
+                continue
+            vistos.add(documento["id"])
+        yield documento
+
+
+async def find(db, colecao: str, query: dict, projection: dict, desde: Optional[date] = None,
+               ate: Optional[date] = None, sort: Optional[List[tuple]] = None, **kwargs):
+    """`find` over the tiers needed for [desde, ate]; merged in order when `sort` is given."""
+    colecoes = await tiers(db, colecao, desde, ate)
+    cursors = [
+        colecao_tier.find(query, projection, **kwargs).sort(sort) if sort else colecao_tier.find(query, projection, **kwargs)
+        for colecao_tier in colecoes
+    ]
+    if len(cursors) == 1:
+        async for documento in cursors[0]:
+            yield documento
+    elif sort:
+        async for documento in merge_sorted(cursors, sort):
+            yield documento
+    else:
+        for cursor in cursors:
+            async for documento in cursor:
+                yield documento
+
+
+async def distinct(db, colecao: str, campo: str, query: dict, desde: Optional[date] = None,
+                   ate: Optional[date] = None) -> set:
+    colecoes = await tiers(db, colecao, desde, ate)
+    valores = await asyncio.gather(*(colecao_tier.distinct(campo, query) for colecao_tier in colecoes))
+    return set().union(*valores)
+
+
+async def _move(db, colecao: str, limite: date, batch_size: int) -> dict:
+    """Copy then delete, batch by batch, every closed record dated before `limite`."""
+    campo, fim = ARCHIVED[colecao]
+    fechado = {campo: {"$lt": bson_date(limite)}}
+    if fim:
+        # Still running at the cutoff: stays hot until it ends
+        campo_fim, operador = fim
+        fechado[campo_fim] = {operador: bson_date(limite)}
+    por_ano = {}
+    while True:
+        batch = await db[colecao].find(fechado, {"_id": 0}).sort([(campo, 1), ("id", 1)]).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return por_ano
+        grupos = {}
+        for documento in batch:
+            grupos.setdefault(as_date(documento[campo]).year, []).append(documento)
+        for ano, documentos in grupos.items():
+            destino = db[archive_name(colecao, ano)]
+            await destino.bulk_write([ReplaceOne({"id": documento["id"]}, documento, upsert=True) for documento in documentos], ordered=False)
+            por_ano[ano] = por_ano.get(ano, 0) + len(documentos)
+        await db[colecao].delete_many({"id": {"$in": [documento["id"] for documento in batch]}})
+
+
+async def archive(db, hoje: Optional[date] = None, meses_quentes: int = ARQUIVO_MESES_QUENTES,
+                  batch_size: int = MOVE_BATCH_SIZE, cache: Optional[TTLCache] = None) -> dict:
+    """Move every closed month older than `meses_quentes` to the archive tier.
+
+    Idempotent and resumable: re-running after a crash finishes the move.
+    Returns the documents moved per collection and year.
+    """
+    limite = cutoff(hoje or date.today(), meses_quentes)
+    resultado = {}
+    for colecao, (campo, _) in ARCHIVED.items():
+        primeiro = await db[colecao].find_one({campo: {"$lt": bson_date(limite)}}, {"_id": 0, campo: 1}, sort=[(campo, 1)])
+        if primeiro is None:
+            resultado[colecao] = {}
+            continue
+        anos = list(range(as_date(primeiro[campo]).year, limite.year + 1))
+        nomes = [archive_name(colecao, ano) for ano in anos]
+        await ensure_collections(db, {nome: ARCHIVE_OPTIONS for nome in nomes})
+        for nome in nomes:
+            await db[nome].create_indexes(archive_indexes(colecao))
+        # Readers must find the archive years before any document moves there
+        anterior = await archived_until(db, colecao)
+        await db[CATALOG].update_one(
+            {"_id": colecao},
+            {"$set": {"arquivado_ate": bson_date(max(limite, anterior or limite)), "atualizado_em": datetime.utcnow()},
+             "$addToSet": {"anos": {"$each": anos}}},
+            upsert=True,
+        )
+        if cache:
+            await cache.invalidate()
+        movidos = await _move(db, colecao, limite, batch_size)
+        resultado[colecao] = movidos
+        if movidos:
+            await db[CATALOG].update_one({"_id": colecao}, {"$inc": {f"documentos.{ano}": total for ano, total in movidos.items()}})
+        logger.info("Arquivados de %s antes de %s: %d documentos", colecao, limite.isoformat(), sum(movidos.values()))
+    return resultado
+
+
+async def status(db) -> dict:
+    """Catalog plus how much is still hot, per archived collection."""
+    resultado = {}
+    for colecao in ARCHIVED:
+        entrada = await db[CATALOG].find_one({"_id": colecao}, {"_id": 0}) or {}
+        resultado[colecao] = {
+            "arquivado_ate": as_date(entrada.get("arquivado_ate")),
+            "documentos_arquivados": entrada.get("documentos", {}),
+            "documentos_quentes": await db[colecao].estimated_document_count(),
+        }
+    return resultado
+
+
+if __name__ == "__main__":
+    import json
+
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    def _run(action):
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await action(client[os.environ['DB_NAME']])
+            finally:
+                client.close()
+
+        report = asyncio.run(run())
+        typer.echo(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+        return report
+
+    @cli.command()
+    def arquivar(meses_quentes: int = ARQUIVO_MESES_QUENTES, batch_size: int = MOVE_BATCH_SIZE):
+        """Move closed months older than --meses-quentes to the archive collections."""
+        async def run(db):
+            # Tells the servers sharing CACHE_URL about the new arquivado_ate
+            backend = backend_from_url(os.environ.get('CACHE_URL'))
+            try:
+                return await archive(db, meses_quentes=meses_quentes, batch_size=batch_size, cache=catalog_cache(backend))
+            finally:
+                await backend.close()
+
+        _run(run)
+
+    @cli.command("status")
+    def status_command():
+        """Show what is archived and what is still hot."""
+        _run(status)
+
+    cli()
@@ -0,0 +1,115 @@
+"""Requests/sec of GET /api/funcionarios: legacy read path vs. the fast path.
+
+The legacy route is the pre-optimization handler (`Model(**doc)` for every
+document, then FastAPI validating the list again against `response_model`),
+mounted on a scratch app next to the real one. It issues the same sorted
+query as the paginated route, so only the read path differs. A DB-free
+measurement of encoding one page is printed as well, since mongomock's
+pure-Python query engine can dominate the end-to-end numbers.
+
+    python bench_funcionarios.py --funcionarios 1000 --segundos 10
+    python bench_funcionarios.py --mock      # mongomock-motor instead of MONGO_URL
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import List
+
+import httpx
+import orjson
+from fastapi import FastAPI
+from pydantic import TypeAdapter
+
+import codec
+import server
+from loadtest import funcionario_sintetico
+from server import Funcionario
+
+
+def legacy_app(db) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/funcionarios", response_model=List[Funcionario])
+    async def get_funcionarios():
+        cursor = db.funcionarios.find().sort([("created_at", 1), ("id", 1)]).limit(1000)
+        funcionarios = await cursor.to_list(1000)
+        return [Funcionario(**funcionario) for funcionario in funcionarios]
+
+    return app
+
+
+async def requests_per_second(app, path: str, segundos: float, concorrencia: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get(path)).raise_for_status()  # warm-up
+        fim = time.perf_counter() + segundos
+        total = 0
+
+        async def worker():
+            nonlocal total
+            while time.perf_counter() < fim:
+                (await client.get(path)).raise_for_status()
+                total += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concorrencia)))
+        return total / (time.perf_counter() - inicio)
+
+
+def pages_per_second(encode, documentos: List[dict], repeticoes: int = 20) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        encode(documentos)
+    return repeticoes / (time.perf_counter() - inicio)
+
+
+def encode_legacy(documentos: List[dict]) -> bytes:
+    adapter = TypeAdapter(List[Funcionario])
+    funcionarios = [Funcionario(**documento) for documento in documentos]
+    return adapter.dump_json(adapter.validate_python([f.model_dump() for f in funcionarios]))
+
+
+def encode_fast(documentos: List[dict]) -> bytes:
+    defaults = server.stored_defaults(Funcionario)
+    return orjson.dumps([{**defaults, **codec.decode("funcionarios", dict(documento))} for documento in documentos])
+
+
+async def main(args):
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient()["bench"]
+    else:
+        db = server.client[os.environ.get("BENCH_DB_NAME", "bench_funcionarios")]
+    server.db = db
+
+    await db.funcionarios.delete_many({})
+    await db.funcionarios.insert_many([funcionario_sintetico(numero) for numero in range(args.funcionarios)])
+
+    pagina = [funcionario_sintetico(numero) for numero in range(min(args.funcionarios, server.MAX_PAGE_SIZE))]
+    legado = pages_per_second(encode_legacy, pagina)
+    rapido = pages_per_second(encode_fast, pagina)
+    print(f"Codificação de uma página de {len(pagina)} funcionários (sem banco)")
+    print(f"  legado: {legado:8.1f} páginas/s")
+    print(f"  rápido: {rapido:8.1f} páginas/s")
+    print(f"  ganho: {rapido / legado:.1f}x")
+
+    path = f"/api/funcionarios?limit={min(args.funcionarios, server.MAX_PAGE_SIZE)}"
+    legado = await requests_per_second(legacy_app(db), "/api/funcionarios", args.segundos, args.concorrencia)
+    rapido = await requests_per_second(server.app, path, args.segundos, args.concorrencia)
+    print(f"GET /api/funcionarios com {args.funcionarios} funcionários, concorrência {args.concorrencia}")
+    print(f"  legado (Model(**doc) + response_model): {legado:8.1f} req/s")
+    print(f"  rápido (projeção + orjson):             {rapido:8.1f} req/s")
+    print(f"  ganho: {rapido / legado:.1f}x")
+
+    if not args.mock:
+        await db.funcionarios.drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--funcionarios", type=int, default=1000)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--mock", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,252 @@
+"""Cache and coordination backends shared by the server's workers.
+
+`CACHE_URL` selects the backend:
+
+    memory://                  per-process dicts (default, single worker)
+    redis://host:6379/0        any Redis-compatible server, shared by all workers
+
+`TTLCache` stores JSON-encodable values under a generation counter kept in
+the backend, so an invalidation in one worker is seen by all of them.
+`LRUCache` keeps serialized response bodies in each worker, and
+`LeaderElection` holds a renewable lease so cluster-wide jobs (index
+bootstrap, scheduled maintenance) run in exactly one worker.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Process-local backend; every worker has its own copy.
+
+    Expired entries are dropped when read, and by a sweep that `set()`
+    runs at most every SWEEP_INTERVAL seconds: TTLCache writes each
+    generation under new keys, so old ones are never read again.
+    """
+    SWEEP_INTERVAL = 1.0
+
+    def __init__(self):
+        self._values = {}
+        self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+
+    def _sweep(self):
+        agora = time.monotonic()
+        self._next_sweep = agora + self.SWEEP_INTERVAL
+        expirados = [key for key, (expires, _) in self._values.items() if expires is not None and expires <= agora]
+        for key in expirados:
+            del self._values[key]
+
+    def _live(self, key):
+        entry = self._values.get(key)
+        if entry and (entry[0] is None or entry[0] > time.monotonic()):
+            return entry
+        self._values.pop(key, None)
+        return None
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False):
+        if nx and self._live(key):
+            return
+        if time.monotonic() >= self._next_sweep:
+            self._sweep()
+        self._values[key] = (time.monotonic() + ttl if ttl else None, value)
+
+    async def incr(self, key: str) -> int:
+        entry = self._live(key)
+        value = int(entry[1]) + 1 if entry else 1
+        self._values[key] = (None, str(value))
+        return value
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease `key` for `owner`; False if someone else holds it."""
+        entry = self._live(key)
+        if entry and entry[1] != owner:
+            return False
+        self._values[key] = (time.monotonic() + ttl, owner)
+        return True
+
+    async def release(self, key: str, owner: str):
+        entry = self._live(key)
+        if entry and entry[1] == owner:
+            del self._values[key]
+
+    async def close(self):
+        self._values.clear()
+
+
+# Renew/release only if the lease is still ours (atomic on the server)
+_ACQUIRE_SCRIPT = """
+local atual = redis.call('GET', KEYS[1])
+if atual == false or atual == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend:
+    """Backend on a Redis-compatible server (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str, prefix: str = "leme:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False):
+        await self.redis.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None, nx=nx)
+
+    async def incr(self, key: str) -> int:
+        return await self.redis.incr(self.prefix + key)
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self._acquire(keys=[self.prefix + key], args=[owner, int(ttl * 1000)]))
+
+    async def release(self, key: str, owner: str):
+        await self._release(keys=[self.prefix + key], args=[owner])
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def backend_from_url(url: Optional[str]):
+    if not url or url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    raise ValueError(f"CACHE_URL não suportada: {url}")
+
+
+class TTLCache:
+    """Cache with per-entry expiry on a shared backend.
+
+    Values round-trip through JSON, so loaders must return JSON-encodable
+    data. Concurrent misses for the same key within a worker share one load,
+    and `invalidate()` bumps the generation so every worker stops serving
+    entries (and discards loads) from before the write.
+    """
+    def __init__(self, backend, namespace: str, ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self._inflight = {}
+
+    async def _generation(self) -> str:
+        return await self.backend.get(f"{self.namespace}:generation") or "0"
+
+    async def get_or_load(self, key, loader):
+        generation = await self._generation()
+        stored = await self.backend.get(f"{self.namespace}:{generation}:{key}")
+        if stored is not None:
+            return json.loads(stored)
+        inflight_key = (generation, key)
+        if inflight_key not in self._inflight:
+            self._inflight[inflight_key] = asyncio.ensure_future(self._load(generation, key, loader))
+        return await asyncio.shield(self._inflight[inflight_key])
+
+    async def _load(self, generation, key, loader):
+        try:
+            value = await loader()
+            if generation == await self._generation():
+                await self.backend.set(f"{self.namespace}:{generation}:{key}", json.dumps(value), self.ttl)
+        finally:
+            self._inflight.pop((generation, key), None)
+        return value
+
+    async def invalidate(self):
+        await self.backend.incr(f"{self.namespace}:generation")
+        self._inflight.clear()
+
+
+class LRUCache:
+    """Small per-process LRU for values that are expensive to rebuild."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+
+    def get(self, key):
+        value = self._values.get(key)
+        if value is not None:
+            self._values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._values[key] = value
+        self._values.move_to_end(key)
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+
+
+class LeaderElection:
+    """Renewable lease: at most one worker in the cluster is leader at a time.
+
+    `start()` tries to take the lease once and then keeps renewing (or
+    retrying) it every `ttl / 3` seconds in the background. A leader that
+    dies is replaced after `ttl` seconds.
+    """
+    def __init__(self, backend, name: str = "leader", ttl: float = 30):
+        self.backend = backend
+        self.key = f"lock:{name}"
+        self.ttl = ttl
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._expires = 0.0
+        self._task = None
+
+    @property
+    def is_leader(self) -> bool:
+        # A stalled worker stops claiming leadership once its lease lapses
+        return self._expires > time.monotonic()
+
+    async def _campaign(self):
+        era_lider = self.is_leader
+        renovado = time.monotonic()
+        try:
+            leader = await self.backend.acquire(self.key, self.owner, self.ttl)
+        except Exception:
+            logger.exception("Falha ao renovar a liderança")
+            leader = False
+        self._expires = renovado + self.ttl if leader else 0.0
+        if leader != era_lider:
+            logger.info("Worker %s %s a liderança", self.owner, "assumiu" if leader else "perdeu")
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._campaign()
+
+    async def start(self) -> bool:
+        await self._campaign()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._renew())
+        return self.is_leader
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            self._expires = 0.0
+            await self.backend.release(self.key, self.owner)
@@ -0,0 +1,228 @@
+"""Date codec between the API models and MongoDB.
+
+Calendar dates (`data`, `data_admissao`, ...) are stored as BSON dates at
+midnight UTC, the same type as `created_at`, so range filters, `$group`
+by month and index keys compare natively:
+
+    encode(documento)            # date -> datetime, before every write
+    decode(colecao, documento)   # datetime -> date on DATE_FIELDS, after raw reads
+    bson_date(dia)               # a date as a query bound or key
+
+Documents written before this layer hold ISO strings (`"2024-05-01"`);
+convert them while the API keeps serving with:
+
+    python codec.py migrate [--colecao registros_presenca] [--batch-size 1000]
+"""
+import asyncio
+import copy
+import logging
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Calendar-date fields per collection; "a.b" is field b of the objects in array a
+DATE_FIELDS = {
+    "funcionarios": ("data_emissao_rg", "data_emissao_ctps", "data_admissao"),
+    "registros_presenca": ("data",),
+    "atestados": ("data_emissao", "data_retorno_prevista"),
+    "licencas": ("data_inicio", "data_fim"),
+    "rollups_presenca": ("data",),
+    "folhas_ponto": ("dias.data",),
+    "jornadas_ponto": ("data",),
+}
+MIGRATION_BATCH_SIZE = 1000
+
+
+def bson_date(value: date) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def as_date(value) -> Optional[date]:
+    """Stored value (BSON date, legacy ISO string or date) -> date."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def date_range(inicio: Optional[date] = None, fim: Optional[date] = None) -> dict:
+    """Inclusive `$gte`/`$lte` filter; an open end is left out."""
+    periodo = {}
+    if inicio:
+        periodo["$gte"] = bson_date(inicio)
+    if fim:
+        periodo["$lte"] = bson_date(fim)
+    return periodo
+
+
+def same_day(value: date) -> dict:
+    """Equality on a date field that also matches a not-yet-migrated ISO string."""
+    return {"$in": [bson_date(value), value.isoformat()]}
+
+
+def encode(value):
+    """Model dump -> BSON: every `date` (but not datetime) becomes midnight UTC."""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return bson_date(value)
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    return value
+
+
+def _decode_path(documento: dict, partes):
+    if partes[0] not in documento:
+        return
+    if len(partes) == 1:
+        documento[partes[0]] = as_date(documento[partes[0]])
+        return
+    for item in documento[partes[0]] or []:
+        if isinstance(item, dict):
+            _decode_path(item, partes[1:])
+
+
+def decode(colecao: str, documento: dict) -> dict:
+    """Turn the stored date fields of `colecao` back into dates, in place."""
+    for campo in DATE_FIELDS.get(colecao, ()):
+        _decode_path(documento, campo.split("."))
+    return documento
+
+
+def _pending_filter(colecao: str) -> dict:
+    # For array paths $type matches when any element is still a string
+    return {"$or": [{campo: {"$type": "string"}} for campo in DATE_FIELDS[colecao]]}
+
+
+async def _migrate_documents(db, colecao: str, batch_size: int) -> int:
+    """Rewrite the date fields of documents still holding strings.
+
+    Each update is guarded by the values it read, so a document changed
+    concurrently by the API is left alone (and already carries dates).
+    """
+    raizes = sorted({campo.split(".")[0] for campo in DATE_FIELDS[colecao]})
+    projection = {"_id": 1, **{raiz: 1 for raiz in raizes}}
+    convertidos = 0
+    operations = []
+    async for documento in db[colecao].find(_pending_filter(colecao), projection).sort([("_id", 1)]):
+        originais = {raiz: documento[raiz] for raiz in raizes if raiz in documento}
+        convertido = decode(colecao, copy.deepcopy(documento))
+        operations.append(UpdateOne(
+            {"_id": documento["_id"], **originais},
+            {"$set": {raiz: encode(convertido[raiz]) for raiz in originais}},
+        ))
+        if len(operations) >= batch_size:
+            convertidos += (await db[colecao].bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        convertidos += (await db[colecao].bulk_write(operations, ordered=False)).modified_count
+    return convertidos
+
+
+async def _migrate_rollups(db, colecao: str, batch_size: int) -> int:
+    """Fold each string-keyed rollup into its date-keyed twin.
+
+    The API may already have created the twin (the rollups are unique on
+    cliente/data/posto), so counters are added with `$inc` instead of
+    rewriting the key in place.
+    """
+    from rollups import COUNTERS
+
+    convertidos = 0
+    operations, ids = [], []
+
+    async def flush():
+        await db[colecao].bulk_write(operations, ordered=False)
+        await db[colecao].delete_many({"_id": {"$in": ids}})
+        return len(ids)
+
+    async for rollup in db[colecao].find({"data": {"$type": "string"}}).sort([("_id", 1)]):
+        operations.append(UpdateOne(
+            {"cliente_id": rollup.get("cliente_id"), "posto_alocacao": rollup.get("posto_alocacao"),
+             "data": bson_date(as_date(rollup["data"]))},
+            {"$inc": {counter: rollup.get(counter, 0) for counter in COUNTERS}},
+            upsert=True,
+        ))
+        ids.append(rollup["_id"])
+        if len(operations) >= batch_size:
+            convertidos += await flush()
+            operations, ids = [], []
+    if operations:
+        convertidos += await flush()
+    return convertidos
+
+
+async def migrate(db, colecoes=None, batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """Convert legacy ISO-string dates to BSON dates; returns documents converted per collection.
+
+    Safe to run while the API serves and to re-run: only documents that
+    still hold strings are touched.
+    """
+    resultado = {}
+    for colecao in colecoes or DATE_FIELDS:
+        if colecao == "rollups_presenca":
+            resultado[colecao] = await _migrate_rollups(db, colecao, batch_size)
+        else:
+            resultado[colecao] = await _migrate_documents(db, colecao, batch_size)
+        logger.info("Datas migradas em %s: %d documentos", colecao, resultado[colecao])
+    return resultado
+
+
+async def pending(db) -> dict:
+    """Documents per collection still holding string dates."""
+    return {colecao: await db[colecao].count_documents(_pending_filter(colecao)) for colecao in DATE_FIELDS}
+
+
+if __name__ == "__main__":
+    import json
+
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    def _run(action):
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await action(client[os.environ['DB_NAME']])
+            finally:
+                client.close()
+
+        report = asyncio.run(run())
+        typer.echo(json.dumps(report, indent=2, ensure_ascii=False))
+        return report
+
+    @cli.command("migrate")
+    def migrate_command(colecao: List[str] = typer.Option(None), batch_size: int = MIGRATION_BATCH_SIZE):
+        """Convert ISO-string dates to BSON dates (all collections, or each --colecao)."""
+        desconhecidas = [nome for nome in colecao or [] if nome not in DATE_FIELDS]
+        if desconhecidas:
+            raise typer.BadParameter(f"Coleções sem datas: {', '.join(desconhecidas)}")
+        _run(lambda db: migrate(db, colecao or None, batch_size))
+
+    @cli.command()
+    def check():
+        """Report documents still holding string dates; exits 1 if any remain."""
+        report = _run(pending)
+        if any(report.values()):
+            raise typer.Exit(code=1)
+
+    @cli.callback()
+    def main():
+        """BSON date migration."""
+
+    cli()
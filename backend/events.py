@@ -0,0 +1,156 @@
+"""Change feed: an in-process event bus and its optional Mongo change-stream source.
+
+The create handlers in server.py publish to `EventBus`; `GET /api/eventos`
+streams the bus to browsers as server-sent events. When MongoDB runs as a
+replica set, `relay_change_stream` publishes inserts/updates from every
+worker (and from scripts writing straight to Mongo) instead, so each worker's
+bus sees the whole cluster.
+
+Events are dicts with a `tipo`:
+
+    {"tipo": "criado", "colecao": "empresas", "documento": {...}}
+    {"tipo": "atualizado", "colecao": "registros_presenca", "documento": {...}}
+    {"tipo": "lote", "colecao": "registros_presenca", "criados": 10, "atualizados": 2}
+    {"tipo": "dashboard", "dados": {...}}
+    {"tipo": "ressincronizar"}        # events were lost; refetch everything
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import Iterable, Optional
+
+import orjson
+
+from codec import decode
+from search import SEARCH_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class EventBus:
+    """Fan-out to subscriber queues, with a short replay buffer for reconnects.
+
+    A subscriber too slow to keep up is not allowed to block publishers: its
+    queue is cleared and it is told to resynchronize.
+    """
+    def __init__(self, queue_size: int = 1000, replay_size: int = 1000):
+        self.queue_size = queue_size
+        self.instance = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: dict):
+        self._sequence += 1
+        item = (f"{self.instance}-{self._sequence}", event)
+        self._replay.append(item)
+        for subscription in self._subscribers:
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """Register a subscriber, replaying what it missed since `last_event_id`.
+
+        Ids from another worker or older than the replay buffer trigger a
+        `ressincronizar` event instead.
+        """
+        subscription = Subscription(self.queue_size)
+        if last_event_id:
+            instance, _, sequence = last_event_id.partition("-")
+            oldest = int(self._replay[0][0].partition("-")[2]) if self._replay else self._sequence + 1
+            if instance != self.instance or not sequence.isdigit() or int(sequence) + 1 < oldest:
+                subscription.queue.put_nowait((None, {"tipo": "ressincronizar"}))
+            else:
+                for item in self._replay:
+                    if int(item[0].partition("-")[2]) > int(sequence):
+                        subscription.queue.put_nowait(item)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+
+def format_sse(event_id: Optional[str], event: dict) -> bytes:
+    linhas = [f"event: {event['tipo']}".encode()]
+    if event_id:
+        linhas.append(f"id: {event_id}".encode())
+    linhas.append(b"data: " + orjson.dumps(event))
+    return b"\n".join(linhas) + b"\n\n"
+
+
+async def stream_events(bus: EventBus, request, last_event_id: Optional[str] = None, keepalive: float = 15):
+    """SSE body for one client; ends when the client disconnects."""
+    subscription = bus.subscribe(last_event_id)
+    try:
+        yield b"retry: 3000\n\n"
+        while not await request.is_disconnected():
+            if subscription.overflowed:
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                yield format_sse(None, {"tipo": "ressincronizar"})
+                continue
+            try:
+                event_id, event = await asyncio.wait_for(subscription.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield format_sse(event_id, event)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+async def change_streams_available(db) -> bool:
+    """Change streams need a replica set (or sharded cluster)."""
+    hello = await db.client.admin.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
+async def relay_change_stream(db, bus: EventBus, collections: Iterable[str], retry: float = 5):
+    """Publish inserts/updates on `collections` to `bus` until cancelled.
+
+    Resumes from the last seen token after transient errors.
+    """
+    pipeline = [{"$match": {
+        "operationType": {"$in": ["insert", "update", "replace"]},
+        "ns.coll": {"$in": list(collections)},
+    }}]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                logger.info("Change stream ativo em %s", ", ".join(collections))
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    documento = change.get("fullDocument")
+                    if documento is None:
+                        continue
+                    for field in ("_id", *SEARCH_FIELDS):
+                        documento.pop(field, None)
+                    bus.publish({
+                        "tipo": "criado" if change["operationType"] == "insert" else "atualizado",
+                        "colecao": change["ns"]["coll"],
+                        "documento": decode(change["ns"]["coll"], documento),
+                    })
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Change stream interrompido; reconectando em %.0fs", retry)
+            bus.publish({"tipo": "ressincronizar"})
+            await asyncio.sleep(retry)
@@ -0,0 +1,267 @@
+"""Monthly timesheet (folha de ponto) engine.
+
+For one month, `registros_presenca`, `atestados` and `licencas` are each
+read once, sorted by funcionario_id, and merge-joined with the funcionarios
+(sorted by id) in a single pass. Resolving days and totals is pure Python
+and runs per cliente in a process pool, which the server creates once at
+startup and shuts down off the event loop. Results go to `folhas_ponto`, one
+document per funcionario and month, replacing the previous run:
+
+    python folha.py gerar 2024 5
+"""
+import asyncio
+import calendar
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+
+import arquivamento
+from codec import as_date, date_range, encode
+from rollups import atestado_days, days_between, licenca_days, presenca_counter
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "folhas_ponto"
+WRITE_BATCH_SIZE = 1000
+FOLHA_WORKERS = int(os.environ.get("FOLHA_WORKERS", "0")) or os.cpu_count() or 1
+# Below this many funcionarios, spawning pool workers costs more than it saves
+FOLHA_POOL_MIN = int(os.environ.get("FOLHA_POOL_MIN", "2000"))
+
+# Values of server.StatusDia; kept as strings so pool workers never import server
+PRESENTE = "Presente"
+FALTA_JUSTIFICADA = "Falta Justificada"
+FALTA_NAO_JUSTIFICADA = "Falta Não Justificada"
+ATESTADO = "Atestado"
+LICENCA = "Licença"
+SEM_REGISTRO = "Sem Registro"
+
+# Long-lived pool of the server process, see start_pool/stop_pool
+_pool: Optional[ProcessPoolExecutor] = None
+
+_STATUS_DO_REGISTRO = {
+    "presentes": PRESENTE,
+    "faltas_justificadas": FALTA_JUSTIFICADA,
+    "faltas_nao_justificadas": FALTA_NAO_JUSTIFICADA,
+}
+
+
+def periodo_do_mes(ano: int, mes: int) -> Tuple[date, date]:
+    return date(ano, mes, 1), date(ano, mes, calendar.monthrange(ano, mes)[1])
+
+
+def folha_funcionario(funcionario: dict, registros: List[dict], atestados: List[dict],
+                      licencas: List[dict], inicio: date, fim: date) -> dict:
+    """Per-day status and totals for one funcionario.
+
+    Same precedence as `/funcionarios/status`: licença outranks atestado,
+    which outranks the day's presence record.
+    """
+    dias: Dict[date, Tuple[str, Optional[str]]] = {}
+    licenca_do_dia: Dict[date, str] = {}
+    for registro in registros:
+        dias[as_date(registro["data"])] = (_STATUS_DO_REGISTRO[presenca_counter(registro)], registro["id"])
+    for atestado in atestados:
+        for dia in days_between(*atestado_days(atestado), inicio, fim):
+            dias[dia] = (ATESTADO, atestado["id"])
+    for licenca in licencas:
+        for dia in days_between(*licenca_days(licenca), inicio, fim):
+            dias[dia] = (LICENCA, licenca["id"])
+            licenca_do_dia[dia] = licenca["tipo"]
+
+    linhas = []
+    contagem = Counter()
+    for dia in days_between(inicio, fim):
+        status, referencia_id = dias.get(dia, (SEM_REGISTRO, None))
+        contagem[status] += 1
+        linhas.append({"data": dia, "status": status, "referencia_id": referencia_id})
+    return {
+        "id": f"{inicio.year}-{inicio.month:02d}-{funcionario['id']}",
+        "ano": inicio.year,
+        "mes": inicio.month,
+        "funcionario_id": funcionario["id"],
+        "nome": funcionario.get("nome"),
+        "cliente_id": funcionario.get("cliente_id"),
+        "posto_alocacao": funcionario.get("posto_alocacao"),
+        "dias": linhas,
+        "totais": {
+            "presentes": contagem[PRESENTE],
+            "faltas_justificadas": contagem[FALTA_JUSTIFICADA],
+            "faltas_nao_justificadas": contagem[FALTA_NAO_JUSTIFICADA],
+            "dias_atestado": contagem[ATESTADO],
+            "dias_licenca": contagem[LICENCA],
+            "dias_licenca_por_tipo": dict(Counter(licenca_do_dia.values())),
+            "sem_registro": contagem[SEM_REGISTRO],
+        },
+    }
+
+
+def process_cliente(lote: List[tuple], inicio: date, fim: date) -> List[dict]:
+    """Pool entry point: (funcionario, registros, atestados, licencas) tuples of one cliente."""
+    return [folha_funcionario(*entrada, inicio, fim) for entrada in lote]
+
+
+class _SortedStream:
+    """Documents sorted by funcionario_id, consumed in step with the funcionarios."""
+
+    def __init__(self, cursor):
+        self._iterator = cursor.__aiter__()
+        self.atual = None
+
+    async def avancar(self):
+        try:
+            self.atual = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self.atual = None
+
+    async def coletar(self, funcionario_id: str) -> List[dict]:
+        """Documents of `funcionario_id`; orphans sorted before it are skipped."""
+        documentos = []
+        while self.atual is not None and self.atual["funcionario_id"] <= funcionario_id:
+            if self.atual["funcionario_id"] == funcionario_id:
+                documentos.append(self.atual)
+            await self.avancar()
+        return documentos
+
+
+async def merge_month(db, inicio: date, fim: date) -> Dict[str, List[tuple]]:
+    """One sorted pass over each collection, grouped by cliente_id."""
+    periodo = date_range(inicio, fim)
+    # Closed months are read from the archive tier (arquivamento.py)
+    registros = _SortedStream(arquivamento.find(
+        db, "registros_presenca", {"data": periodo},
+        {"_id": 0, "id": 1, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1},
+        inicio, fim, sort=[("funcionario_id", 1), ("data", 1)],
+    ))
+    atestados = _SortedStream(arquivamento.find(
+        # The return day is a working day, as in server.atestado_overlap
+        db, "atestados", {"data_retorno_prevista": {"$gt": periodo["$gte"]}, "data_emissao": {"$lte": periodo["$lte"]}},
+        {"_id": 0, "id": 1, "funcionario_id": 1, "data_emissao": 1, "data_retorno_prevista": 1, "dias_afastamento": 1},
+        inicio, fim, sort=[("funcionario_id", 1)],
+    ))
+    licencas = _SortedStream(arquivamento.find(
+        db, "licencas", {"data_fim": {"$gte": periodo["$gte"]}, "data_inicio": {"$lte": periodo["$lte"]}},
+        {"_id": 0, "id": 1, "funcionario_id": 1, "tipo": 1, "data_inicio": 1, "data_fim": 1},
+        inicio, fim, sort=[("funcionario_id", 1), ("data_inicio", 1)],
+    ))
+    await asyncio.gather(registros.avancar(), atestados.avancar(), licencas.avancar())
+
+    por_cliente: Dict[str, List[tuple]] = {}
+    funcionarios = db.funcionarios.find(
+        {}, {"_id": 0, "id": 1, "nome": 1, "cliente_id": 1, "posto_alocacao": 1},
+    ).sort([("id", 1)])
+    async for funcionario in funcionarios:
+        por_cliente.setdefault(funcionario.get("cliente_id"), []).append((
+            funcionario,
+            await registros.coletar(funcionario["id"]),
+            await atestados.coletar(funcionario["id"]),
+            await licencas.coletar(funcionario["id"]),
+        ))
+    return por_cliente
+
+
+async def save_folhas(db, folhas: List[dict], ano: int, mes: int, gerado_em: datetime):
+    """Upsert this run's documents, then drop the month's leftovers from older runs."""
+    operations = [ReplaceOne({"id": folha["id"]}, {**encode(folha), "created_at": gerado_em}, upsert=True) for folha in folhas]
+    for start in range(0, len(operations), WRITE_BATCH_SIZE):
+        await db[COLLECTION].bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
+    await db[COLLECTION].delete_many({"ano": ano, "mes": mes, "created_at": {"$ne": gerado_em}})
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: forking a process that runs Motor's threads is unsafe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def start_pool():
+    """Create the pool shared by every gerar_folha call of this process (server startup)."""
+    global _pool
+    if _pool is None and FOLHA_WORKERS > 1:
+        _pool = _new_pool(FOLHA_WORKERS)
+
+
+async def stop_pool():
+    """Shut the shared pool down without blocking the event loop (server shutdown)."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+async def gerar_folha(db, ano: int, mes: int, workers: int = FOLHA_WORKERS) -> dict:
+    """Compute and persist the month's timesheets; returns a run summary."""
+    inicio_execucao = time.perf_counter()
+    agora = datetime.utcnow()
+    # BSON dates hold milliseconds; the cleanup below compares against the stored value
+    gerado_em = agora.replace(microsecond=agora.microsecond // 1000 * 1000)
+    inicio, fim = periodo_do_mes(ano, mes)
+    por_cliente = await merge_month(db, inicio, fim)
+
+    total = sum(len(lote) for lote in por_cliente.values())
+    if workers > 1 and len(por_cliente) > 1 and total >= FOLHA_POOL_MIN:
+        loop = asyncio.get_running_loop()
+        # Outside the server (the CLI) there is no shared pool: use one for this run only
+        pool = _pool or _new_pool(min(workers, len(por_cliente)))
+        try:
+            resultados = await asyncio.gather(*(
+                loop.run_in_executor(pool, process_cliente, lote, inicio, fim)
+                for lote in por_cliente.values()
+            ))
+        finally:
+            if pool is not _pool:
+                await asyncio.to_thread(pool.shutdown, wait=True)
+    else:
+        # Small months still take a while to aggregate: keep them off the event loop
+        resultados = await asyncio.to_thread(
+            lambda: [process_cliente(lote, inicio, fim) for lote in por_cliente.values()],
+        )
+
+    folhas = [folha for resultado in resultados for folha in resultado]
+    await save_folhas(db, folhas, ano, mes, gerado_em)
+    resumo = {
+        "ano": ano,
+        "mes": mes,
+        "funcionarios": len(folhas),
+        "clientes": len(por_cliente),
+        "gerado_em": gerado_em,
+        "duracao_segundos": round(time.perf_counter() - inicio_execucao, 3),
+    }
+    logger.info("Folha %02d/%d gerada: %d funcionários de %d clientes em %.1fs",
+                mes, ano, resumo["funcionarios"], resumo["clientes"], resumo["duracao_segundos"])
+    return resumo
+
+
+if __name__ == "__main__":
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    @cli.command()
+    def gerar(ano: int, mes: int, workers: int = FOLHA_WORKERS):
+        """Generate the folha de ponto of one month."""
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await gerar_folha(client[os.environ['DB_NAME']], ano, mes, workers)
+            finally:
+                client.close()
+
+        resumo = asyncio.run(run())
+        typer.echo(f"{resumo['funcionarios']} folhas gravadas em {resumo['duracao_segundos']}s")
+
+    @cli.callback()
+    def main():
+        """Folha de ponto generation."""
+
+    cli()
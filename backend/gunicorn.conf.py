@@ -0,0 +1,29 @@
+"""Multi-worker deployment: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Each worker is a separate process with its own Motor pool (MONGO_MAX_POOL_SIZE
+is per worker). Caches, invalidation and the leader lock in cache.py are only
+shared through CACHE_URL (a Redis-compatible server): without it there is a
+single worker, and asking for more with WEB_CONCURRENCY refuses to start.
+"""
+import multiprocessing
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / ".env")
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+shared_cache = os.environ.get("CACHE_URL", "").startswith(("redis://", "rediss://", "unix://"))
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1 if shared_cache else 1))
+if workers > 1 and not shared_cache:
+    # Per-worker memory caches would serve stale data after writes on another worker
+    raise RuntimeError(f"WEB_CONCURRENCY={workers} exige CACHE_URL apontando para um servidor Redis compartilhado")
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
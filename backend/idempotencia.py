@@ -0,0 +1,187 @@
+"""`Idempotency-Key` support for the create endpoints.
+
+A client that retries a POST sends the same `Idempotency-Key` header on
+every attempt. The first attempt claims the key in `idempotencia`, a
+MongoDB collection with a TTL index on `created_at` (indexes.py), so the
+claim is atomic across workers. When the handler finishes, its response
+is stored on the claim. Later attempts get the stored response back, with
+`Idempotent-Replayed: true`, and run neither validation nor the write:
+
+    {"_id": "/api/presenca <key>", "hash": "<sha256 of the body>",
+     "estado": "concluido", "status": 200, "content_type": "...", "corpo": b"..."}
+
+Concurrent attempts in one worker wait on the same in-flight operation.
+An attempt that finds another worker's claim still running polls it for up
+to IDEMPOTENCY_WAIT seconds, then gets 409; a claim left running longer
+than IDEMPOTENCY_CLAIM_TTL (its worker died) is taken over. Responses with status 5xx are
+not kept: the claim is dropped so the retry runs again. A key reused with
+a different body gets 422.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+COLLECTION = "idempotencia"
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_WAIT = float(os.environ.get("IDEMPOTENCY_WAIT", "10"))
+# A claim still running after this long belongs to a worker that died; the next attempt takes it over
+IDEMPOTENCY_CLAIM_TTL = float(os.environ.get("IDEMPOTENCY_CLAIM_TTL", "60"))
+POLL_INTERVAL = 0.05
+PROCESSANDO, CONCLUIDO = "processando", "concluido"
+
+
+def _error(status: int, detail: str) -> tuple:
+    return status, b"application/json", json.dumps({"detail": detail}, ensure_ascii=False).encode()
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for repeated `Idempotency-Key`s.
+
+    Only POSTs to `paths` that carry the header are affected. `collection`
+    is a callable returning the Motor collection, so the database is looked
+    up per request.
+    """
+
+    def __init__(self, app, collection, paths):
+        self.app = app
+        self.collection = collection
+        self.paths = frozenset(paths)
+        self._inflight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        chave = dict(scope["headers"]).get(HEADER)
+        if chave is None:
+            await self.app(scope, receive, send)
+            return
+        chave = chave.decode("latin-1").strip()
+        if not chave or len(chave) > MAX_KEY_LENGTH:
+            await self._send(send, _error(400, f"Idempotency-Key deve ter de 1 a {MAX_KEY_LENGTH} caracteres"))
+            return
+
+        partes = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            partes.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        corpo = b"".join(partes)
+        hash_corpo = hashlib.sha256(corpo).hexdigest()
+        key = f"{scope['path']} {chave}"
+
+        if key in self._inflight:
+            resposta, hash_original = await asyncio.shield(self._inflight[key])
+            await self._send(send, self._replay(resposta, hash_original, hash_corpo), replay=True)
+            return
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            resultado = await self._execute(scope, key, corpo, hash_corpo, send)
+            future.set_result(resultado)
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters re-raise it; an unwaited future must not log it as lost
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _execute(self, scope, key, corpo, hash_corpo, send):
+        """Run the handler under a claim on `key`, or replay what the claim holds.
+
+        Returns (response, hash of the body it answered) for in-flight waiters.
+        """
+        collection = self.collection()
+        while True:
+            try:
+                await collection.insert_one({"_id": key, "hash": hash_corpo, "estado": PROCESSANDO, "created_at": datetime.utcnow()})
+                break
+            except DuplicateKeyError:
+                registro = await self._wait(collection, key)
+            if registro is None:
+                # The claim was dropped (a 5xx): claim it again and run this attempt
+                continue
+            if registro["estado"] != CONCLUIDO:
+                resposta = _error(409, "Requisição com esta Idempotency-Key ainda em andamento")
+                await self._send(send, resposta)
+                return resposta, hash_corpo
+            resposta = (registro["status"], registro["content_type"].encode(), registro["corpo"])
+            await self._send(send, self._replay(resposta, registro["hash"], hash_corpo), replay=True)
+            return resposta, registro["hash"]
+
+        try:
+            resposta = await self._run(scope, corpo, send)
+        except BaseException:
+            await collection.delete_one({"_id": key})
+            raise
+        status, content_type, corpo_resposta = resposta
+        if status >= 500:
+            await collection.delete_one({"_id": key})
+        else:
+            await collection.update_one({"_id": key}, {"$set": {
+                "estado": CONCLUIDO, "status": status, "content_type": content_type.decode("latin-1"), "corpo": corpo_resposta,
+            }})
+        return resposta, hash_corpo
+
+    async def _run(self, scope, corpo, send) -> tuple:
+        """Run the handler, streaming its response to the client and capturing it."""
+        resposta = {"status": 500, "content_type": b"", "corpo": []}
+        lido = False
+
+        async def receive_body():
+            nonlocal lido
+            if lido:
+                # Nothing after the body: block like a connected client would
+                await asyncio.Event().wait()
+            lido = True
+            return {"type": "http.request", "body": corpo, "more_body": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                resposta["status"] = message["status"]
+                resposta["content_type"] = dict(message.get("headers", [])).get(b"content-type", b"")
+            elif message["type"] == "http.response.body":
+                resposta["corpo"].append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive_body, send_wrapper)
+        return resposta["status"], resposta["content_type"], b"".join(resposta["corpo"])
+
+    @staticmethod
+    async def _wait(collection, key):
+        """Poll a claim until it completes or IDEMPOTENCY_WAIT passes; None if it was dropped."""
+        limite = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            registro = await collection.find_one({"_id": key})
+            if registro is None or registro["estado"] == CONCLUIDO:
+                return registro
+            if registro["created_at"] < datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_CLAIM_TTL):
+                await collection.delete_one({"_id": key, "estado": PROCESSANDO, "created_at": registro["created_at"]})
+                return None
+            if time.monotonic() >= limite:
+                return registro
+            await asyncio.sleep(POLL_INTERVAL)
+
+    @staticmethod
+    def _replay(resposta, hash_original, hash_corpo):
+        if hash_original != hash_corpo:
+            return _error(422, "Idempotency-Key já usada com outro corpo de requisição")
+        return resposta
+
+    @staticmethod
+    async def _send(send, resposta, replay: bool = False):
+        status, content_type, corpo = resposta
+        headers = [(b"content-type", content_type), (b"content-length", str(len(corpo)).encode())]
+        if replay:
+            headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": corpo})
@@ -0,0 +1,135 @@
+"""Row readers for spreadsheet imports (CSV and XLSX).
+
+Both readers are generators over an open binary file, yielding
+`(linha, {campo: valor})` with the spreadsheet row number, so a large
+upload is never materialized. Header cells are matched to model fields
+ignoring case, accents and spacing ("Matrícula eSocial" ->
+`matricula_esocial`), and Brazilian spellings of dates, decimals and
+booleans are normalized before validation.
+"""
+import codecs
+import csv
+import io
+import re
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from search import normalize_text
+
+CSV_CONTENT_TYPES = ("text/csv", "application/csv", "text/plain", "application/vnd.ms-excel")
+XLSX_CONTENT_TYPES = ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",)
+
+_DATA_BR = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
+_VERDADEIRO = {"sim", "s", "verdadeiro", "x"}
+_FALSO = {"nao", "n", "falso"}
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be read as a spreadsheet (encoding, header, format)."""
+
+
+def header_to_field(header, fields) -> Optional[str]:
+    chave = normalize_text(str(header or "")).replace(" ", "_")
+    return chave if chave in fields else None
+
+
+def normalize_cell(value, tipo):
+    """Spreadsheet value -> what pydantic expects for a field of type `tipo`."""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+        if tipo is date:
+            encontrado = _DATA_BR.match(value)
+            if encontrado:
+                dia, mes, ano = encontrado.groups()
+                return f"{ano}-{int(mes):02d}-{int(dia):02d}"
+        elif tipo in (float, int) and "," in value:
+            return value.replace(".", "").replace(",", ".")
+        elif tipo is bool:
+            normalizado = normalize_text(value)
+            if normalizado in _VERDADEIRO:
+                return True
+            if normalizado in _FALSO:
+                return False
+    elif tipo is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Excel turns CPFs and PIS numbers into numbers
+        return str(int(value)) if float(value).is_integer() else str(value)
+    return value
+
+
+def _mapear(cabecalho: List, fields: Dict[str, type]) -> List[Optional[str]]:
+    colunas = [header_to_field(celula, fields) for celula in cabecalho]
+    if not any(colunas):
+        raise ImportFormatError("Cabeçalho sem nenhuma coluna reconhecida")
+    return colunas
+
+
+def _linha(colunas, valores, fields) -> dict:
+    """Row as model input; blank cells are left out so the model defaults apply."""
+    linha = {}
+    for campo, valor in zip(colunas, valores):
+        if campo is not None:
+            valor = normalize_cell(valor, fields[campo])
+            if valor is not None:
+                linha[campo] = valor
+    return linha
+
+
+def read_csv(arquivo: BinaryIO, fields: Dict[str, type], encoding: str = "utf-8-sig") -> Iterator[Tuple[int, dict]]:
+    """Rows of a CSV separated by `;` (Excel pt-BR) or `,`, detected from the header."""
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ImportFormatError(f"Codificação desconhecida: {encoding}")
+    texto = io.TextIOWrapper(arquivo, encoding=encoding, newline="")
+    try:
+        primeira = texto.readline()
+        delimitador = ";" if primeira.count(";") > primeira.count(",") else ","
+        colunas = _mapear(next(csv.reader([primeira], delimiter=delimitador)), fields)
+        for numero, valores in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+            if any(valor.strip() for valor in valores):
+                yield numero, _linha(colunas, valores, fields)
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"Arquivo não está em {encoding}; informe `encoding` (ex.: latin-1)")
+    except StopIteration:
+        raise ImportFormatError("Arquivo vazio")
+    finally:
+        try:
+            texto.detach()
+        except ValueError:
+            pass  # the upload was closed before the generator
+
+
+def read_xlsx(arquivo: BinaryIO, fields: Dict[str, type]) -> Iterator[Tuple[int, dict]]:
+    """Rows of the first worksheet, read in openpyxl's streaming (read-only) mode."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("Importação de XLSX requer o pacote openpyxl")
+    try:
+        workbook = load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"XLSX inválido: {e}")
+    try:
+        linhas = workbook.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            raise ImportFormatError("Planilha vazia")
+        colunas = _mapear(list(cabecalho), fields)
+        for numero, valores in enumerate(linhas, start=2):
+            if any(valor not in (None, "") for valor in valores):
+                yield numero, _linha(colunas, valores, fields)
+    finally:
+        workbook.close()
+
+
+def read_rows(arquivo: BinaryIO, filename: str, content_type: Optional[str], fields: Dict[str, type],
+              encoding: str = "utf-8-sig") -> Iterator[Tuple[int, dict]]:
+    if (filename or "").lower().endswith(".xlsx") or (content_type or "") in XLSX_CONTENT_TYPES:
+        return read_xlsx(arquivo, fields)
+    if (filename or "").lower().endswith(".csv") or (content_type or "").split(";")[0] in CSV_CONTENT_TYPES:
+        return read_csv(arquivo, fields, encoding)
+    raise ImportFormatError("Formato não suportado; envie .csv ou .xlsx")
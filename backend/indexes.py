@@ -0,0 +1,289 @@
+"""Index bootstrap for the MongoDB collections used by server.py.
+
+Collections that need creation options (time-series) are created first,
+since inserting or indexing would create them as plain collections.
+Indexes listed in REBUILT were made stricter after deployments already
+had them: `ensure` runs their cleanup, then drops and recreates them.
+Runs at application startup and as a CLI:
+
+    python indexes.py ensure      # create missing indexes, report drift
+    python indexes.py check       # report drift only
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from codec import as_date
+
+logger = logging.getLogger(__name__)
+
+# Pagination sort key shared by every list endpoint
+PAGE_ORDER = [("created_at", ASCENDING), ("id", ASCENDING)]
+
+# create_collection options; punches are bucketed per funcionario (ponto.py)
+COLLECTION_OPTIONS = {
+    "marcacoes_ponto": {
+        "timeseries": {"timeField": "registrado_em", "metaField": "funcionario_id", "granularity": "minutes"},
+    },
+}
+
+INDEX_SPECS = {
+    "empresas": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+    ],
+    "clientes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+    ],
+    "funcoes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+    ],
+    "funcionarios": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        IndexModel([("cliente_id", ASCENDING)], name="cliente_id"),
+        IndexModel([("empresa_id", ASCENDING)], name="empresa_id"),
+        # Search keys (search.py): name-prefix range scans sorted like the results
+        IndexModel([("busca_nome", ASCENDING), ("id", ASCENDING)], name="busca_nome_id"),
+        IndexModel([("busca_tokens", ASCENDING)], name="busca_tokens"),
+        IndexModel([("busca_documentos", ASCENDING)], name="busca_documentos"),
+    ],
+    "registros_presenca": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        IndexModel([("data", ASCENDING), ("presente", ASCENDING)], name="data_presente"),
+        # One record per funcionario and day: bulk upserts and ponto consolidation key on it
+        IndexModel([("funcionario_id", ASCENDING), ("data", ASCENDING)], name="funcionario_id_data", unique=True),
+    ],
+    "atestados": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        # Interval bounds for "on atestado at date X": range on the end, filter on the start
+        IndexModel(
+            [("data_retorno_prevista", ASCENDING), ("data_emissao", ASCENDING)],
+            name="data_retorno_prevista_data_emissao",
+        ),
+        IndexModel([("funcionario_id", ASCENDING)], name="funcionario_id"),
+    ],
+    "licencas": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        IndexModel([("funcionario_id", ASCENDING), ("data_inicio", ASCENDING)], name="funcionario_id_data_inicio"),
+        IndexModel([("data_fim", ASCENDING), ("data_inicio", ASCENDING)], name="data_fim_data_inicio"),
+    ],
+    "folhas_ponto": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # All documents of one run share created_at, so pages walk the month by id
+        IndexModel(
+            [("ano", ASCENDING), ("mes", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="ano_mes_created_at_id",
+        ),
+    ],
+    "marcacoes_ponto": [
+        IndexModel([("funcionario_id", ASCENDING), ("registrado_em", ASCENDING)], name="funcionario_id_registrado_em"),
+        # The reducer scans a period across all funcionarios
+        IndexModel([("registrado_em", ASCENDING)], name="registrado_em"),
+    ],
+    "jornadas_ponto": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(PAGE_ORDER, name="created_at_id"),
+        IndexModel([("funcionario_id", ASCENDING), ("data", ASCENDING)], name="funcionario_id_data"),
+        IndexModel([("data", ASCENDING)], name="data"),
+    ],
+    # Claims and stored responses of Idempotency-Key requests (idempotencia.py)
+    "idempotencia": [
+        IndexModel(
+            [("created_at", ASCENDING)], name="created_at_ttl",
+            expireAfterSeconds=int(os.environ.get("IDEMPOTENCY_TTL", "86400")),
+        ),
+    ],
+    "rollups_presenca": [
+        IndexModel(
+            [("cliente_id", ASCENDING), ("data", ASCENDING), ("posto_alocacao", ASCENDING)],
+            name="cliente_id_data_posto_alocacao",
+            unique=True,
+        ),
+        IndexModel([("data", ASCENDING)], name="data"),
+    ],
+}
+
+async def dedupe_presencas(db) -> int:
+    """Keep the newest registros_presenca row of each (funcionario_id, data); returns rows deleted.
+
+    The rollups of the affected days are rebuilt, since they counted every copy.
+    """
+    from rollups import RebuildInProgress, rebuild_rollups
+
+    ids, dias = [], []
+    async for grupo in db.registros_presenca.aggregate([
+        {"$group": {
+            "_id": {"funcionario_id": "$funcionario_id", "data": "$data"},
+            "registros": {"$push": {"id": "$id", "created_at": "$created_at"}},
+            "total": {"$sum": 1},
+        }},
+        {"$match": {"total": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        registros = sorted(grupo["registros"], key=lambda registro: (registro.get("created_at") or datetime.min, registro.get("id") or ""))
+        ids.extend(registro["id"] for registro in registros[:-1])
+        dias.append(as_date(grupo["_id"]["data"]))
+    if not ids:
+        return 0
+    await db.registros_presenca.delete_many({"id": {"$in": ids}})
+    logger.warning("Registros de presença duplicados removidos: %d, em %d dias", len(ids), len(dias))
+    try:
+        await rebuild_rollups(db, min(dias), max(dias))
+    except RebuildInProgress:
+        logger.error("Rollups não reconstruídos (outra reconstrução em andamento); rode "
+                     "`python rollups.py rebuild --data-inicio %s --data-fim %s`", min(dias), max(dias))
+    return len(ids)
+
+
+# (collection, index) -> cleanup that must run before the stricter index can be built
+REBUILT = {
+    ("registros_presenca", "funcionario_id_data"): dedupe_presencas,
+}
+
+# Options that change index semantics; anything else (v, ns, ...) is ignored
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _spec_of(index_document) -> dict:
+    spec = {"key": list(index_document["key"].items())}
+    for option in _COMPARED_OPTIONS:
+        if option in index_document:
+            spec[option] = index_document[option]
+    return spec
+
+
+async def check_indexes(db, specs: dict = INDEX_SPECS) -> dict:
+    """Compare the live indexes with `specs` without changing anything.
+
+    Returns a drift report per collection with `missing`, `mismatched` and
+    `unmanaged` index names.
+    """
+    report = {}
+    for collection_name, models in specs.items():
+        existing = {
+            index["name"]: _spec_of(index)
+            async for index in db[collection_name].list_indexes()
+        }
+        expected = {model.document["name"]: _spec_of(model.document) for model in models}
+        report[collection_name] = {
+            "missing": sorted(name for name in expected if name not in existing),
+            "mismatched": sorted(
+                name for name, spec in expected.items()
+                if name in existing and existing[name] != spec
+            ),
+            "unmanaged": sorted(
+                name for name in existing
+                if name != "_id_" and name not in expected
+            ),
+        }
+    return report
+
+
+async def ensure_collections(db, options: dict = COLLECTION_OPTIONS):
+    """Create the collections in `options` that do not exist yet.
+
+    A server without time-series support (MongoDB < 5.0) gets a plain
+    collection and a warning; the code reading it works on both.
+    """
+    existing = set(await db.list_collection_names())
+    for collection_name, kwargs in options.items():
+        if collection_name in existing:
+            continue
+        try:
+            await db.create_collection(collection_name, **kwargs)
+            logger.info("Coleção %s criada", collection_name)
+        except CollectionInvalid:
+            pass  # created concurrently
+        except (OperationFailure, NotImplementedError) as e:  # NotImplementedError: mongomock (`--mock` runs)
+            logger.warning("Coleção %s criada sem opções (%s): %s", collection_name, ", ".join(kwargs), e)
+            await db.create_collection(collection_name)
+
+
+async def ensure_indexes(db, specs: dict = INDEX_SPECS) -> dict:
+    """Idempotently create the indexes in `specs` and return the drift report.
+
+    Mismatched indexes are reported, never dropped: resolving them (e.g. a
+    unique index blocked by duplicate ids) is an operator decision. The
+    exceptions are the REBUILT indexes, cleaned up and recreated here.
+    """
+    await ensure_collections(db)
+    report = await check_indexes(db, specs)
+    for collection_name, models in specs.items():
+        missing = set(report[collection_name]["missing"])
+        for model in models:
+            name = model.document["name"]
+            cleanup = REBUILT.get((collection_name, name))
+            rebuild = cleanup is not None and name in report[collection_name]["mismatched"]
+            if name not in missing and not rebuild:
+                continue
+            try:
+                if cleanup is not None:
+                    await cleanup(db)
+                if rebuild:
+                    await db[collection_name].drop_index(name)
+                    report[collection_name]["mismatched"].remove(name)
+                await db[collection_name].create_indexes([model])
+                report[collection_name].setdefault("created", []).append(name)
+            except OperationFailure as e:
+                report[collection_name].setdefault("failed", []).append(name)
+                logger.error("Falha ao criar índice %s.%s: %s", collection_name, name, e)
+    log_drift(report)
+    return report
+
+
+def log_drift(report: dict):
+    for collection_name, entry in report.items():
+        if entry.get("created"):
+            logger.info("Índices criados em %s: %s", collection_name, ", ".join(entry["created"]))
+        if entry["mismatched"]:
+            logger.warning("Índices divergentes em %s: %s", collection_name, ", ".join(entry["mismatched"]))
+        if entry["unmanaged"]:
+            logger.warning("Índices não gerenciados em %s: %s", collection_name, ", ".join(entry["unmanaged"]))
+
+
+if __name__ == "__main__":
+    import json
+
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    def _run(action):
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await action(client[os.environ['DB_NAME']])
+            finally:
+                client.close()
+
+        report = asyncio.run(run())
+        typer.echo(json.dumps(report, indent=2, ensure_ascii=False))
+        return report
+
+    @cli.command()
+    def ensure():
+        """Create missing indexes and report drift."""
+        _run(ensure_indexes)
+
+    @cli.command()
+    def check():
+        """Report index drift; exits 1 if anything is missing or mismatched."""
+        report = _run(check_indexes)
+        if any(entry["missing"] or entry["mismatched"] for entry in report.values()):
+            raise typer.Exit(code=1)
+
+    cli()
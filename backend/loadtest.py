@@ -0,0 +1,410 @@
+"""Offline load test for the API in server.py.
+
+    python loadtest.py seed                                     # 10,000 funcionarios × 500 dias = 5M presença rows
+    python loadtest.py run --saida atual.json                   # in-process, LOADTEST_DB_NAME
+    python loadtest.py run --mock --funcionarios 500 --dias 10  # mongomock-motor, seeded in memory
+    python loadtest.py run --base-url http://localhost:8001     # a running server
+    python loadtest.py compare baseline.json atual.json         # exit 1 on regressions
+
+Seeding writes to LOADTEST_DB_NAME (default `leme_loadtest`) on MONGO_URL,
+never to DB_NAME. The presença rows the scenarios create are dated on or
+after `arquivado_ate` (arquivamento.py), since archived days answer 409.
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import typer
+from dotenv import load_dotenv
+
+import arquivamento
+from codec import bson_date
+from search import search_fields
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+INSERT_BATCH_SIZE = 10000
+BULK_ROWS = 500
+PERCENTIS = (50, 90, 95, 99)
+CENARIOS = ("dashboard", "lista_funcionarios", "lista_presenca", "criacao_presenca", "bulk_presenca", "busca_funcionarios", "marcacoes_ponto")
+
+cli = typer.Typer()
+
+
+# Synthetic data
+def empresa_sintetica(numero: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "razao_social": f"Empresa {numero:04d} LTDA",
+        "cnpj": f"{numero:08d}/0001-{numero % 100:02d}",
+        "inscricao_municipal": None,
+        "logradouro": f"Rua Empresa, {numero}",
+        "cep": "01234-567",
+        "cidade": "São Paulo",
+        "estado": "SP",
+        "created_at": datetime.utcnow(),
+    }
+
+
+def cliente_sintetico(numero: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "razao_social": f"Condomínio {numero:05d}",
+        "cnpj": f"{numero:08d}/0001-{numero % 100:02d}",
+        "logradouro": f"Av. Cliente, {numero}",
+        "cep": "87654-321",
+        "cidade": "Rio de Janeiro",
+        "estado": "RJ",
+        "area_atuacao": "condominio",
+        "valor_contrato": 15000.0,
+        "descricao_servicos": "Portaria e limpeza",
+        "sindico_responsavel": None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def funcao_sintetica(numero: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "nome": f"Função {numero:03d}",
+        "descricao": "Gerada para teste de carga",
+        "cbo": "5174-10",
+        "created_at": datetime.utcnow(),
+    }
+
+
+def funcionario_sintetico(numero: int, funcao_id: Optional[str] = None, empresa_id: Optional[str] = None,
+                          cliente_id: Optional[str] = None, posto_alocacao: str = "Portaria") -> dict:
+    admissao = date(2020, 1, 1) + timedelta(days=numero % 1500)
+    return {
+        "id": str(uuid.uuid4()),
+        "nome": f"Funcionário {numero:06d}",
+        "endereco": f"Rua {numero}, {numero % 900 + 1}",
+        "telefone": "(11) 99999-9999",
+        "cidade": "São Paulo",
+        "estado": "SP",
+        "cep": "01234-567",
+        "funcao_id": funcao_id or str(uuid.uuid4()),
+        "local_nascimento": "São Paulo, SP",
+        "nome_pai": "José da Silva",
+        "nome_mae": "Maria da Silva",
+        "matricula_esocial": f"{numero:011d}",
+        "cbo": "5174-10",
+        "rg": f"{numero:09d}",
+        "data_emissao_rg": datetime(2015, 3, 10),
+        "orgao_emissor_rg": "SSP-SP",
+        "cpf": f"{numero:011d}",
+        "ctps": f"{numero:010d}",
+        "data_emissao_ctps": datetime(2016, 5, 20),
+        "orgao_emissor_ctps": "MTE",
+        "titulo_eleitor": f"{numero:012d}",
+        "zona_eleitoral": "001",
+        "secao_eleitoral": "0001",
+        "escolaridade": "Médio Completo",
+        "estado_civil": "Solteiro",
+        "nacionalidade": "Brasileira",
+        "horario_trabalho": "08:00 às 17:00",
+        "numero_pis": f"{numero:011d}",
+        "salario": 2500.0,
+        "empresa_id": empresa_id or str(uuid.uuid4()),
+        "data_admissao": bson_date(admissao),
+        "tem_dependentes": False,
+        "quantidade_dependentes": 0,
+        "cliente_id": cliente_id or str(uuid.uuid4()),
+        "posto_alocacao": posto_alocacao,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def registros_sinteticos(funcionario_ids: List[str], dias: int, rng: random.Random, ate: date):
+    """One presença per funcionario per day, ~92% present, oldest day first."""
+    for offset in range(dias, 0, -1):
+        data = bson_date(ate - timedelta(days=offset))
+        for funcionario_id in funcionario_ids:
+            presente = rng.random() < 0.92
+            yield {
+                "id": str(uuid.uuid4()),
+                "funcionario_id": funcionario_id,
+                "data": data,
+                "presente": presente,
+                "tipo_falta": None if presente else rng.choice(["Justificada", "Não Justificada"]),
+                "observacoes": None,
+                "created_at": datetime.utcnow(),
+            }
+
+
+async def insert_batches(collection, documentos) -> int:
+    total, batch = 0, []
+    for documento in documentos:
+        batch.append(documento)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+
+async def seed_database(db, empresas: int, clientes: int, funcoes: int, funcionarios: int,
+                        dias: int, seed: int) -> Dict[str, int]:
+    rng = random.Random(seed)
+    for nome in ("empresas", "clientes", "funcoes", "funcionarios", "registros_presenca", "atestados", "licencas", "marcacoes_ponto"):
+        await db[nome].delete_many({})
+
+    empresa_docs = [empresa_sintetica(numero) for numero in range(empresas)]
+    cliente_docs = [cliente_sintetico(numero) for numero in range(clientes)]
+    funcao_docs = [funcao_sintetica(numero) for numero in range(funcoes)]
+    for nome, documentos in (("empresas", empresa_docs), ("clientes", cliente_docs), ("funcoes", funcao_docs)):
+        await insert_batches(db[nome], documentos)
+
+    postos = ["Portaria", "Garagem", "Recepção", "Ronda"]
+    funcionario_docs = [
+        funcionario_sintetico(
+            numero,
+            funcao_id=rng.choice(funcao_docs)["id"],
+            empresa_id=rng.choice(empresa_docs)["id"],
+            cliente_id=rng.choice(cliente_docs)["id"],
+            posto_alocacao=rng.choice(postos),
+        )
+        for numero in range(funcionarios)
+    ]
+    await insert_batches(db.funcionarios, [{**f, **search_fields(f)} for f in funcionario_docs])
+    presencas = await insert_batches(
+        db.registros_presenca,
+        registros_sinteticos([f["id"] for f in funcionario_docs], dias, rng, date.today()),
+    )
+    return {
+        "empresas": empresas,
+        "clientes": clientes,
+        "funcoes": funcoes,
+        "funcionarios": funcionarios,
+        "registros_presenca": presencas,
+    }
+
+
+# Load driver
+def percentil(ordenadas: List[float], p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    indice = min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[indice]
+
+
+def resumo(latencias: List[float], erros: int, duracao: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "requisicoes": len(latencias),
+        "erros": erros,
+        "throughput_rps": round(len(latencias) / duracao, 2) if duracao else 0.0,
+        "latencia_ms": {
+            **{f"p{p}": round(percentil(ordenadas, p) * 1000, 3) for p in PERCENTIS},
+            "media": round(sum(ordenadas) / len(ordenadas) * 1000, 3) if ordenadas else 0.0,
+            "max": round(ordenadas[-1] * 1000, 3) if ordenadas else 0.0,
+        },
+    }
+
+
+async def drive(client: httpx.AsyncClient, requisicao, duracao: float, concorrencia: int) -> dict:
+    """Run `requisicao(client)` from `concorrencia` workers for `duracao` seconds."""
+    latencias, erros = [], 0
+    fim = time.perf_counter() + duracao
+
+    async def worker():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                resposta = await requisicao(client)
+                resposta.raise_for_status()
+                latencias.append(time.perf_counter() - inicio)
+            except httpx.HTTPError:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concorrencia)))
+    return resumo(latencias, erros, time.perf_counter() - inicio)
+
+
+def cenarios(funcionario_ids: List[str], rng: random.Random, desde: date) -> Dict[str, Callable]:
+    """Request builders per scenario; presença rows are dated in [desde, today]."""
+    janela = (date.today() - desde).days + 1
+
+    def presenca():
+        return {
+            "funcionario_id": rng.choice(funcionario_ids),
+            "data": (date.today() - timedelta(days=rng.randrange(janela))).isoformat(),
+            "presente": rng.random() < 0.92,
+        }
+
+    def marcacao():
+        # A shift change: punches of the last few minutes, typed by the device or not
+        return {
+            "funcionario_id": rng.choice(funcionario_ids),
+            "registrado_em": (datetime.now() - timedelta(seconds=rng.randrange(600))).isoformat(),
+            "tipo": rng.choice(["Entrada", "Saída", None]),
+            "dispositivo_id": f"relogio-{rng.randrange(20):02d}",
+        }
+
+    def busca():
+        # Name prefixes and CPFs of the synthetic funcionarios, half and half
+        numero = rng.randrange(len(funcionario_ids))
+        return f"funcionario {numero:06d}"[:rng.randrange(14, 19)] if rng.random() < 0.5 else f"{numero:011d}"
+
+    return {
+        "dashboard": lambda client: client.get("/api/dashboard"),
+        "lista_funcionarios": lambda client: client.get("/api/funcionarios", params={"limit": 100}),
+        "lista_presenca": lambda client: client.get("/api/presenca", params={"limit": 100}),
+        "criacao_presenca": lambda client: client.post("/api/presenca", json=presenca()),
+        "bulk_presenca": lambda client: client.post("/api/presenca/bulk", json=[presenca() for _ in range(BULK_ROWS)]),
+        "busca_funcionarios": lambda client: client.get("/api/funcionarios/search", params={"q": busca()}),
+        "marcacoes_ponto": lambda client: client.post("/api/ponto/marcacoes", json=[marcacao() for _ in range(BULK_ROWS)]),
+    }
+
+
+async def run_load(client: httpx.AsyncClient, nomes: List[str], duracao: float, concorrencia: int, seed: int,
+                   desde: date) -> dict:
+    resposta = await client.get("/api/funcionarios", params={"fields": "id", "limit": 1000})
+    resposta.raise_for_status()
+    funcionario_ids = [item["id"] for item in resposta.json()]
+    if not funcionario_ids:
+        raise typer.BadParameter("Nenhum funcionário na base; rode `seed` ou use --mock")
+    disponiveis = cenarios(funcionario_ids, random.Random(seed), desde)
+    resultados = {}
+    for nome in nomes:
+        typer.echo(f"→ {nome} ({duracao}s, concorrência {concorrencia})")
+        resultados[nome] = await drive(client, disponiveis[nome], duracao, concorrencia)
+    return resultados
+
+
+# CLI
+def loadtest_db(client):
+    return client[os.environ.get("LOADTEST_DB_NAME", "leme_loadtest")]
+
+
+@cli.command()
+def seed(
+    empresas: int = 10,
+    clientes: int = 100,
+    funcoes: int = 20,
+    funcionarios: int = 10000,
+    dias: int = 500,
+    semente: int = 42,
+):
+    """Fill LOADTEST_DB_NAME with synthetic data (funcionarios × dias presença rows)."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from indexes import ensure_indexes
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        try:
+            db = loadtest_db(client)
+            totais = await seed_database(db, empresas, clientes, funcoes, funcionarios, dias, semente)
+            await ensure_indexes(db)
+            return totais
+        finally:
+            client.close()
+
+    typer.echo(json.dumps(asyncio.run(run()), indent=2))
+
+
+@cli.command()
+def run(
+    cenario: List[str] = typer.Option(None, help="Cenários a rodar (padrão: todos)"),
+    duracao: float = 10.0,
+    concorrencia: int = 8,
+    base_url: Optional[str] = None,
+    mock: bool = False,
+    funcionarios: int = 500,
+    dias: int = 10,
+    semente: int = 42,
+    saida: Path = Path("loadtest_report.json"),
+):
+    """Drive the endpoints and save latency percentiles and throughput as JSON.
+
+    Without --base-url the app runs in-process against LOADTEST_DB_NAME, or
+    against an in-memory mongomock-motor database seeded at the given scale
+    with --mock.
+    """
+    nomes = cenario or list(CENARIOS)
+    desconhecidos = set(nomes) - set(CENARIOS)
+    if desconhecidos:
+        raise typer.BadParameter(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    async def main():
+        # Days the archive job leaves hot; a remote server's catalog is not readable from here
+        desde = arquivamento.cutoff(date.today())
+        if base_url:
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                return await run_load(client, nomes, duracao, concorrencia, semente, desde)
+
+        import server
+        from indexes import ensure_indexes
+
+        if mock:
+            from mongomock_motor import AsyncMongoMockClient
+            server.db = AsyncMongoMockClient()["loadtest"]
+            await seed_database(server.db, 5, 20, 10, funcionarios, dias, semente)
+        else:
+            server.db = loadtest_db(server.client)
+        await ensure_indexes(server.db)
+        arquivado_ate = await arquivamento.archived_until(server.db, "registros_presenca")
+        if arquivado_ate:
+            desde = max(desde, arquivado_ate)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            return await run_load(client, nomes, duracao, concorrencia, semente, desde)
+
+    relatorio = {
+        "gerado_em": datetime.utcnow().isoformat(),
+        "alvo": base_url or ("mongomock" if mock else "in-process"),
+        "config": {"duracao": duracao, "concorrencia": concorrencia, "semente": semente},
+        "python": platform.python_version(),
+        "cenarios": asyncio.run(main()),
+    }
+    saida.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    for nome, resultado in relatorio["cenarios"].items():
+        latencia = resultado["latencia_ms"]
+        typer.echo(
+            f"{nome:20s} {resultado['throughput_rps']:9.1f} req/s  "
+            f"p50 {latencia['p50']:8.2f} ms  p99 {latencia['p99']:8.2f} ms  erros {resultado['erros']}"
+        )
+    typer.echo(f"Relatório salvo em {saida}")
+
+
+@cli.command()
+def compare(baseline: Path, atual: Path, tolerancia: float = 0.2):
+    """Fail when p95 latency or throughput regresses more than `tolerancia` vs. the baseline."""
+    base = json.loads(baseline.read_text())["cenarios"]
+    novo = json.loads(atual.read_text())["cenarios"]
+    regressoes = []
+    for nome, resultado in novo.items():
+        if nome not in base:
+            continue
+        p95_base, p95_novo = base[nome]["latencia_ms"]["p95"], resultado["latencia_ms"]["p95"]
+        rps_base, rps_novo = base[nome]["throughput_rps"], resultado["throughput_rps"]
+        typer.echo(f"{nome:20s} p95 {p95_base:8.2f} → {p95_novo:8.2f} ms   {rps_base:9.1f} → {rps_novo:9.1f} req/s")
+        if p95_base and p95_novo > p95_base * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {p95_base} → {p95_novo} ms")
+        if rps_base and rps_novo < rps_base * (1 - tolerancia):
+            regressoes.append(f"{nome}: throughput {rps_base} → {rps_novo} req/s")
+        if resultado["erros"] > base[nome]["erros"]:
+            regressoes.append(f"{nome}: erros {base[nome]['erros']} → {resultado['erros']}")
+    if regressoes:
+        typer.echo("Regressões:\n  " + "\n  ".join(regressoes), err=True)
+        raise typer.Exit(code=1)
+    typer.echo("Sem regressões")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,303 @@
+"""Request latency and Mongo command metrics in Prometheus text format.
+
+`LatencyMiddleware` times every request by route template, and
+`MongoCommandListener` (registered on the Motor client) times every
+command per collection. Both feed the module-level `registry`, which
+server.py exposes at `/metrics`.
+
+Command replies carry documents returned but not documents examined. For
+those, slow reads are sampled: at most one per collection and command
+every MONGO_EXPLAIN_INTERVAL_SECONDS is re-run by `explain_slow_commands`
+with `explain` (executionStats), off the request path.
+"""
+import asyncio
+import bisect
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# 0 disables explain sampling of slow commands
+MONGO_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('MONGO_EXPLAIN_INTERVAL_SECONDS', '60'))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = sorted((labels, list(series[0]), series[1]) for labels, series in self._series.items())
+        names = self.labels + ("le",)
+        for labels, counts, total in snapshot:
+            acumulado = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                acumulado += count
+                yield f"{self.name}_bucket{_labels(names, labels + (str(bound),))} {acumulado}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {acumulado}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    labels=("method", "route", "status"),
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency",
+    labels=("collection", "command"),
+))
+mongo_documents_returned = registry.register(Counter(
+    "mongo_documents_returned_total", "Documents returned (cursor batches) or affected (n) by MongoDB commands",
+    labels=("collection", "command"),
+))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands",
+    labels=("collection", "command"),
+))
+mongo_slow_commands = registry.register(Counter(
+    "mongo_slow_commands_total", f"MongoDB commands slower than SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)",
+    labels=("collection", "command"),
+))
+mongo_documents_examined = registry.register(Counter(
+    "mongo_sampled_documents_examined_total", "Documents examined by sampled slow commands (explain executionStats)",
+    labels=("collection", "command"),
+))
+mongo_sampled_documents_returned = registry.register(Counter(
+    "mongo_sampled_documents_returned_total", "Documents returned by the same sampled slow commands",
+    labels=("collection", "command"),
+))
+
+
+class LatencyMiddleware:
+    """ASGI middleware; labels by route template so ids don't explode cardinality."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - inicio,
+                scope["method"], route.path if route else "unmatched", status[0],
+            )
+
+
+# Commands whose first argument is not a collection name
+_ADMIN_COMMANDS = {"ping", "hello", "ismaster", "isMaster", "buildInfo", "endSessions", "saslStart", "saslContinue",
+                   "explain"}
+# Read commands `explain` accepts, and the session fields it must not be sent
+_EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+_SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern"}
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Per-collection timings, returned documents and slow-command logging.
+
+    Slow reads are also queued in `slow_samples` for `explain_slow_commands`.
+    """
+
+    def __init__(self, explain_interval: float = MONGO_EXPLAIN_INTERVAL_SECONDS):
+        self._pending: Dict[Tuple, Tuple[str, dict]] = {}
+        self._lock = threading.Lock()
+        self.explain_interval = explain_interval
+        self._last_sample: Dict[Tuple[str, str], float] = {}
+        self.slow_samples = collections.deque(maxlen=100)
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        if event.command_name in _ADMIN_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        with self._lock:
+            self._pending[self._key(event)] = (str(collection), event.command)
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop(self._key(event), (None, None))
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        if collection is None:
+            return
+        duration = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(duration, collection, event.command_name)
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor:
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+        else:
+            returned = reply.get("n", 0)
+        if returned:
+            mongo_documents_returned.inc(collection, event.command_name, amount=returned)
+        if duration * 1000 >= SLOW_QUERY_MS:
+            mongo_slow_commands.inc(collection, event.command_name)
+            filtro = command.get("filter", command.get("query", command.get("pipeline")))
+            logger.warning(
+                "Comando lento: %s %s em %.1f ms (filtro=%s)",
+                event.command_name, collection, duration * 1000, filtro,
+            )
+            self._sample(event, collection, command)
+
+    def _sample(self, event, collection, command):
+        if self.explain_interval <= 0 or event.command_name not in _EXPLAINABLE:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._last_sample.get((collection, event.command_name), -self.explain_interval) < self.explain_interval:
+                return
+            self._last_sample[(collection, event.command_name)] = agora
+        comando = {k: v for k, v in command.items() if not k.startswith("$") and k not in _SESSION_FIELDS}
+        self.slow_samples.append((event.database_name, collection, event.command_name, comando))
+
+    def failed(self, event):
+        collection, _ = self._finish(event)
+        if collection is None:
+            return
+        mongo_command_duration.observe(event.duration_micros / 1_000_000, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+
+def _execution_stats(explicacao: dict):
+    """The shallowest `executionStats` with totalDocsExamined in an explain reply.
+
+    find has it at the top; aggregate nests it under the `$cursor` stage or
+    per shard depending on the server version and topology.
+    """
+    fila = collections.deque([explicacao])
+    while fila:
+        item = fila.popleft()
+        if isinstance(item, dict):
+            stats = item.get("executionStats")
+            if isinstance(stats, dict) and "totalDocsExamined" in stats:
+                return stats
+            fila.extend(item.values())
+        elif isinstance(item, list):
+            fila.extend(item)
+    return None
+
+
+async def explain_slow_commands(client, listener: "MongoCommandListener", poll_seconds: float = 1.0):
+    """Explain the sampled slow commands and count documents examined vs returned."""
+    while True:
+        while listener.slow_samples:
+            database, collection, command_name, comando = listener.slow_samples.popleft()
+            try:
+                explicacao = await client[database].command({"explain": comando, "verbosity": "executionStats"})
+            except Exception:
+                logger.warning("Falha no explain de %s %s", command_name, collection, exc_info=True)
+                continue
+            stats = _execution_stats(explicacao)
+            if stats is None:
+                continue
+            examinados, retornados = stats["totalDocsExamined"], stats.get("nReturned", 0)
+            mongo_documents_examined.inc(collection, command_name, amount=examinados)
+            mongo_sampled_documents_returned.inc(collection, command_name, amount=retornados)
+            logger.warning(
+                "Explain de %s %s: %d documentos examinados para %d retornados",
+                command_name, collection, examinados, retornados,
+            )
+        await asyncio.sleep(poll_seconds)
+
+
+mongo_listener = MongoCommandListener()
@@ -0,0 +1,178 @@
+"""Electronic clock-in punches (ponto eletrônico) and their daily reduction.
+
+Devices post raw punches in batches; they land in `marcacoes_ponto`, a
+MongoDB time-series collection bucketed by `funcionario_id` (created by
+indexes.py). Nothing is updated in place on ingestion, so a node absorbs
+thousands of punches per second with unordered `insert_many` batches.
+
+The reducer walks a period's punches sorted by (funcionario_id,
+registrado_em), pairs them into shifts (turnos) and writes one
+`jornadas_ponto` document per funcionario and day with the worked
+minutes. A shift belongs to the local day of its entrada, so night shifts
+crossing midnight count once. The presença records derived from the
+jornadas are written by the server (`POST /api/ponto/consolidar`) only
+on days without a record entered by hand.
+
+Instants are stored as naive UTC; punches without a UTC offset are read
+as local time in PONTO_TIMEZONE.
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List
+from zoneinfo import ZoneInfo
+
+from pymongo import ReplaceOne
+
+from codec import date_range, encode
+
+COLLECTION = "marcacoes_ponto"
+JORNADAS_COLLECTION = "jornadas_ponto"
+WRITE_BATCH_SIZE = 1000
+
+PONTO_TIMEZONE = ZoneInfo(os.environ.get("PONTO_TIMEZONE", "America/Sao_Paulo"))
+# Punches closer than this to the previous one are device repeats
+PONTO_DEDUP_SEGUNDOS = int(os.environ.get("PONTO_DEDUP_SEGUNDOS", "60"))
+# An entrada without a saída within this many hours is an open shift
+PONTO_MAX_TURNO_HORAS = int(os.environ.get("PONTO_MAX_TURNO_HORAS", "16"))
+
+# RegistroPresenca.origem of the records written by consolidation
+ORIGEM = "ponto"
+# Values of server.TipoMarcacao
+ENTRADA = "Entrada"
+SAIDA = "Saída"
+
+
+def as_utc(instante: datetime) -> datetime:
+    """Aware or local-time instant -> naive UTC, as stored by MongoDB."""
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=PONTO_TIMEZONE)
+    return instante.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_time(instante: datetime) -> datetime:
+    """Stored naive UTC instant -> aware datetime in PONTO_TIMEZONE."""
+    return instante.replace(tzinfo=timezone.utc).astimezone(PONTO_TIMEZONE)
+
+
+def local_day(instante: datetime) -> date:
+    return local_time(instante).date()
+
+
+def day_start(dia: date) -> datetime:
+    return as_utc(datetime.combine(dia, time.min))
+
+
+def marcacao_document(marcacao: dict) -> dict:
+    """Validated punch -> stored document; absent optional fields are left out."""
+    documento = {key: value for key, value in marcacao.items() if value is not None}
+    documento["registrado_em"] = as_utc(marcacao["registrado_em"])
+    return documento
+
+
+def pair_punches(marcacoes: Iterable[dict]) -> List[dict]:
+    """Shifts from one funcionario's punches, sorted by time.
+
+    Punches with a `tipo` are taken at their word; untyped ones alternate
+    entrada/saída. A saída without an entrada, or an entrada left open
+    longer than PONTO_MAX_TURNO_HORAS, becomes a shift with a missing end.
+    """
+    dedup = timedelta(seconds=PONTO_DEDUP_SEGUNDOS)
+    max_turno = timedelta(hours=PONTO_MAX_TURNO_HORAS)
+    turnos, aberto, anterior = [], None, None
+    for marcacao in marcacoes:
+        instante = marcacao["registrado_em"]
+        if anterior is not None and instante - anterior < dedup:
+            continue
+        anterior = instante
+        if aberto is not None and instante - aberto["entrada"] > max_turno:
+            turnos.append(aberto)
+            aberto = None
+        tipo = marcacao.get("tipo")
+        if tipo == SAIDA or (tipo is None and aberto is not None):
+            if aberto is None:
+                turnos.append({"entrada": None, "saida": instante})
+            else:
+                aberto["saida"] = instante
+                turnos.append(aberto)
+                aberto = None
+        else:
+            if aberto is not None:
+                turnos.append(aberto)
+            aberto = {"entrada": instante, "saida": None}
+    if aberto is not None:
+        turnos.append(aberto)
+    return turnos
+
+
+def jornadas(funcionario_id: str, marcacoes: List[dict], inicio: date, fim: date) -> List[dict]:
+    """Per-day totals of one funcionario's shifts that start within [inicio, fim]."""
+    por_dia: Dict[date, List[dict]] = {}
+    for turno in pair_punches(marcacoes):
+        dia = local_day(turno["entrada"] or turno["saida"])
+        if inicio <= dia <= fim:
+            por_dia.setdefault(dia, []).append(turno)
+    resultado = []
+    for dia, turnos in sorted(por_dia.items()):
+        completos = [turno for turno in turnos if turno["entrada"] and turno["saida"]]
+        resultado.append({
+            "id": f"{dia.isoformat()}-{funcionario_id}",
+            "funcionario_id": funcionario_id,
+            "data": dia,
+            "turnos": turnos,
+            "minutos_trabalhados": sum(int((turno["saida"] - turno["entrada"]).total_seconds() // 60) for turno in completos),
+            "incompleta": len(completos) < len(turnos),
+        })
+    return resultado
+
+
+async def reduce_period(db, inicio: date, fim: date) -> List[dict]:
+    """Jornadas of every funcionario with punches in [inicio, fim] (local days).
+
+    Punches up to one maximum shift before and after the period are read
+    too, so shifts crossing its edges pair correctly.
+    """
+    margem = timedelta(hours=PONTO_MAX_TURNO_HORAS)
+    cursor = db[COLLECTION].find(
+        {"registrado_em": {"$gte": day_start(inicio) - margem, "$lt": day_start(fim + timedelta(days=1)) + margem}},
+        {"_id": 0, "funcionario_id": 1, "registrado_em": 1, "tipo": 1},
+    ).sort([("funcionario_id", 1), ("registrado_em", 1)])
+    resultado, atual, marcacoes = [], None, []
+    async for marcacao in cursor:
+        if marcacao["funcionario_id"] != atual:
+            if marcacoes:
+                resultado.extend(jornadas(atual, marcacoes, inicio, fim))
+            atual, marcacoes = marcacao["funcionario_id"], []
+        marcacoes.append(marcacao)
+    if marcacoes:
+        resultado.extend(jornadas(atual, marcacoes, inicio, fim))
+    return resultado
+
+
+async def save_jornadas(db, documentos: List[dict], inicio: date, fim: date, gerado_em: datetime):
+    """Replace the period's jornadas; days whose punches are gone are dropped."""
+    operations = [
+        ReplaceOne({"id": jornada["id"]}, {**encode(jornada), "created_at": gerado_em}, upsert=True)
+        for jornada in documentos
+    ]
+    for start in range(0, len(operations), WRITE_BATCH_SIZE):
+        await db[JORNADAS_COLLECTION].bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
+    await db[JORNADAS_COLLECTION].delete_many({"data": date_range(inicio, fim), "created_at": {"$ne": gerado_em}})
+
+
+async def consolidate(db, inicio: date, fim: date) -> List[dict]:
+    """Reduce and store the period's jornadas; returns them."""
+    agora = datetime.utcnow()
+    # BSON dates hold milliseconds; the cleanup in save_jornadas compares against the stored value
+    gerado_em = agora.replace(microsecond=agora.microsecond // 1000 * 1000)
+    resultado = await reduce_period(db, inicio, fim)
+    await save_jornadas(db, resultado, inicio, fim, gerado_em)
+    return resultado
+
+
+def presenca_row(jornada: dict) -> dict:
+    """RegistroPresencaCreate payload for a day with punches."""
+    horas, minutos = divmod(jornada["minutos_trabalhados"], 60)
+    observacoes = f"Ponto eletrônico: {horas}h{minutos:02d}"
+    if jornada["incompleta"]:
+        observacoes += " (marcações incompletas)"
+    return {"funcionario_id": jornada["funcionario_id"], "data": jornada["data"], "presente": True, "observacoes": observacoes}
@@ -0,0 +1,298 @@
+"""Daily attendance rollups per cliente/posto.
+
+One document per (cliente_id, posto_alocacao, data) in `rollups_presenca`
+holds the day's counters, keyed by the day as a BSON date. Counters are
+updated incrementally by the create handlers in server.py and can be rebuilt
+from the raw collections:
+
+    python rollups.py rebuild [--data-inicio 2024-01-01] [--data-fim 2024-01-31]
+
+A rebuild holds a lock document in `rollups_controle`. While it is held the
+handlers do not `$inc` (the rebuild could overwrite or double-count them);
+they add their days to the lock instead, and the rebuild recounts those days
+before it finishes.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import arquivamento
+from codec import as_date, bson_date, date_range
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "rollups_presenca"
+COUNTERS = ("presentes", "faltas_justificadas", "faltas_nao_justificadas", "atestados", "licencas")
+WRITE_BATCH_SIZE = 1000
+CONTROL_COLLECTION = "rollups_controle"
+REBUILD_LOCK_ID = "rebuild"
+# A crashed rebuild stops holding back the handlers after this long
+REBUILD_LOCK_SECONDS = int(os.environ.get("ROLLUPS_REBUILD_LOCK_SECONDS", "3600"))
+# Deltas that checked the lock just before it was taken land before the rebuild reads
+REBUILD_GRACE_SECONDS = float(os.environ.get("ROLLUPS_REBUILD_GRACE_SECONDS", "2"))
+
+# (cliente_id, posto_alocacao, data, counter) -> delta
+Deltas = Counter
+
+
+class RebuildInProgress(Exception):
+    """Another rebuild holds the lock."""
+
+
+def presenca_counter(registro: dict) -> str:
+    if registro["presente"]:
+        return "presentes"
+    if registro.get("tipo_falta") == "Justificada":
+        return "faltas_justificadas"
+    return "faltas_nao_justificadas"
+
+
+def atestado_days(atestado: dict) -> Tuple[date, date]:
+    """Inclusive range of days covered by an atestado.
+
+    The employee is away from `data_emissao` until the day before
+    `data_retorno_prevista`; `dias_afastamento` is the fallback when the
+    return date is missing or not after the issue date.
+    """
+    inicio = as_date(atestado["data_emissao"])
+    retorno = as_date(atestado.get("data_retorno_prevista"))
+    fim = retorno - timedelta(days=1) if retorno else inicio
+    if fim < inicio:
+        fim = inicio + timedelta(days=max(int(atestado.get("dias_afastamento") or 1), 1) - 1)
+    return inicio, fim
+
+
+def licenca_days(licenca: dict) -> Tuple[date, date]:
+    return as_date(licenca["data_inicio"]), as_date(licenca["data_fim"])
+
+
+def days_between(inicio: date, fim: date, data_inicio: Optional[date] = None, data_fim: Optional[date] = None):
+    """Days from `inicio` to `fim` inclusive, clipped to [data_inicio, data_fim]."""
+    if data_inicio and inicio < data_inicio:
+        inicio = data_inicio
+    if data_fim and fim > data_fim:
+        fim = data_fim
+    dia = inicio
+    while dia <= fim:
+        yield dia
+        dia += timedelta(days=1)
+
+
+async def alocacoes(db, funcionario_ids: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+    """Map funcionario id -> (cliente_id, posto_alocacao) with one `$in` query."""
+    ids = list(set(funcionario_ids))
+    if not ids:
+        return {}
+    cursor = db.funcionarios.find(
+        {"id": {"$in": ids}},
+        {"_id": 0, "id": 1, "cliente_id": 1, "posto_alocacao": 1},
+    )
+    return {
+        funcionario["id"]: (funcionario.get("cliente_id"), funcionario.get("posto_alocacao"))
+        async for funcionario in cursor
+    }
+
+
+async def apply_deltas(db, deltas: Deltas):
+    """Write counter deltas with upserting `$inc` in unordered batches."""
+    por_dia = {}
+    for (cliente_id, posto, data, counter), delta in deltas.items():
+        if delta:
+            por_dia.setdefault((cliente_id, posto, data), {})[counter] = delta
+    if not por_dia:
+        return
+    marcado = await db[CONTROL_COLLECTION].update_one(
+        {"_id": REBUILD_LOCK_ID, "expira_em": {"$gt": datetime.utcnow()}},
+        {"$addToSet": {"dias": {"$each": sorted({bson_date(data) for _, _, data in por_dia})}}},
+    )
+    if marcado.matched_count:
+        return  # a rebuild is running; it recounts these days
+    operations = [
+        UpdateOne(
+            {"cliente_id": cliente_id, "posto_alocacao": posto, "data": bson_date(data)},
+            {"$inc": incrementos},
+            upsert=True,
+        )
+        for (cliente_id, posto, data), incrementos in por_dia.items()
+    ]
+    for start in range(0, len(operations), WRITE_BATCH_SIZE):
+        await db[COLLECTION].bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
+
+
+async def apply_presencas(db, novos: Iterable[dict], anteriores: Iterable[dict] = ()):
+    """Count new presence records and uncount the ones they replaced."""
+    novos, anteriores = list(novos), list(anteriores)
+    alocacao = await alocacoes(db, [registro["funcionario_id"] for registro in novos + anteriores])
+    deltas = Deltas()
+    for registros, sinal in ((novos, 1), (anteriores, -1)):
+        for registro in registros:
+            if registro["funcionario_id"] not in alocacao:
+                logger.warning("Rollup ignorado: funcionário %s não encontrado", registro["funcionario_id"])
+                continue
+            cliente_id, posto = alocacao[registro["funcionario_id"]]
+            deltas[(cliente_id, posto, as_date(registro["data"]), presenca_counter(registro))] += sinal
+    await apply_deltas(db, deltas)
+
+
+async def apply_afastamento(db, funcionario_id: str, inicio: date, fim: date, counter: str):
+    """Count one atestado/licença on every day it covers."""
+    alocacao = await alocacoes(db, [funcionario_id])
+    if funcionario_id not in alocacao:
+        logger.warning("Rollup ignorado: funcionário %s não encontrado", funcionario_id)
+        return
+    cliente_id, posto = alocacao[funcionario_id]
+    await apply_deltas(db, Deltas({
+        (cliente_id, posto, dia, counter): 1 for dia in days_between(inicio, fim)
+    }))
+
+
+async def _acquire_rebuild_lock(db):
+    agora = datetime.utcnow()
+    lock = {"_id": REBUILD_LOCK_ID, "expira_em": agora + timedelta(seconds=REBUILD_LOCK_SECONDS), "dias": []}
+    try:
+        await db[CONTROL_COLLECTION].insert_one(lock)
+        return
+    except DuplicateKeyError:
+        pass
+    expirado = await db[CONTROL_COLLECTION].find_one_and_delete({"_id": REBUILD_LOCK_ID, "expira_em": {"$lte": agora}})
+    if expirado is None:
+        raise RebuildInProgress("Já existe uma reconstrução de rollups em andamento")
+    logger.warning("Lock de reconstrução expirado removido; dias marcados nele: %d", len(expirado.get("dias", [])))
+    try:
+        await db[CONTROL_COLLECTION].insert_one(lock)
+    except DuplicateKeyError:
+        raise RebuildInProgress("Já existe uma reconstrução de rollups em andamento")
+
+
+async def rebuild_rollups(db, data_inicio: Optional[date] = None, data_fim: Optional[date] = None) -> int:
+    """Recompute the rollups for a period (or everything) from the raw collections.
+
+    Archived months are read from the archive tier. Uses each funcionario's
+    current cliente/posto. Every key is replaced in place and keys that no
+    longer have any count are deleted afterwards, so readers never see the
+    period empty or half-written. Days the handlers touched meanwhile are
+    recounted, under the lock again, until none are left. Raises
+    RebuildInProgress if another rebuild holds the lock. Returns the number
+    of rollup documents written.
+    """
+    total = 0
+    while True:
+        await _acquire_rebuild_lock(db)
+        try:
+            await asyncio.sleep(REBUILD_GRACE_SECONDS)
+            total += await _write_rollups(db, await _recount(db, data_inicio, data_fim), data_inicio, data_fim)
+        finally:
+            lock = await db[CONTROL_COLLECTION].find_one_and_delete({"_id": REBUILD_LOCK_ID})
+        dias = [as_date(dia) for dia in (lock or {}).get("dias", [])]
+        if not dias:
+            return total
+        data_inicio, data_fim = min(dias), max(dias)
+        logger.info("Recontando %d dias alterados durante a reconstrução", len(dias))
+
+
+async def _recount(db, data_inicio: Optional[date], data_fim: Optional[date]) -> Deltas:
+    """(cliente_id, posto, data, counter) -> count over the period, from the raw collections."""
+    periodo = date_range(data_inicio, data_fim)
+
+    alocacao = {
+        funcionario["id"]: (funcionario.get("cliente_id"), funcionario.get("posto_alocacao"))
+        async for funcionario in db.funcionarios.find({}, {"_id": 0, "id": 1, "cliente_id": 1, "posto_alocacao": 1})
+    }
+    totais = Deltas()
+
+    presenca_query = {"data": periodo} if periodo else {}
+    projection = {"_id": 0, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1}
+    async for registro in arquivamento.find(db, "registros_presenca", presenca_query, projection, data_inicio, data_fim):
+        if registro["funcionario_id"] in alocacao:
+            cliente_id, posto = alocacao[registro["funcionario_id"]]
+            totais[(cliente_id, posto, as_date(registro["data"]), presenca_counter(registro))] += 1
+
+    # Intervals overlapping the period; days outside it are clipped below
+    afastamentos = (
+        ("atestados", "atestados", "data_emissao", "data_retorno_prevista", atestado_days),
+        ("licencas", "licencas", "data_inicio", "data_fim", licenca_days),
+    )
+    for collection_name, counter, start_field, end_field, days_of in afastamentos:
+        query = {}
+        if data_fim:
+            query[start_field] = {"$lte": bson_date(data_fim)}
+        if data_inicio:
+            query[end_field] = {"$gte": bson_date(data_inicio)}
+        async for documento in arquivamento.find(db, collection_name, query, {"_id": 0}, data_inicio, data_fim):
+            if documento["funcionario_id"] not in alocacao:
+                continue
+            cliente_id, posto = alocacao[documento["funcionario_id"]]
+            inicio, fim = days_of(documento)
+            for dia in days_between(inicio, fim, data_inicio, data_fim):
+                totais[(cliente_id, posto, dia, counter)] += 1
+    return totais
+
+
+async def _write_rollups(db, totais: Deltas, data_inicio: Optional[date], data_fim: Optional[date]) -> int:
+    periodo = date_range(data_inicio, data_fim)
+    existentes = {
+        (documento.get("cliente_id"), documento.get("posto_alocacao"), as_date(documento["data"])): documento["_id"]
+        async for documento in db[COLLECTION].find(
+            {"data": periodo} if periodo else {}, {"cliente_id": 1, "posto_alocacao": 1, "data": 1},
+        )
+    }
+    documentos = {}
+    for (cliente_id, posto, data, counter), total in totais.items():
+        documento = documentos.setdefault((cliente_id, posto, data), {
+            "cliente_id": cliente_id, "posto_alocacao": posto, "data": bson_date(data),
+            **{name: 0 for name in COUNTERS},
+        })
+        documento[counter] = total
+    operations = [
+        ReplaceOne({"cliente_id": cliente_id, "posto_alocacao": posto, "data": documento["data"]}, documento, upsert=True)
+        for (cliente_id, posto, _), documento in documentos.items()
+    ]
+    # Handlers only mark days while the lock is held, so no key appears behind our back
+    operations += [DeleteOne({"_id": _id}) for key, _id in existentes.items() if key not in documentos]
+    for start in range(0, len(operations), WRITE_BATCH_SIZE):
+        await db[COLLECTION].bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
+    logger.info("Rollups reconstruídos: %d documentos", len(documentos))
+    return len(documentos)
+
+
+if __name__ == "__main__":
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    @cli.command()
+    def rebuild(data_inicio: Optional[str] = None, data_fim: Optional[str] = None):
+        """Recompute rollups for a period (ISO dates), or for all history."""
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await rebuild_rollups(
+                    client[os.environ['DB_NAME']],
+                    date.fromisoformat(data_inicio) if data_inicio else None,
+                    date.fromisoformat(data_fim) if data_fim else None,
+                )
+            finally:
+                client.close()
+
+        try:
+            typer.echo(f"{asyncio.run(run())} documentos de rollup gravados")
+        except RebuildInProgress as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(1)
+
+    @cli.callback()
+    def main():
+        """Attendance rollup maintenance."""
+
+    cli()
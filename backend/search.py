@@ -0,0 +1,173 @@
+"""Funcionario search: normalized search keys and ranked, index-backed lookups.
+
+Each funcionario document carries three derived fields, written by the
+create handler and backfilled by the CLI:
+
+    busca_nome        "joao da silva"   accent-free, lowercase full name
+    busca_tokens      ["joao", "da", "silva"]
+    busca_documentos  CPF, PIS, matrícula eSocial and RG, digits/letters only
+
+Results come in tiers, each sorted by (busca_nome, id): exact document
+match, then full-name prefix, then every query word prefixing a name word.
+All three are range scans on the indexes declared in indexes.py.
+
+    python search.py reindex      # backfill the search keys
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = ("cpf", "numero_pis", "matricula_esocial", "rg")
+SEARCH_FIELDS = ("busca_nome", "busca_tokens", "busca_documentos")
+WRITE_BATCH_SIZE = 1000
+
+TIER_DOCUMENTO, TIER_NOME, TIER_PALAVRA = 0, 1, 2
+
+
+def normalize_text(value: str) -> str:
+    """'  João  D'Ávila ' -> 'joao d avila'."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    sem_acentos = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", sem_acentos.lower()).split())
+
+
+def normalize_document(value: str) -> str:
+    """'123.456.789-09' -> '12345678909'; RGs keep their check letter."""
+    return re.sub(r"[^0-9a-z]", "", normalize_text(value))
+
+
+def search_fields(funcionario: dict) -> dict:
+    nome = normalize_text(funcionario.get("nome", ""))
+    documentos = {normalize_document(funcionario.get(field) or "") for field in DOCUMENT_FIELDS}
+    return {
+        "busca_nome": nome,
+        "busca_tokens": sorted(set(nome.split())),
+        "busca_documentos": sorted(documento for documento in documentos if documento),
+    }
+
+
+def search_tiers(q: str) -> List[Tuple[int, dict]]:
+    """(tier, Mongo filter) pairs for a query, in rank order."""
+    nome = normalize_text(q)
+    tiers = []
+    documento = normalize_document(q)
+    if documento and any(char.isdigit() for char in documento):
+        tiers.append((TIER_DOCUMENTO, {"busca_documentos": documento}))
+    if nome:
+        prefixo = re.compile("^" + re.escape(nome))
+        tiers.append((TIER_NOME, {"busca_nome": prefixo}))
+        palavras = nome.split()
+        tiers.append((TIER_PALAVRA, {
+            "$and": [{"busca_tokens": re.compile("^" + re.escape(palavra))} for palavra in palavras],
+            "busca_nome": {"$not": prefixo},
+        }))
+    return tiers
+
+
+def encode_cursor(tier: int, nome: str, funcionario_id: str) -> str:
+    raw = json.dumps([tier, nome, funcionario_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str, str]:
+    """Raises ValueError on anything that is not a cursor from `encode_cursor`."""
+    try:
+        tier, nome, funcionario_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
+    if not isinstance(tier, int) or not isinstance(nome, str) or not isinstance(funcionario_id, str):
+        raise ValueError("Cursor inválido")
+    return tier, nome, funcionario_id
+
+
+async def search_funcionarios(db, q: str, limit: int, after: Optional[str] = None, projection: Optional[dict] = None):
+    """Return (documents, next_cursor) for one page of ranked results.
+
+    Documents get a `relevancia` key (0 = document match, 1 = name prefix,
+    2 = word prefix). Raises ValueError for a malformed `after`.
+    """
+    start_tier, start_nome, start_id = decode_cursor(after) if after else (TIER_DOCUMENTO, None, None)
+    projection = {**(projection or {"_id": 0}), "busca_nome": 1, "id": 1}
+    resultados = []
+    for tier, query in search_tiers(q):
+        if tier < start_tier:
+            continue
+        if tier == start_tier and after:
+            query = {"$and": [query, {"$or": [
+                {"busca_nome": {"$gt": start_nome}},
+                {"busca_nome": start_nome, "id": {"$gt": start_id}},
+            ]}]}
+        restante = limit + 1 - len(resultados)
+        cursor = db.funcionarios.find(query, projection).sort([("busca_nome", 1), ("id", 1)]).limit(restante)
+        resultados.extend([(tier, documento) async for documento in cursor])
+        if len(resultados) > limit:
+            break
+
+    next_cursor = None
+    if len(resultados) > limit:
+        resultados = resultados[:limit]
+        tier, ultimo = resultados[-1]
+        next_cursor = encode_cursor(tier, ultimo["busca_nome"], ultimo["id"])
+    documentos = []
+    for tier, documento in resultados:
+        documento.pop("busca_nome")
+        documento["relevancia"] = tier
+        documentos.append(documento)
+    return documentos, next_cursor
+
+
+async def reindex(db) -> int:
+    """Recompute the search keys of every funcionario; returns how many changed."""
+    campos = {"_id": 0, "id": 1, "nome": 1, **{field: 1 for field in DOCUMENT_FIELDS + SEARCH_FIELDS}}
+    operations = []
+    alterados = 0
+    async for funcionario in db.funcionarios.find({}, campos):
+        chaves = search_fields(funcionario)
+        if all(funcionario.get(field) == value for field, value in chaves.items()):
+            continue
+        operations.append(UpdateOne({"id": funcionario["id"]}, {"$set": chaves}))
+        if len(operations) >= WRITE_BATCH_SIZE:
+            alterados += (await db.funcionarios.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        alterados += (await db.funcionarios.bulk_write(operations, ordered=False)).modified_count
+    logger.info("Chaves de busca atualizadas em %d funcionários", alterados)
+    return alterados
+
+
+if __name__ == "__main__":
+    import typer
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli = typer.Typer()
+
+    @cli.command("reindex")
+    def reindex_command():
+        """Backfill busca_nome/busca_tokens/busca_documentos on every funcionario."""
+        async def run():
+            client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+            try:
+                return await reindex(client[os.environ['DB_NAME']])
+            finally:
+                client.close()
+
+        typer.echo(f"{asyncio.run(run())} funcionários atualizados")
+
+    @cli.callback()
+    def main():
+        """Funcionario search maintenance."""
+
+    cli()
@@ -1,22 +1,66 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import json
+import csv
+import io
+import asyncio
+import hashlib
 import logging
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, Generic, List, Optional, TypeVar, Union
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import uuid
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from enum import Enum
 
+import orjson
+
+import analytics
+import arquivamento
+import codec
+import folha
+import idempotencia
+import importacao
+import metrics
+import ponto
+import rollups
+import search
+import writebehind
+from cache import LeaderElection, LRUCache, TTLCache, backend_from_url
+from events import EventBus, change_streams_available, relay_change_stream, stream_events
+from indexes import ensure_indexes
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
+# Optional pool settings from .env, passed through only when set
+MONGO_POOL_OPTIONS = {
+    'maxPoolSize': 'MONGO_MAX_POOL_SIZE',
+    'minPoolSize': 'MONGO_MIN_POOL_SIZE',
+    'maxIdleTimeMS': 'MONGO_MAX_IDLE_TIME_MS',
+    'waitQueueTimeoutMS': 'MONGO_WAIT_QUEUE_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'MONGO_SERVER_SELECTION_TIMEOUT_MS',
+    'connectTimeoutMS': 'MONGO_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGO_SOCKET_TIMEOUT_MS',
+}
+mongo_options = {
+    option: int(os.environ[variable])
+    for option, variable in MONGO_POOL_OPTIONS.items()
+    if os.environ.get(variable)
+}
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.mongo_listener], **mongo_options)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -44,6 +88,18 @@ class TipoFalta(str, Enum):
     JUSTIFICADA = "Justificada"
     NAO_JUSTIFICADA = "Não Justificada"
 
+class TipoMarcacao(str, Enum):
+    ENTRADA = "Entrada"
+    SAIDA = "Saída"
+
+class StatusDia(str, Enum):
+    PRESENTE = "Presente"
+    FALTA_JUSTIFICADA = "Falta Justificada"
+    FALTA_NAO_JUSTIFICADA = "Falta Não Justificada"
+    ATESTADO = "Atestado"
+    LICENCA = "Licença"
+    SEM_REGISTRO = "Sem Registro"
+
 class TipoLicenca(str, Enum):
     MATERNIDADE = "Maternidade"
     PATERNIDADE = "Paternidade"
@@ -129,6 +185,8 @@ class RegistroPresenca(BaseModel):
     presente: bool
     tipo_falta: Optional[TipoFalta] = None
     observacoes: Optional[str] = None
+    # "ponto" when derived from punches by /ponto/consolidar; manual writes clear it
+    origem: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Atestado(BaseModel):
@@ -246,40 +304,512 @@ class DashboardStats(BaseModel):
     funcionarios_ausentes_hoje: int
     atestados_ativos: int
 
+# Status
+class StatusFuncionarioDia(BaseModel):
+    data: date
+    status: StatusDia
+    referencia_id: Optional[str] = None  # registro, atestado or licença that decided the status
+
+class StatusFuncionario(BaseModel):
+    funcionario_id: str
+    nome: str
+    cliente_id: str
+    posto_alocacao: str
+    dias: List[StatusFuncionarioDia]
+
+# Relatórios
+class RollupPresenca(BaseModel):
+    cliente_id: Optional[str] = None
+    posto_alocacao: Optional[str] = None
+    data: date
+    presentes: int = 0
+    faltas_justificadas: int = 0
+    faltas_nao_justificadas: int = 0
+    atestados: int = 0
+    licencas: int = 0
+
+class RelatorioPresenca(BaseModel):
+    data_inicio: date
+    data_fim: date
+    totais: Dict[str, int]
+    dias: List[RollupPresenca]
+
+# Analytics
+class IndicadoresAbsenteismo(BaseModel):
+    grupo: Optional[str] = None  # cliente_id, posto_alocacao or funcao_id
+    funcionarios: int
+    dias: int
+    presentes: int
+    faltas_justificadas: int
+    faltas_nao_justificadas: int
+    dias_atestado: int
+    dias_licenca: int
+    taxa_absenteismo: float  # (faltas + dias de atestado) / dias fora de licença
+    max_sequencia_faltas: int
+    sequencias_faltas: int  # runs of 2+ consecutive unjustified absences
+
+class CidFrequente(BaseModel):
+    cid: str
+    atestados: int
+    dias: int
+
+class RelatorioAbsenteismo(BaseModel):
+    data_inicio: date
+    data_fim: date
+    cliente_id: Optional[str] = None
+    totais: Optional[IndicadoresAbsenteismo] = None
+    por_cliente: List[IndicadoresAbsenteismo]
+    por_posto: List[IndicadoresAbsenteismo]
+    por_funcao: List[IndicadoresAbsenteismo]
+    top_cids: List[CidFrequente]
+
+# Folha de ponto
+class TotaisFolha(BaseModel):
+    presentes: int = 0
+    faltas_justificadas: int = 0
+    faltas_nao_justificadas: int = 0
+    dias_atestado: int = 0
+    dias_licenca: int = 0
+    dias_licenca_por_tipo: Dict[TipoLicenca, int] = {}
+    sem_registro: int = 0
+
+class FolhaFuncionario(BaseModel):
+    id: str
+    ano: int
+    mes: int
+    funcionario_id: str
+    nome: Optional[str] = None
+    cliente_id: Optional[str] = None
+    posto_alocacao: Optional[str] = None
+    dias: List[StatusFuncionarioDia]
+    totais: TotaisFolha
+    created_at: datetime
+
+class FolhaResumo(BaseModel):
+    ano: int
+    mes: int
+    funcionarios: int
+    clientes: int
+    gerado_em: datetime
+    duracao_segundos: float
+
+# Bulk ingestion
+BULK_BATCH_SIZE = 1000
+MAX_BULK_ROWS = 10000
+# Yielded by read_bulk_rows in place of the first NDJSON row past MAX_BULK_ROWS
+BULK_LIMIT_REACHED = object()
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+class BulkRowResult(BaseModel):
+    index: int
+    status: str  # created | updated | duplicate | kept | error
+    id: Optional[str] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+class BulkResult(BaseModel):
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    results: List[BulkRowResult] = []
+
+# Spreadsheet import of funcionarios
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_ROWS = int(os.environ.get("MAX_IMPORT_ROWS", "10000"))
+IMPORT_FIELDS = {name: field.annotation for name, field in FuncionarioCreate.model_fields.items()}
+FUNCIONARIO_REFERENCES = (
+    ("funcao_id", "funcoes", "Função não encontrada"),
+    ("empresa_id", "empresas", "Empresa não encontrada"),
+    ("cliente_id", "clientes", "Cliente não encontrado"),
+)
+
+class ImportResult(BaseModel):
+    """`index` of each result is the spreadsheet row number (header is row 1)."""
+    created: int = 0
+    duplicate: int = 0
+    failed: int = 0
+    results: List[BulkRowResult] = []
+
+# Ponto eletrônico
+class MarcacaoPontoCreate(BaseModel):
+    funcionario_id: str
+    registrado_em: datetime  # without a UTC offset, local time in PONTO_TIMEZONE
+    tipo: Optional[TipoMarcacao] = None  # untyped punches alternate entrada/saída
+    dispositivo_id: Optional[str] = None
+    posto_alocacao: Optional[str] = None
+
+class MarcacoesResult(BaseModel):
+    aceitas: int = 0
+    rejeitadas: int = 0
+    erros: List[BulkRowResult] = []  # rejected rows only; accepted punches carry no id
+
+class TurnoPonto(BaseModel):
+    entrada: Optional[datetime] = None
+    saida: Optional[datetime] = None
+
+class JornadaPonto(BaseModel):
+    id: str
+    funcionario_id: str
+    data: date
+    turnos: List[TurnoPonto]
+    minutos_trabalhados: int
+    incompleta: bool  # some shift lacks its entrada or saída
+    created_at: datetime
+
+class ConsolidacaoPonto(BaseModel):
+    data_inicio: date
+    data_fim: date
+    jornadas: int
+    presencas_criadas: int
+    presencas_atualizadas: int
+    presencas_mantidas: int  # days that already had a record entered by hand
+    presencas_com_erro: int
+
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+T = TypeVar("T")
+
+# List routes answer a JSON array, as before pagination; the cursor of the
+# next page, if any, goes in this header (pass it back as `after`)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+def parse_fields(model, fields: Optional[str]) -> Optional[List[str]]:
+    """Validate a `fields=a,b,c` projection against the model; `id` is always kept."""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconhecidos: {', '.join(unknown)}")
+    return ["id"] + [field for field in requested if field != "id"]
+
+@lru_cache(maxsize=None)
+def stored_defaults(model) -> Dict[str, Any]:
+    """Static defaults of `model`, for documents written before a field existed."""
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+def cursor_headers(next_cursor: Optional[str]) -> Dict[str, str]:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+def page_response(page: Page) -> ORJSONResponse:
+    """Encode a page of stored documents directly, skipping response_model validation."""
+    return ORJSONResponse(page.items, headers=cursor_headers(page.next_cursor))
+
+async def build_query(
+    date_field: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    cliente_id: Optional[str] = None,
+    by_funcionario: bool = False,
+    **equals,
+) -> dict:
+    """Mongo filter shared by list and export routes.
+
+    `cliente_id` is matched directly, or through the client's funcionario
+    ids when the collection is keyed by `funcionario_id` (`by_funcionario`).
+    """
+    query = {field: value for field, value in equals.items() if value is not None}
+    if date_field and (data_inicio or data_fim):
+        query[date_field] = codec.date_range(data_inicio, data_fim)
+    if cliente_id:
+        if by_funcionario:
+            funcionario_ids = await db.funcionarios.distinct("id", {"cliente_id": cliente_id})
+            if "funcionario_id" in query:
+                funcionario_ids = [fid for fid in funcionario_ids if fid == query["funcionario_id"]]
+            query["funcionario_id"] = {"$in": funcionario_ids}
+        else:
+            query["cliente_id"] = cliente_id
+    return query
+
+async def paginate(
+    collection,
+    model,
+    after: Optional[str],
+    limit: int,
+    query: Optional[dict] = None,
+    fields: Optional[List[str]] = None,
+    tiers: Optional[list] = None,
+):
+    """Keyset pagination over (created_at, id).
+
+    `after` is the id of the last item of the previous page. Each page is a
+    bounded index scan instead of a full `find().to_list()`. With `tiers`
+    (`collection` plus archive collections, see list_tiers) each tier is
+    scanned for one page and the results are merged.
+
+    Stored documents were validated on write, so they are returned as
+    plain dicts: the projection keeps only model fields (or `fields`),
+    missing optional fields get their defaults and BSON dates of calendar
+    fields come back as dates.
+    """
+    query = dict(query or {})
+    tiers = tiers or [collection]
+    if after:
+        anchor = None
+        for tier in tiers:
+            anchor = await tier.find_one({"id": after}, {"_id": 0, "created_at": 1})
+            if anchor:
+                break
+        if not anchor:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query["$or"] = [
+            {"created_at": {"$gt": anchor["created_at"]}},
+            {"created_at": anchor["created_at"], "id": {"$gt": after}},
+        ]
+    fields = fields or list(model.model_fields)
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    if len(tiers) == 1:
+        cursor = collection.find(query, projection).sort([("created_at", 1), ("id", 1)]).limit(limit + 1)
+        documents = await cursor.to_list(limit + 1)
+    else:
+        pages = await asyncio.gather(*(
+            tier.find(query, {**projection, "created_at": 1}).sort([("created_at", 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+            for tier in tiers
+        ))
+        unicos = {document["id"]: document for page in pages for document in page}  # mid-archival copies
+        documents = sorted(unicos.values(), key=lambda document: (document["created_at"], document["id"]))[:limit + 1]
+        if "created_at" not in fields:
+            for document in documents:
+                document.pop("created_at", None)
+    documents = [codec.decode(collection.name, document) for document in documents]
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = documents[-1]["id"]
+    defaults = {name: value for name, value in stored_defaults(model).items() if name in projection}
+    if defaults:
+        documents = [{**defaults, **document} for document in documents]
+    return Page.model_construct(items=documents, next_cursor=next_cursor)
+
+async def list_tiers(colecao: str, data_inicio: Optional[date], data_fim: Optional[date]) -> list:
+    """Collections a list route reads: archive tiers only when `data_inicio` reaches archived months.
+
+    Lists without `data_inicio` cover the hot tier, i.e. the last
+    ARQUIVO_MESES_QUENTES months once `arquivamento.py arquivar` has run.
+    """
+    if data_inicio is None:
+        return [db[colecao]]
+    return await arquivamento.tiers(db, colecao, data_inicio, data_fim)
+
+# Reference expansion (?expand=)
+# name -> (reference field, collection, fields inlined); summaries keep pages small
+EXPANSIONS = {
+    "funcao": ("funcao_id", "funcoes", ("id", "nome", "cbo")),
+    "cliente": ("cliente_id", "clientes", ("id", "razao_social", "cnpj", "cidade", "estado")),
+    "empresa": ("empresa_id", "empresas", ("id", "razao_social", "cnpj")),
+    "funcionario": (
+        "funcionario_id", "funcionarios",
+        ("id", "nome", "cpf", "matricula_esocial", "funcao_id", "cliente_id", "posto_alocacao"),
+    ),
+}
+FUNCIONARIO_EXPANSIONS = ("funcao", "cliente", "empresa")
+REGISTRO_EXPANSIONS = ("funcionario",)
+
+def parse_expand(allowed, expand: Optional[str], fields: Optional[List[str]]):
+    """Validate `expand=a,b`; returns the names and `fields` plus the reference fields they need."""
+    if not expand:
+        return [], fields
+    names = list(dict.fromkeys(name.strip() for name in expand.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expansões desconhecidas: {', '.join(unknown)} (disponíveis: {', '.join(allowed)})",
+        )
+    if fields:
+        fields = fields + [EXPANSIONS[name][0] for name in names if EXPANSIONS[name][0] not in fields]
+    return names, fields
+
+async def expand_references(documents: List[dict], names: List[str]) -> List[dict]:
+    """Inline referenced documents with one `$in` query per referenced collection.
+
+    Each expansion is stored under its name (`funcao`, `cliente`, ...), or
+    None when the reference is dangling.
+    """
+    async def load(name):
+        field, collection_name, campos = EXPANSIONS[name]
+        ids = list({document[field] for document in documents if document.get(field)})
+        if not ids:
+            return name, {}
+        cursor = db[collection_name].find({"id": {"$in": ids}}, {"_id": 0, **{campo: 1 for campo in campos}})
+        return name, {referencia["id"]: referencia async for referencia in cursor}
+
+    carregados = dict(await asyncio.gather(*(load(name) for name in names)))
+    for document in documents:
+        for name in names:
+            document[name] = carregados[name].get(document.get(EXPANSIONS[name][0]))
+    return documents
+
+# Caching (shared across workers when CACHE_URL points at Redis)
+cache_backend = backend_from_url(os.environ.get('CACHE_URL'))
+leader = LeaderElection(cache_backend, ttl=float(os.environ.get('LEADER_LOCK_TTL', '30')))
+dashboard_cache = TTLCache(cache_backend, "dashboard", ttl=float(os.environ.get('DASHBOARD_CACHE_TTL', '5')))
+analytics_cache = TTLCache(cache_backend, "absenteismo", ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', '300')))
+# arquivado_ate for the presença write paths, off the catalog collection
+arquivo_cache = arquivamento.catalog_cache(cache_backend)
+
+# Reference data (empresas, clientes, funções): versioned, conditional GETs
+reference_bodies = LRUCache(int(os.environ.get('REFERENCE_CACHE_SIZE', '256')))
+
+async def collection_version(name: str):
+    """(version, last-modified epoch) of a collection, shared across workers.
+
+    A fresh backend starts the counter at the current time in ms, so versions
+    (and ETags) never repeat across restarts of an in-memory backend.
+    """
+    versao = await cache_backend.get(f"versao:{name}")
+    modificado = await cache_backend.get(f"modificado:{name}")
+    if versao is None or modificado is None:
+        agora = time.time()
+        await cache_backend.set(f"versao:{name}", str(int(agora * 1000)), nx=True)
+        await cache_backend.set(f"modificado:{name}", str(agora), nx=True)
+        versao = await cache_backend.get(f"versao:{name}")
+        modificado = await cache_backend.get(f"modificado:{name}")
+    return int(versao), float(modificado)
+
+async def bump_version(name: str):
+    """Mark a collection as changed.
+
+    Call after the write reached Mongo: bumping first could cache a body read
+    before the write under the new version.
+    """
+    await collection_version(name)
+    await cache_backend.incr(f"versao:{name}")
+    await cache_backend.set(f"modificado:{name}", str(time.time()))
+
+def not_modified(request: Request, etag: str, modificado: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modificado) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def reference_page(request: Request, collection, model, after: Optional[str], limit: int, fields: Optional[List[str]]):
+    """Page of a rarely-changing collection with ETag/Last-Modified.
+
+    A matching `If-None-Match` gets a 304 without touching Mongo; otherwise
+    the encoded body comes from an LRU keyed by collection version and query.
+    """
+    versao, modificado = await collection_version(collection.name)
+    consulta = (after, limit, tuple(fields) if fields else None)
+    etag = '"{}-{}-{}"'.format(collection.name, versao, hashlib.sha1(repr(consulta).encode()).hexdigest()[:12])
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modificado, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if not_modified(request, etag, modificado):
+        return Response(status_code=304, headers=headers)
+    chave = (collection.name, versao) + consulta
+    cached = reference_bodies.get(chave)
+    if cached is None:
+        page = await paginate(collection, model, after, limit, fields=fields)
+        cached = (orjson.dumps(page.items), page.next_cursor)
+        reference_bodies.put(chave, cached)
+    body, next_cursor = cached
+    return Response(body, media_type="application/json", headers={**headers, **cursor_headers(next_cursor)})
+
+# Change feed: create handlers publish here, /api/eventos streams it
+event_bus = EventBus()
+FEED_COLLECTIONS = ("empresas", "clientes", "funcoes", "funcionarios", "registros_presenca", "atestados", "licencas")
+DASHBOARD_COLLECTIONS = {"empresas", "clientes", "funcionarios", "registros_presenca", "atestados"}
+DASHBOARD_PUSH_DELAY = float(os.environ.get('DASHBOARD_PUSH_DELAY', '1'))
+# True when a Mongo change stream feeds the bus; handlers then stay silent
+app.state.change_stream = False
+
+def publish_created(colecao: str, documento: dict):
+    if not app.state.change_stream:
+        event_bus.publish({
+            "tipo": "criado",
+            "colecao": colecao,
+            "documento": {key: value for key, value in documento.items() if key != "_id"},
+        })
+
+async def push_dashboard():
+    """Publish fresh dashboard counters after writes, one push per burst."""
+    subscription = event_bus.subscribe()
+    try:
+        while True:
+            _, event = await subscription.queue.get()
+            if event.get("colecao") not in DASHBOARD_COLLECTIONS and event["tipo"] != "ressincronizar":
+                continue
+            await asyncio.sleep(DASHBOARD_PUSH_DELAY)
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.overflowed = False
+            if event_bus.subscribers <= 1:
+                continue
+            try:
+                event_bus.publish({"tipo": "dashboard", "dados": await cached_dashboard_stats()})
+            except Exception:
+                logger.exception("Falha ao publicar o dashboard")
+    finally:
+        event_bus.unsubscribe(subscription)
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Sistema de Terceirização de Serviços"}
 
+async def compute_dashboard_stats(hoje: date) -> DashboardStats:
+    async def presenca_hoje():
+        # Present and absent counts in one pass over the (data, presente) index
+        grupos = await db.registros_presenca.aggregate([
+            {"$match": {"data": codec.bson_date(hoje)}},
+            {"$group": {"_id": "$presente", "total": {"$sum": 1}}},
+        ]).to_list(None)
+        contagem = {grupo["_id"]: grupo["total"] for grupo in grupos}
+        return contagem.get(True, 0), contagem.get(False, 0)
+
+    (
+        total_funcionarios,
+        total_clientes,
+        total_empresas,
+        (funcionarios_presentes_hoje, funcionarios_ausentes_hoje),
+        atestados_ativos,
+    ) = await asyncio.gather(
+        db.funcionarios.estimated_document_count(),
+        db.clientes.estimated_document_count(),
+        db.empresas.estimated_document_count(),
+        presenca_hoje(),
+        db.atestados.count_documents(atestado_overlap(hoje, hoje)),
+    )
+    return DashboardStats(
+        total_funcionarios=total_funcionarios,
+        total_clientes=total_clientes,
+        total_empresas=total_empresas,
+        funcionarios_presentes_hoje=funcionarios_presentes_hoje,
+        funcionarios_ausentes_hoje=funcionarios_ausentes_hoje,
+        atestados_ativos=atestados_ativos
+    )
+
+async def cached_dashboard_stats() -> dict:
+    hoje = date.today()
+
+    async def load():
+        return (await compute_dashboard_stats(hoje)).model_dump()
+
+    return await dashboard_cache.get_or_load(hoje.isoformat(), load)
+
 @api_router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats():
     try:
-        total_funcionarios = await db.funcionarios.count_documents({})
-        total_clientes = await db.clientes.count_documents({})
-        total_empresas = await db.empresas.count_documents({})
-        
-        hoje = date.today()
-        funcionarios_presentes_hoje = await db.registros_presenca.count_documents({
-            "data": hoje.isoformat(),
-            "presente": True
-        })
-        funcionarios_ausentes_hoje = await db.registros_presenca.count_documents({
-            "data": hoje.isoformat(),
-            "presente": False
-        })
-        
-        atestados_ativos = await db.atestados.count_documents({
-            "data_retorno_prevista": {"$gte": hoje.isoformat()}
-        })
-        
-        return DashboardStats(
-            total_funcionarios=total_funcionarios,
-            total_clientes=total_clientes,
-            total_empresas=total_empresas,
-            funcionarios_presentes_hoje=funcionarios_presentes_hoje,
-            funcionarios_ausentes_hoje=funcionarios_ausentes_hoje,
-            atestados_ativos=atestados_ativos
-        )
+        return await cached_dashboard_stats()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -287,17 +817,27 @@ async def get_dashboard_stats():
 @api_router.post("/empresas", response_model=Empresa)
 async def create_empresa(empresa: EmpresaCreate):
     try:
-        empresa_obj = Empresa(**empresa.dict())
-        await db.empresas.insert_one(empresa_obj.dict())
+        empresa_obj = Empresa(**empresa.model_dump())
+        documento = empresa_obj.model_dump()
+        await db.empresas.insert_one(documento)
+        await bump_version("empresas")
+        publish_created("empresas", documento)
+        await dashboard_cache.invalidate()
         return empresa_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/empresas", response_model=List[Empresa])
-async def get_empresas():
+@api_router.get("/empresas", response_model=Union[List[Empresa], List[Dict[str, Any]]])
+async def get_empresas(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
     try:
-        empresas = await db.empresas.find().to_list(1000)
-        return [Empresa(**empresa) for empresa in empresas]
+        return await reference_page(request, db.empresas, Empresa, after, limit, parse_fields(Empresa, fields))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -305,17 +845,27 @@ async def get_empresas():
 @api_router.post("/clientes", response_model=Cliente)
 async def create_cliente(cliente: ClienteCreate):
     try:
-        cliente_obj = Cliente(**cliente.dict())
-        await db.clientes.insert_one(cliente_obj.dict())
+        cliente_obj = Cliente(**cliente.model_dump())
+        documento = cliente_obj.model_dump()
+        await db.clientes.insert_one(documento)
+        await bump_version("clientes")
+        publish_created("clientes", documento)
+        await dashboard_cache.invalidate()
         return cliente_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/clientes", response_model=List[Cliente])
-async def get_clientes():
+@api_router.get("/clientes", response_model=Union[List[Cliente], List[Dict[str, Any]]])
+async def get_clientes(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
     try:
-        clientes = await db.clientes.find().to_list(1000)
-        return [Cliente(**cliente) for cliente in clientes]
+        return await reference_page(request, db.clientes, Cliente, after, limit, parse_fields(Cliente, fields))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -323,17 +873,26 @@ async def get_clientes():
 @api_router.post("/funcoes", response_model=Funcao)
 async def create_funcao(funcao: FuncaoCreate):
     try:
-        funcao_obj = Funcao(**funcao.dict())
-        await db.funcoes.insert_one(funcao_obj.dict())
+        funcao_obj = Funcao(**funcao.model_dump())
+        documento = funcao_obj.model_dump()
+        await db.funcoes.insert_one(documento)
+        await bump_version("funcoes")
+        publish_created("funcoes", documento)
         return funcao_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/funcoes", response_model=List[Funcao])
-async def get_funcoes():
+@api_router.get("/funcoes", response_model=Union[List[Funcao], List[Dict[str, Any]]])
+async def get_funcoes(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
     try:
-        funcoes = await db.funcoes.find().to_list(1000)
-        return [Funcao(**funcao) for funcao in funcoes]
+        return await reference_page(request, db.funcoes, Funcao, after, limit, parse_fields(Funcao, fields))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -341,55 +900,624 @@ async def get_funcoes():
 @api_router.post("/funcionarios", response_model=Funcionario)
 async def create_funcionario(funcionario: FuncionarioCreate):
     try:
-        funcionario_obj = Funcionario(**funcionario.dict())
-        # Convert date objects to strings for MongoDB storage
-        funcionario_dict = funcionario_obj.dict()
-        for key, value in funcionario_dict.items():
-            if isinstance(value, date):
-                funcionario_dict[key] = value.isoformat()
-        await db.funcionarios.insert_one(funcionario_dict)
+        funcionario_obj = Funcionario(**funcionario.model_dump())
+        funcionario_dict = funcionario_obj.model_dump()
+        await db.funcionarios.insert_one({**codec.encode(funcionario_dict), **search.search_fields(funcionario_dict)})
+        publish_created("funcionarios", funcionario_dict)
+        await dashboard_cache.invalidate()
+        await analytics_cache.invalidate()
         return funcionario_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/funcionarios", response_model=List[Funcionario])
-async def get_funcionarios():
+@api_router.get("/funcionarios", response_model=Union[List[Funcionario], List[Dict[str, Any]]])
+async def get_funcionarios(
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cliente_id: Optional[str] = None,
+    empresa_id: Optional[str] = None,
+    funcao_id: Optional[str] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    try:
+        expansoes, campos = parse_expand(FUNCIONARIO_EXPANSIONS, expand, parse_fields(Funcionario, fields))
+        query = await build_query(cliente_id=cliente_id, empresa_id=empresa_id, funcao_id=funcao_id)
+        page = await paginate(db.funcionarios, Funcionario, after, limit, query, campos)
+        if expansoes:
+            await expand_references(page.items, expansoes)
+        return page_response(page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Status dos funcionários
+MAX_STATUS_DIAS = 31
+
+def atestado_overlap(inicio: date, fim: date) -> dict:
+    """Atestados covering any day in [inicio, fim]; the return day is a working day."""
+    return {
+        "data_retorno_prevista": {"$gt": codec.bson_date(inicio)},
+        "data_emissao": {"$lte": codec.bson_date(fim)},
+    }
+
+def licenca_overlap(inicio: date, fim: date) -> dict:
+    return {
+        "data_fim": {"$gte": codec.bson_date(inicio)},
+        "data_inicio": {"$lte": codec.bson_date(fim)},
+    }
+
+async def funcionarios_ausentes(inicio: date, fim: date) -> set:
+    """Ids of everyone on atestado, licença or with a falta in the period.
+
+    Each collection is hit with one range query on its interval index.
+    """
+    periodo = codec.date_range(inicio, fim)
+    atestados, licencas, faltas = await asyncio.gather(
+        arquivamento.distinct(db, "atestados", "funcionario_id", atestado_overlap(inicio, fim), inicio, fim),
+        arquivamento.distinct(db, "licencas", "funcionario_id", licenca_overlap(inicio, fim), inicio, fim),
+        arquivamento.distinct(db, "registros_presenca", "funcionario_id", {"data": periodo, "presente": False}, inicio, fim),
+    )
+    return atestados | licencas | faltas
+
+async def resolve_status(funcionario_ids: List[str], inicio: date, fim: date) -> Dict[str, Dict[str, StatusFuncionarioDia]]:
+    """Effective status per funcionario and day.
+
+    Licença outranks atestado, which outranks the day's presence record.
+    """
+    ids = {"$in": funcionario_ids}
+    periodo = codec.date_range(inicio, fim)
+    async def carregar(colecao, query, projection):
+        return [documento async for documento in arquivamento.find(db, colecao, query, projection, inicio, fim)]
+
+    registros, atestados, licencas = await asyncio.gather(
+        carregar(
+            "registros_presenca", {"funcionario_id": ids, "data": periodo},
+            {"_id": 0, "id": 1, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1},
+        ),
+        carregar("atestados", {"funcionario_id": ids, **atestado_overlap(inicio, fim)}, {"_id": 0}),
+        carregar("licencas", {"funcionario_id": ids, **licenca_overlap(inicio, fim)}, {"_id": 0}),
+    )
+    status = {funcionario_id: {} for funcionario_id in funcionario_ids}
+
+    def marcar(funcionario_id, dia, valor, referencia_id):
+        status[funcionario_id][dia] = StatusFuncionarioDia(data=dia, status=valor, referencia_id=referencia_id)
+
+    por_contador = {
+        "presentes": StatusDia.PRESENTE,
+        "faltas_justificadas": StatusDia.FALTA_JUSTIFICADA,
+        "faltas_nao_justificadas": StatusDia.FALTA_NAO_JUSTIFICADA,
+    }
+    for registro in registros:
+        marcar(registro["funcionario_id"], codec.as_date(registro["data"]), por_contador[rollups.presenca_counter(registro)], registro["id"])
+    for documentos, days_of, valor in (
+        (atestados, rollups.atestado_days, StatusDia.ATESTADO),
+        (licencas, rollups.licenca_days, StatusDia.LICENCA),
+    ):
+        for documento in documentos:
+            for dia in rollups.days_between(*days_of(documento), inicio, fim):
+                marcar(documento["funcionario_id"], dia, valor, documento["id"])
+    return status
+
+@api_router.get("/funcionarios/status", response_model=List[StatusFuncionario])
+async def get_status_funcionarios(
+    response: Response,
+    data: Optional[date] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    cliente_id: Optional[str] = None,
+    ausentes: bool = False,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Who is present, absent, on atestado or on licença, per day.
+
+    Pass `data` (default today) or a `data_inicio`/`data_fim` range. With
+    `ausentes=true` only funcionarios out on some day of the period are
+    listed. Funcionarios are paginated like `/funcionarios`.
+    """
+    if data_inicio or data_fim:
+        inicio, fim = data_inicio or data_fim, data_fim or data_inicio
+    else:
+        inicio = fim = data or date.today()
+    if fim < inicio or (fim - inicio).days >= MAX_STATUS_DIAS:
+        raise HTTPException(status_code=400, detail=f"Período inválido (máximo de {MAX_STATUS_DIAS} dias)")
+    try:
+        query = await build_query(cliente_id=cliente_id)
+        if ausentes:
+            query["id"] = {"$in": list(await funcionarios_ausentes(inicio, fim))}
+        page = await paginate(
+            db.funcionarios, Funcionario, after, limit, query,
+            fields=["id", "nome", "cliente_id", "posto_alocacao"],
+        )
+        status = await resolve_status([funcionario["id"] for funcionario in page.items], inicio, fim)
+        dias = [inicio + timedelta(days=offset) for offset in range((fim - inicio).days + 1)]
+        items = [
+            StatusFuncionario(
+                funcionario_id=funcionario["id"],
+                nome=funcionario["nome"],
+                cliente_id=funcionario["cliente_id"],
+                posto_alocacao=funcionario["posto_alocacao"],
+                dias=[
+                    status[funcionario["id"]].get(dia)
+                    or StatusFuncionarioDia(data=dia, status=StatusDia.SEM_REGISTRO)
+                    for dia in dias
+                ],
+            )
+            for funcionario in page.items
+        ]
+        response.headers.update(cursor_headers(page.next_cursor))
+        return items
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/funcionarios/search", response_model=List[Dict[str, Any]])
+async def search_funcionarios(
+    q: str = Query(..., min_length=2),
+    after: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    """Ranked lookup by CPF/PIS/matrícula/RG (exact) or by name prefix.
+
+    Accents and case are ignored ("joao" finds "João"). Each item carries
+    `relevancia`: 0 document match, 1 name prefix, 2 word prefix.
+    """
     try:
-        funcionarios = await db.funcionarios.find().to_list(1000)
-        return [Funcionario(**funcionario) for funcionario in funcionarios]
+        expansoes, campos = parse_expand(FUNCIONARIO_EXPANSIONS, expand, parse_fields(Funcionario, fields))
+        campos = campos or list(Funcionario.model_fields)
+        documentos, next_cursor = await search.search_funcionarios(
+            db, q, limit, after, {"_id": 0, **{campo: 1 for campo in campos}},
+        )
+        documentos = [codec.decode("funcionarios", documento) for documento in documentos]
+        defaults = {name: value for name, value in stored_defaults(Funcionario).items() if name in campos}
+        if defaults:
+            documentos = [{**defaults, **documento} for documento in documentos]
+        if expansoes:
+            await expand_references(documentos, expansoes)
+        return page_response(Page.model_construct(items=documentos, next_cursor=next_cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/funcionarios/{funcionario_id}", response_model=Funcionario)
-async def get_funcionario(funcionario_id: str):
+async def get_funcionario(funcionario_id: str, expand: Optional[str] = None):
     try:
-        funcionario = await db.funcionarios.find_one({"id": funcionario_id})
+        expansoes, _ = parse_expand(FUNCIONARIO_EXPANSIONS, expand, None)
+        projection = {"_id": 0, **{field: 1 for field in Funcionario.model_fields}}
+        funcionario = await db.funcionarios.find_one({"id": funcionario_id}, projection)
         if not funcionario:
             raise HTTPException(status_code=404, detail="Funcionário não encontrado")
-        return Funcionario(**funcionario)
+        funcionario = {**stored_defaults(Funcionario), **codec.decode("funcionarios", funcionario)}
+        if expansoes:
+            await expand_references([funcionario], expansoes)
+        return ORJSONResponse(funcionario)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Registros de Presença
+# Write-behind (writebehind.py): creates are acknowledged once journaled and reach Mongo in batches
+PRESENCA_WRITE_BEHIND = os.environ.get('PRESENCA_WRITE_BEHIND', 'false').lower() == 'true'
+WRITE_BEHIND_JOURNAL_DIR = Path(os.environ.get('WRITE_BEHIND_JOURNAL_DIR', ROOT_DIR / 'journal'))
+
+async def commit_presencas(documentos: List[dict]):
+    """Insert a write-behind batch on (funcionario_id, data).
+
+    A day already recorded keeps its record, so a replayed journal (or a
+    second create for the same day) changes nothing.
+    """
+    registros = [RegistroPresenca(**documento).model_dump() for documento in documentos]
+    resultado = await db.registros_presenca.bulk_write([
+        UpdateOne(
+            {"funcionario_id": registro["funcionario_id"], "data": codec.same_day(registro["data"])},
+            {"$setOnInsert": codec.encode(registro)},
+            upsert=True,
+        )
+        for registro in registros
+    ], ordered=False)
+    novos = [registros[index] for index in resultado.upserted_ids]
+    if not novos:
+        return
+    for registro in novos:
+        publish_created("registros_presenca", registro)
+    await dashboard_cache.invalidate()
+    await analytics_cache.invalidate()
+    await update_rollups(rollups.apply_presencas(db, novos))
+
+presenca_queue = (
+    writebehind.WriteBehindQueue("presenca", WRITE_BEHIND_JOURNAL_DIR, commit_presencas)
+    if PRESENCA_WRITE_BEHIND else None
+)
+
+async def save_presenca(registro_dict: dict) -> Optional[dict]:
+    """Store the day's record, updating the one already kept for (funcionario_id, data).
+
+    Returns the record it replaced (None on insert); on update `registro_dict`
+    takes the stored id and created_at.
+    """
+    on_insert = {"id": registro_dict["id"], "created_at": registro_dict["created_at"]}
+    fields = {key: value for key, value in codec.encode(registro_dict).items() if key not in on_insert}
+    projection = {"_id": 0, "id": 1, "created_at": 1, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1}
+    for tentativa in range(2):
+        try:
+            anterior = await db.registros_presenca.find_one_and_update(
+                {"funcionario_id": registro_dict["funcionario_id"], "data": codec.same_day(registro_dict["data"])},
+                {"$set": fields, "$setOnInsert": on_insert},
+                projection=projection,
+                upsert=True,
+            )
+            break
+        except DuplicateKeyError:
+            # A concurrent create of the same day won the insert: update that one
+            if tentativa:
+                raise
+    if anterior:
+        registro_dict.update(id=anterior["id"], created_at=anterior["created_at"])
+    return anterior
+
 @api_router.post("/presenca", response_model=RegistroPresenca)
 async def create_registro_presenca(registro: RegistroPresencaCreate):
     try:
-        registro_obj = RegistroPresenca(**registro.dict())
-        # Convert date objects to strings for MongoDB storage
-        registro_dict = registro_obj.dict()
-        for key, value in registro_dict.items():
-            if isinstance(value, date):
-                registro_dict[key] = value.isoformat()
-        await db.registros_presenca.insert_one(registro_dict)
-        return registro_obj
+        arquivado_ate = await arquivamento.archived_until(db, "registros_presenca", arquivo_cache)
+        if arquivado_ate and registro.data < arquivado_ate:
+            raise HTTPException(status_code=409, detail=f"Período arquivado: registros anteriores a {arquivado_ate.isoformat()} não podem ser alterados")
+        registro_obj = RegistroPresenca(**registro.model_dump())
+        if presenca_queue is not None:
+            try:
+                await presenca_queue.enqueue(registro_obj.model_dump(mode="json"))
+            except writebehind.QueueFull as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+            return registro_obj
+        registro_dict = registro_obj.model_dump()
+        anterior = await save_presenca(registro_dict)
+        publish_created("registros_presenca", registro_dict)
+        await dashboard_cache.invalidate()
+        await analytics_cache.invalidate()
+        await update_rollups(rollups.apply_presencas(db, [registro_dict], [anterior] if anterior else []))
+        return RegistroPresenca(**registro_dict)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/presenca", response_model=List[RegistroPresenca])
-async def get_registros_presenca():
+async def read_bulk_rows(request: Request):
+    """Yield (index, row) pairs from a JSON array or an NDJSON stream.
+
+    NDJSON bodies are consumed incrementally; rows that are not valid JSON
+    are yielded as `None` so they show up as errors in the report. An array
+    over MAX_BULK_ROWS is refused (413) before any row is yielded; an NDJSON
+    stream stops at the limit with BULK_LIMIT_REACHED, after the rows
+    before it were already written, so callers report the rest as rejected.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Esperado um array JSON")
+        if len(rows) > MAX_BULK_ROWS:
+            raise HTTPException(status_code=413, detail=f"Máximo de {MAX_BULK_ROWS} registros por requisição")
+        for index, row in enumerate(rows):
+            yield index, row
+        return
+
+    index = 0
+    buffer = b""
+
+    def parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= MAX_BULK_ROWS:
+                yield index, BULK_LIMIT_REACHED
+                return
+            yield index, parse(line)
+            index += 1
+    if buffer.strip():
+        if index >= MAX_BULK_ROWS:
+            yield index, BULK_LIMIT_REACHED
+            return
+        yield index, parse(buffer)
+
+def bulk_limit_error(index: int) -> BulkRowResult:
+    return BulkRowResult(index=index, status="error", errors=[{
+        "loc": [], "msg": f"Limite de {MAX_BULK_ROWS} registros por requisição: este registro e os seguintes não foram processados",
+    }])
+
+def validation_errors(error: ValidationError):
+    return [{"loc": list(err["loc"]), "msg": err["msg"]} for err in error.errors()]
+
+async def upsert_presenca_batch(batch, report: BulkResult, origem: Optional[str] = None):
+    """Validate a batch and upsert it on (funcionario_id, data) with one unordered bulk_write.
+
+    With `origem` (derived rows, e.g. "ponto") only days without a record or
+    whose record has the same origem are written; the others are reported
+    as `kept`.
+    """
+    rows = {}  # (funcionario_id, data) -> (index, document)
+    # Archived days are closed: an upsert would recreate them in the hot tier
+    arquivado_ate = await arquivamento.archived_until(db, "registros_presenca", arquivo_cache)
+    for index, raw in batch:
+        if raw is BULK_LIMIT_REACHED:
+            report.results.append(bulk_limit_error(index))
+            continue
+        if not isinstance(raw, dict):
+            report.results.append(BulkRowResult(index=index, status="error", errors=[{"loc": [], "msg": "Registro deve ser um objeto JSON"}]))
+            continue
+        try:
+            registro_obj = RegistroPresenca(**RegistroPresencaCreate(**raw).model_dump())
+        except ValidationError as e:
+            report.results.append(BulkRowResult(index=index, status="error", errors=validation_errors(e)))
+            continue
+        if arquivado_ate and registro_obj.data < arquivado_ate:
+            report.results.append(BulkRowResult(index=index, status="error", errors=[{"loc": ["data"], "msg": "Período arquivado"}]))
+            continue
+        registro_dict = {**registro_obj.model_dump(), "origem": origem}
+        chave = (registro_dict["funcionario_id"], registro_dict["data"])
+        if chave in rows:
+            # Last row for the same funcionario/day wins, as a retry would
+            report.results.append(BulkRowResult(index=rows[chave][0], status="duplicate"))
+        rows[chave] = (index, registro_dict)
+
+    if not rows:
+        return
+    # Records about to be replaced: their ids for the report, their values for the rollups
+    anteriores = {}
+    projection = {"_id": 0, "id": 1, "funcionario_id": 1, "data": 1, "presente": 1, "tipo_falta": 1, "origem": 1}
+    chaves = [{"funcionario_id": funcionario_id, "data": codec.same_day(data)} for funcionario_id, data in rows]
+    async for registro in db.registros_presenca.find({"$or": chaves}, projection):
+        anteriores[(registro["funcionario_id"], codec.as_date(registro["data"]))] = registro
+    if origem:
+        for chave, registro in anteriores.items():
+            if registro.get("origem") != origem and chave in rows:
+                report.results.append(BulkRowResult(index=rows.pop(chave)[0], status="kept", id=registro["id"]))
+        if not rows:
+            return
+
+    operations = []
+    for (funcionario_id, data), (_, registro_dict) in rows.items():
+        on_insert = {"id": registro_dict["id"], "created_at": registro_dict["created_at"]}
+        fields = {key: value for key, value in codec.encode(registro_dict).items() if key not in on_insert}
+        # same_day also matches (and converts) a record written before codec.py migrate
+        filtro = {"funcionario_id": funcionario_id, "data": codec.same_day(data)}
+        if origem:
+            # A record entered by hand since the read above makes this insert fail (unique day) instead
+            filtro["origem"] = origem
+        operations.append(UpdateOne(filtro, {"$set": fields, "$setOnInsert": on_insert}, upsert=True))
     try:
-        registros = await db.registros_presenca.find().to_list(1000)
-        return [RegistroPresenca(**registro) for registro in registros]
+        result = await db.registros_presenca.bulk_write(operations, ordered=False)
+        upserted = set(result.upserted_ids)
+        write_errors = {}
+    except BulkWriteError as e:
+        upserted = {item["index"] for item in e.details.get("upserted", [])}
+        write_errors = {item["index"]: item for item in e.details.get("writeErrors", [])}
+    # An upsert that lost the insert race to a concurrent write of the same day matches it now
+    corridas = [position for position, erro in write_errors.items() if erro.get("code") == 11000]
+    if corridas:
+        try:
+            await db.registros_presenca.bulk_write([operations[position] for position in corridas], ordered=False)
+            for position in corridas:
+                del write_errors[position]
+        except BulkWriteError as e:
+            falhas = {corridas[item["index"]] for item in e.details.get("writeErrors", [])}
+            for position in set(corridas) - falhas:
+                del write_errors[position]
+    write_errors = {position: erro["errmsg"] for position, erro in write_errors.items()}
+
+    # Rows matched without a prior record were inserted concurrently; fetch their ids
+    concorrentes = [
+        {"funcionario_id": funcionario_id, "data": codec.same_day(data)}
+        for position, (funcionario_id, data) in enumerate(rows)
+        if position not in upserted and position not in write_errors and (funcionario_id, data) not in anteriores
+    ]
+    existing_ids = {chave: registro["id"] for chave, registro in anteriores.items()}
+    if concorrentes:
+        async for registro in db.registros_presenca.find({"$or": concorrentes}, {"_id": 0, "id": 1, "funcionario_id": 1, "data": 1}):
+            existing_ids[(registro["funcionario_id"], codec.as_date(registro["data"]))] = registro["id"]
+
+    novos, substituidos = [], []
+    for position, (chave, (index, registro_dict)) in enumerate(rows.items()):
+        if position in write_errors:
+            report.results.append(BulkRowResult(index=index, status="error", errors=[{"loc": [], "msg": write_errors[position]}]))
+        elif position in upserted:
+            report.results.append(BulkRowResult(index=index, status="created", id=registro_dict["id"]))
+            novos.append(registro_dict)
+        else:
+            report.results.append(BulkRowResult(index=index, status="updated", id=existing_ids.get(chave)))
+            if chave in anteriores:
+                novos.append(registro_dict)
+                substituidos.append(anteriores[chave])
+    await update_rollups(rollups.apply_presencas(db, novos, substituidos))
+
+@api_router.post("/presenca/bulk", response_model=BulkResult)
+async def bulk_registros_presenca(request: Request):
+    """Record a whole roll call in one request.
+
+    Accepts a JSON array or an NDJSON stream (`Content-Type:
+    application/x-ndjson`) of RegistroPresencaCreate. Rows are upserted on
+    (funcionario_id, data), so resending the same payload is safe.
+    """
+    try:
+        report = BulkResult()
+        batch = []
+        async for row in read_bulk_rows(request):
+            batch.append(row)
+            if len(batch) >= BULK_BATCH_SIZE:
+                await upsert_presenca_batch(batch, report)
+                batch = []
+        if batch:
+            await upsert_presenca_batch(batch, report)
+        report.results.sort(key=lambda result: result.index)
+        for result in report.results:
+            if result.status == "created":
+                report.created += 1
+            elif result.status == "updated":
+                report.updated += 1
+            elif result.status == "error":
+                report.failed += 1
+        if report.created or report.updated:
+            await dashboard_cache.invalidate()
+            await analytics_cache.invalidate()
+            if not app.state.change_stream:
+                event_bus.publish({
+                    "tipo": "lote", "colecao": "registros_presenca",
+                    "criados": report.created, "atualizados": report.updated,
+                })
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def import_funcionarios_batch(batch, report: ImportResult, referencias: Dict[str, Dict[str, bool]], cpfs_vistos: set):
+    """Validate a chunk of spreadsheet rows and insert the valid ones with one insert_many.
+
+    `referencias` caches, per reference field, which ids exist; only ids not
+    seen in earlier chunks are looked up, one query per collection.
+    `cpfs_vistos` holds the CPFs already taken by earlier rows of the file.
+    """
+    validos = []  # (linha, FuncionarioCreate)
+    for linha, raw in batch:
+        try:
+            validos.append((linha, FuncionarioCreate(**raw)))
+        except ValidationError as e:
+            report.results.append(BulkRowResult(index=linha, status="error", errors=validation_errors(e)))
+
+    for campo, colecao, _ in FUNCIONARIO_REFERENCES:
+        existentes = referencias.setdefault(campo, {})
+        novos = list({getattr(funcionario, campo) for _, funcionario in validos} - existentes.keys())
+        if novos:
+            encontrados = set(await db[colecao].distinct("id", {"id": {"$in": novos}}))
+            existentes.update({referencia_id: referencia_id in encontrados for referencia_id in novos})
+
+    cpfs = {search.normalize_document(funcionario.cpf) for _, funcionario in validos}
+    cadastrados = set()
+    if cpfs:
+        async for funcionario in db.funcionarios.find({"busca_documentos": {"$in": list(cpfs)}}, {"_id": 0, "cpf": 1}):
+            cadastrados.add(search.normalize_document(funcionario.get("cpf") or ""))
+
+    documentos, linhas = [], []
+    for linha, funcionario in validos:
+        erros = [
+            {"loc": [campo], "msg": mensagem}
+            for campo, _, mensagem in FUNCIONARIO_REFERENCES
+            if not referencias[campo][getattr(funcionario, campo)]
+        ]
+        if erros:
+            report.results.append(BulkRowResult(index=linha, status="error", errors=erros))
+            continue
+        cpf = search.normalize_document(funcionario.cpf)
+        if cpf in cadastrados or cpf in cpfs_vistos:
+            report.results.append(BulkRowResult(index=linha, status="duplicate", errors=[{"loc": ["cpf"], "msg": "CPF já cadastrado"}]))
+            continue
+        cpfs_vistos.add(cpf)
+        funcionario_dict = Funcionario(**funcionario.model_dump()).model_dump()
+        documentos.append({**codec.encode(funcionario_dict), **search.search_fields(funcionario_dict)})
+        linhas.append(linha)
+
+    if not documentos:
+        return
+    try:
+        await db.funcionarios.insert_many(documentos, ordered=False)
+        write_errors = {}
+    except BulkWriteError as e:
+        write_errors = {item["index"]: item["errmsg"] for item in e.details.get("writeErrors", [])}
+    for position, (linha, documento) in enumerate(zip(linhas, documentos)):
+        if position in write_errors:
+            report.results.append(BulkRowResult(index=linha, status="error", errors=[{"loc": [], "msg": write_errors[position]}]))
+        else:
+            report.results.append(BulkRowResult(index=linha, status="created", id=documento["id"]))
+
+@api_router.post("/funcionarios/import", response_model=ImportResult)
+async def import_funcionarios(arquivo: UploadFile = File(...), encoding: str = "utf-8-sig"):
+    """Onboard funcionarios from a CSV (`;` or `,`) or XLSX spreadsheet.
+
+    The header row names the FuncionarioCreate fields (case, accents and
+    spacing ignored); dates may be dd/mm/aaaa. The whole file (at most
+    MAX_IMPORT_ROWS rows) is read before anything is written, so a format
+    error or an oversized file rejects it with nothing inserted. Rows are
+    then validated and inserted in chunks, and the response reports each
+    row as created, duplicate (CPF already registered) or error.
+    """
+    try:
+        report = ImportResult()
+        referencias: Dict[str, Dict[str, bool]] = {}
+        cpfs_vistos = set()
+        linhas = importacao.read_rows(arquivo.file, arquivo.filename, arquivo.content_type, IMPORT_FIELDS, encoding)
+        rows = []
+        for row in linhas:
+            if len(rows) >= MAX_IMPORT_ROWS:
+                linhas.close()
+                raise HTTPException(status_code=413, detail=f"Máximo de {MAX_IMPORT_ROWS} linhas por arquivo")
+            rows.append(row)
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            await import_funcionarios_batch(rows[start:start + IMPORT_BATCH_SIZE], report, referencias, cpfs_vistos)
+        report.results.sort(key=lambda result: result.index)
+        for result in report.results:
+            if result.status == "created":
+                report.created += 1
+            elif result.status == "duplicate":
+                report.duplicate += 1
+            elif result.status == "error":
+                report.failed += 1
+        if report.created:
+            await dashboard_cache.invalidate()
+            await analytics_cache.invalidate()
+            if not app.state.change_stream:
+                event_bus.publish({"tipo": "lote", "colecao": "funcionarios", "criados": report.created})
+        return report
+    except importacao.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/presenca", response_model=Union[List[RegistroPresenca], List[Dict[str, Any]]])
+async def get_registros_presenca(
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    funcionario_id: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    try:
+        expansoes, campos = parse_expand(REGISTRO_EXPANSIONS, expand, parse_fields(RegistroPresenca, fields))
+        query = await build_query(
+            "data", data_inicio, data_fim,
+            funcionario_id=funcionario_id, cliente_id=cliente_id, by_funcionario=True,
+        )
+        page = await paginate(
+            db.registros_presenca, RegistroPresenca, after, limit, query, campos,
+            tiers=await list_tiers("registros_presenca", data_inicio, data_fim),
+        )
+        if expansoes:
+            await expand_references(page.items, expansoes)
+        return page_response(page)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -397,22 +1525,45 @@ async def get_registros_presenca():
 @api_router.post("/atestados", response_model=Atestado)
 async def create_atestado(atestado: AtestadoCreate):
     try:
-        atestado_obj = Atestado(**atestado.dict())
-        # Convert date objects to strings for MongoDB storage
-        atestado_dict = atestado_obj.dict()
-        for key, value in atestado_dict.items():
-            if isinstance(value, date):
-                atestado_dict[key] = value.isoformat()
-        await db.atestados.insert_one(atestado_dict)
+        atestado_obj = Atestado(**atestado.model_dump())
+        atestado_dict = atestado_obj.model_dump()
+        await db.atestados.insert_one(codec.encode(atestado_dict))
+        publish_created("atestados", atestado_dict)
+        await dashboard_cache.invalidate()
+        await analytics_cache.invalidate()
+        await update_rollups(rollups.apply_afastamento(
+            db, atestado_dict["funcionario_id"], *rollups.atestado_days(atestado_dict), "atestados"
+        ))
         return atestado_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/atestados", response_model=List[Atestado])
-async def get_atestados():
+@api_router.get("/atestados", response_model=Union[List[Atestado], List[Dict[str, Any]]])
+async def get_atestados(
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    funcionario_id: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
     try:
-        atestados = await db.atestados.find().to_list(1000)
-        return [Atestado(**atestado) for atestado in atestados]
+        expansoes, campos = parse_expand(REGISTRO_EXPANSIONS, expand, parse_fields(Atestado, fields))
+        query = await build_query(
+            "data_emissao", data_inicio, data_fim,
+            funcionario_id=funcionario_id, cliente_id=cliente_id, by_funcionario=True,
+        )
+        page = await paginate(
+            db.atestados, Atestado, after, limit, query, campos,
+            tiers=await list_tiers("atestados", data_inicio, data_fim),
+        )
+        if expansoes:
+            await expand_references(page.items, expansoes)
+        return page_response(page)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -420,35 +1571,424 @@ async def get_atestados():
 @api_router.post("/licencas", response_model=Licenca)
 async def create_licenca(licenca: LicencaCreate):
     try:
-        licenca_obj = Licenca(**licenca.dict())
-        # Convert date objects to strings for MongoDB storage
-        licenca_dict = licenca_obj.dict()
-        for key, value in licenca_dict.items():
-            if isinstance(value, date):
-                licenca_dict[key] = value.isoformat()
-        await db.licencas.insert_one(licenca_dict)
+        licenca_obj = Licenca(**licenca.model_dump())
+        licenca_dict = licenca_obj.model_dump()
+        await db.licencas.insert_one(codec.encode(licenca_dict))
+        publish_created("licencas", licenca_dict)
+        await analytics_cache.invalidate()
+        await update_rollups(rollups.apply_afastamento(
+            db, licenca_dict["funcionario_id"], *rollups.licenca_days(licenca_dict), "licencas"
+        ))
         return licenca_obj
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/licencas", response_model=List[Licenca])
-async def get_licencas():
+@api_router.get("/licencas", response_model=Union[List[Licenca], List[Dict[str, Any]]])
+async def get_licencas(
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    funcionario_id: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    try:
+        expansoes, campos = parse_expand(REGISTRO_EXPANSIONS, expand, parse_fields(Licenca, fields))
+        query = await build_query(
+            "data_inicio", data_inicio, data_fim,
+            funcionario_id=funcionario_id, cliente_id=cliente_id, by_funcionario=True,
+        )
+        page = await paginate(
+            db.licencas, Licenca, after, limit, query, campos,
+            tiers=await list_tiers("licencas", data_inicio, data_fim),
+        )
+        if expansoes:
+            await expand_references(page.items, expansoes)
+        return page_response(page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Relatórios
+MAX_RELATORIO_DIAS = 366
+
+async def update_rollups(operation):
+    """Rollups are derived data: a failed update is logged, not surfaced.
+
+    `python rollups.py rebuild` recomputes any period that drifted.
+    """
+    try:
+        await operation
+    except Exception:
+        logger.exception("Falha ao atualizar rollups de presença")
+
+@api_router.get("/relatorios/presenca", response_model=RelatorioPresenca)
+async def get_relatorio_presenca(
+    data_inicio: date,
+    data_fim: date,
+    cliente_id: Optional[str] = None,
+    posto_alocacao: Optional[str] = None,
+):
+    """Attendance per day and posto, read only from the daily rollups."""
+    if data_fim < data_inicio or (data_fim - data_inicio).days >= MAX_RELATORIO_DIAS:
+        raise HTTPException(status_code=400, detail=f"Período inválido (máximo de {MAX_RELATORIO_DIAS} dias)")
+    try:
+        query = await build_query(
+            "data", data_inicio, data_fim,
+            cliente_id=cliente_id, posto_alocacao=posto_alocacao,
+        )
+        cursor = db[rollups.COLLECTION].find(query, {"_id": 0}).sort([("data", 1), ("cliente_id", 1), ("posto_alocacao", 1)])
+        dias = [RollupPresenca(**codec.decode(rollups.COLLECTION, rollup)) async for rollup in cursor]
+        totais = {counter: sum(getattr(dia, counter) for dia in dias) for counter in rollups.COUNTERS}
+        return RelatorioPresenca(data_inicio=data_inicio, data_fim=data_fim, totais=totais, dias=dias)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Analytics
+MAX_ANALYTICS_DIAS = 366
+
+@api_router.get("/analytics/absenteismo", response_model=RelatorioAbsenteismo)
+async def get_absenteismo(
+    data_inicio: date,
+    data_fim: date,
+    cliente_id: Optional[str] = None,
+    limite_cids: int = Query(10, ge=1, le=100),
+):
+    """Absenteeism rate, unjustified-absence streaks and top CIDs.
+
+    Broken down per cliente, posto and função in one response, so the UI can
+    slice a period without new requests. Results are cached per period for
+    ANALYTICS_CACHE_TTL seconds (0 disables) and dropped on writes.
+    """
+    if data_fim < data_inicio or (data_fim - data_inicio).days >= MAX_ANALYTICS_DIAS:
+        raise HTTPException(status_code=400, detail=f"Período inválido (máximo de {MAX_ANALYTICS_DIAS} dias)")
     try:
-        licencas = await db.licencas.find().to_list(1000)
-        return [Licenca(**licenca) for licenca in licencas]
+        async def load():
+            relatorio = await analytics.absenteeism(db, data_inicio, data_fim, cliente_id, limite_cids)
+            return RelatorioAbsenteismo(**relatorio).model_dump(mode="json")
+
+        if analytics_cache.ttl <= 0:
+            return await load()
+        chave = f"{data_inicio}:{data_fim}:{cliente_id or ''}:{limite_cids}"
+        return await analytics_cache.get_or_load(chave, load)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Folha de ponto
+FOLHA_LOCK_TTL = float(os.environ.get('FOLHA_LOCK_TTL', '900'))
+
+def validate_month(ano: int, mes: int):
+    if not (2000 <= ano <= 2100 and 1 <= mes <= 12):
+        raise HTTPException(status_code=400, detail="Mês inválido")
+
+@api_router.post("/folha/{ano}/{mes}", response_model=FolhaResumo)
+async def gerar_folha(ano: int, mes: int):
+    """Generate (or regenerate) every funcionario's timesheet for the month.
+
+    One run per month at a time across all workers; a concurrent request
+    gets 409.
+    """
+    validate_month(ano, mes)
+    chave = f"lock:folha:{ano}-{mes:02d}"
+    dono = f"{leader.owner}-{uuid.uuid4().hex[:8]}"
+    if not await cache_backend.acquire(chave, dono, FOLHA_LOCK_TTL):
+        raise HTTPException(status_code=409, detail=f"A folha de {mes:02d}/{ano} já está sendo gerada")
+    try:
+        return await folha.gerar_folha(db, ano, mes)
+    except Exception as e:
+        logger.exception("Falha ao gerar a folha %02d/%d", mes, ano)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await cache_backend.release(chave, dono)
+
+@api_router.get("/folha/{ano}/{mes}", response_model=Union[List[FolhaFuncionario], List[Dict[str, Any]]])
+async def get_folha(
+    ano: int,
+    mes: int,
+    cliente_id: Optional[str] = None,
+    funcionario_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+):
+    """Stored timesheets of the month, as generated by the last POST."""
+    validate_month(ano, mes)
+    try:
+        query = await build_query(ano=ano, mes=mes, cliente_id=cliente_id, funcionario_id=funcionario_id)
+        page = await paginate(db[folha.COLLECTION], FolhaFuncionario, after, limit, query, parse_fields(FolhaFuncionario, fields))
+        return page_response(page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Ponto eletrônico
+PONTO_BATCH_SIZE = 1000
+MAX_CONSOLIDACAO_DIAS = 31
+PONTO_LOCK_TTL = float(os.environ.get('PONTO_LOCK_TTL', '600'))
+# Funcionario ids already seen by this worker; skips the existence check for repeat punchers
+funcionarios_com_ponto = LRUCache(int(os.environ.get('PONTO_FUNCIONARIOS_CACHE', '50000')))
+
+async def insert_marcacoes_batch(batch, report: MarcacoesResult):
+    """Validate punches and append them to the time-series collection with one insert_many."""
+    validas = []
+    for index, raw in batch:
+        if raw is BULK_LIMIT_REACHED:
+            report.erros.append(bulk_limit_error(index))
+            continue
+        if not isinstance(raw, dict):
+            report.erros.append(BulkRowResult(index=index, status="error", errors=[{"loc": [], "msg": "Marcação deve ser um objeto JSON"}]))
+            continue
+        try:
+            validas.append((index, MarcacaoPontoCreate(**raw)))
+        except ValidationError as e:
+            report.erros.append(BulkRowResult(index=index, status="error", errors=validation_errors(e)))
+
+    desconhecidos = list({marcacao.funcionario_id for _, marcacao in validas if not funcionarios_com_ponto.get(marcacao.funcionario_id)})
+    if desconhecidos:
+        for funcionario_id in await db.funcionarios.distinct("id", {"id": {"$in": desconhecidos}}):
+            funcionarios_com_ponto.put(funcionario_id, True)
+
+    documentos = []
+    for index, marcacao in validas:
+        if not funcionarios_com_ponto.get(marcacao.funcionario_id):
+            report.erros.append(BulkRowResult(index=index, status="error", errors=[{"loc": ["funcionario_id"], "msg": "Funcionário não encontrado"}]))
+            continue
+        documentos.append(ponto.marcacao_document(marcacao.model_dump(mode="python")))
+    if documentos:
+        # Time-series collections have no unique keys: repeats are collapsed by the reducer
+        await db[ponto.COLLECTION].insert_many(documentos, ordered=False)
+        report.aceitas += len(documentos)
+
+@api_router.post("/ponto/marcacoes", response_model=MarcacoesResult)
+async def ingest_marcacoes(request: Request):
+    """Append clock-in punches from devices.
+
+    Accepts a JSON array or an NDJSON stream of MarcacaoPontoCreate, like
+    `/presenca/bulk`. Punches are only appended; `/ponto/consolidar` turns
+    them into jornadas and presença records.
+    """
+    try:
+        report = MarcacoesResult()
+        batch = []
+        async for row in read_bulk_rows(request):
+            batch.append(row)
+            if len(batch) >= PONTO_BATCH_SIZE:
+                await insert_marcacoes_batch(batch, report)
+                batch = []
+        if batch:
+            await insert_marcacoes_batch(batch, report)
+        report.erros.sort(key=lambda result: result.index)
+        report.rejeitadas = len(report.erros)
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/ponto/consolidar", response_model=ConsolidacaoPonto)
+async def consolidar_ponto(data_inicio: date, data_fim: date):
+    """Reduce the period's punches to jornadas and mark those days present.
+
+    Re-running a period replaces its jornadas. Punches only fill days
+    without a presença record, or refresh the ones an earlier
+    consolidation wrote; a record entered by hand is kept as is. One run
+    at a time across all workers; a concurrent request gets 409.
+    """
+    if data_fim < data_inicio or (data_fim - data_inicio).days >= MAX_CONSOLIDACAO_DIAS:
+        raise HTTPException(status_code=400, detail=f"Período inválido (máximo de {MAX_CONSOLIDACAO_DIAS} dias)")
+    chave = "lock:ponto:consolidar"
+    dono = f"{leader.owner}-{uuid.uuid4().hex[:8]}"
+    if not await cache_backend.acquire(chave, dono, PONTO_LOCK_TTL):
+        raise HTTPException(status_code=409, detail="Uma consolidação do ponto já está em andamento")
+    try:
+        jornadas = await ponto.consolidate(db, data_inicio, data_fim)
+        report = BulkResult()
+        linhas = list(enumerate(ponto.presenca_row(jornada) for jornada in jornadas))
+        for start in range(0, len(linhas), BULK_BATCH_SIZE):
+            await upsert_presenca_batch(linhas[start:start + BULK_BATCH_SIZE], report, origem=ponto.ORIGEM)
+        for result in report.results:
+            if result.status == "created":
+                report.created += 1
+            elif result.status == "updated":
+                report.updated += 1
+            elif result.status == "error":
+                report.failed += 1
+        if report.created or report.updated:
+            await dashboard_cache.invalidate()
+            await analytics_cache.invalidate()
+            if not app.state.change_stream:
+                event_bus.publish({
+                    "tipo": "lote", "colecao": "registros_presenca",
+                    "criados": report.created, "atualizados": report.updated,
+                })
+        return ConsolidacaoPonto(
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            jornadas=len(jornadas),
+            presencas_criadas=report.created,
+            presencas_atualizadas=report.updated,
+            presencas_mantidas=sum(result.status == "kept" for result in report.results),
+            presencas_com_erro=report.failed,
+        )
+    except Exception as e:
+        logger.exception("Falha ao consolidar o ponto de %s a %s", data_inicio, data_fim)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await cache_backend.release(chave, dono)
+
+@api_router.get("/ponto/jornadas", response_model=Union[List[JornadaPonto], List[Dict[str, Any]]])
+async def get_jornadas(
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    funcionario_id: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+):
+    """Worked time per funcionario and day, as of the last consolidation.
+
+    Shift instants are returned in PONTO_TIMEZONE, with their UTC offset.
+    """
+    try:
+        expansoes, campos = parse_expand(REGISTRO_EXPANSIONS, expand, parse_fields(JornadaPonto, fields))
+        query = await build_query(
+            "data", data_inicio, data_fim,
+            funcionario_id=funcionario_id, cliente_id=cliente_id, by_funcionario=True,
+        )
+        page = await paginate(db[ponto.JORNADAS_COLLECTION], JornadaPonto, after, limit, query, campos)
+        for jornada in page.items:
+            for turno in jornada.get("turnos", []):
+                for campo in ("entrada", "saida"):
+                    if turno.get(campo):
+                        turno[campo] = ponto.local_time(turno[campo])
+        if expansoes:
+            await expand_references(page.items, expansoes)
+        return page_response(page)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Exportação
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+# collection path -> (Mongo collection, model, date field used for ranges)
+EXPORTS = {
+    "funcionarios": ("funcionarios", Funcionario, "data_admissao"),
+    "presenca": ("registros_presenca", RegistroPresenca, "data"),
+    "atestados": ("atestados", Atestado, "data_emissao"),
+    "licencas": ("licencas", Licenca, "data_inicio"),
+}
+EXPORT_BATCH_SIZE = 1000
+
+def export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+async def stream_export(cursor, collection_name: str, fields: List[str], formato: ExportFormat):
+    """Encode documents as they come off the cursor, one Mongo batch per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if formato == ExportFormat.CSV:
+        writer.writerow(fields)
+    count = 0
+    async for document in cursor:
+        codec.decode(collection_name, document)
+        if formato == ExportFormat.CSV:
+            writer.writerow([export_value(document.get(field)) for field in fields])
+        else:
+            buffer.write(json.dumps(document, default=export_value, ensure_ascii=False))
+            buffer.write("\n")
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@api_router.get("/export/{collection}")
+async def export_collection(
+    collection: str,
+    formato: ExportFormat = ExportFormat.NDJSON,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    cliente_id: Optional[str] = None,
+):
+    """Stream a whole collection for payroll without materializing it.
+
+    `data_inicio`/`data_fim` filter on the collection's main date field;
+    `cliente_id` filters funcionarios directly and the other collections
+    through their funcionario_id. Archived months are included.
+    """
+    if collection not in EXPORTS:
+        raise HTTPException(status_code=404, detail="Coleção não exportável")
+    collection_name, model, date_field = EXPORTS[collection]
+    try:
+        query = await build_query(
+            date_field, data_inicio, data_fim, cliente_id,
+            by_funcionario=collection_name != "funcionarios",
+        )
+        fields = list(model.model_fields)
+        # The search keys are internal (search.py) and stay out of payroll files
+        projection = {"_id": 0, **{field: 0 for field in search.SEARCH_FIELDS}}
+        cursor = arquivamento.find(db, collection_name, query, projection, data_inicio, data_fim, batch_size=EXPORT_BATCH_SIZE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    media_type = "text/csv" if formato == ExportFormat.CSV else "application/x-ndjson"
+    filename = f"{collection}.{formato.value}"
+    return StreamingResponse(
+        stream_export(cursor, collection_name, fields, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# Eventos
+@api_router.get("/eventos")
+async def eventos(request: Request):
+    """Server-sent events: creations, bulk summaries and dashboard counters.
+
+    Browsers reconnect with `Last-Event-ID` and get what they missed, or a
+    `ressincronizar` event when it is no longer available.
+    """
+    return StreamingResponse(
+        stream_events(event_bus, request, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Create endpoints honour Idempotency-Key, so client retries don't duplicate records
+IDEMPOTENT_PATHS = [
+    f"{api_router.prefix}/{recurso}"
+    for recurso in ("empresas", "clientes", "funcoes", "funcionarios", "presenca", "atestados", "licencas")
+]
+app.add_middleware(idempotencia.IdempotencyMiddleware, collection=lambda: db[idempotencia.COLLECTION], paths=IDEMPOTENT_PATHS)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(metrics.LatencyMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 # Configure logging
 logging.basicConfig(
@@ -457,6 +1997,76 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+# Startup warm-up and readiness
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT', '2'))
+app.state.warm = False
+warm_up_lock = asyncio.Lock()
+
+async def warm_up():
+    """Open pool connections and check indexes before serving traffic.
+
+    Runs at startup; if Mongo was unreachable then, `/api/ready` retries it.
+    """
+    async with warm_up_lock:
+        if app.state.warm:
+            return
+        conexoes = max(mongo_options.get('minPoolSize', 0), 1)
+        await asyncio.gather(*(db.command("ping") for _ in range(conexoes)))
+        # Index bootstrap runs once per cluster, in the leader worker
+        if await leader.start() and os.environ.get('ENSURE_INDEXES_ON_STARTUP', 'true').lower() == 'true':
+            await ensure_indexes(db)
+        app.state.warm = True
+        logger.info("Aquecimento concluído: %d conexões, líder=%s", conexoes, leader.is_leader)
+
+async def start_change_feed() -> list:
+    """Background tasks feeding /api/eventos: a change stream relay when available."""
+    modo = os.environ.get('EVENTS_CHANGE_STREAMS', 'auto').lower()
+    try:
+        app.state.change_stream = modo == 'true' or (modo == 'auto' and await change_streams_available(db))
+    except Exception:
+        logger.warning("Não foi possível verificar suporte a change streams; usando eventos locais")
+    tasks = [asyncio.ensure_future(push_dashboard())]
+    if app.state.change_stream:
+        tasks.append(asyncio.ensure_future(relay_change_stream(db, event_bus, FEED_COLLECTIONS)))
+    return tasks
+
+@app.get("/api/health", include_in_schema=False)
+async def health():
+    """Liveness: the process is serving requests. Never touches Mongo."""
+    return {"status": "ok"}
+
+@app.get("/api/ready", include_in_schema=False)
+async def ready():
+    """Readiness: warm-up finished and Mongo answers a ping in time."""
+    try:
+        if not app.state.warm:
+            await asyncio.wait_for(warm_up(), timeout=READY_PING_TIMEOUT * 5)
+        await asyncio.wait_for(db.command("ping"), timeout=READY_PING_TIMEOUT)
+    except Exception as e:
+        return ORJSONResponse({"status": "indisponível", "detail": str(e) or type(e).__name__}, status_code=503)
+    return {"status": "pronto"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await warm_up()
+    except Exception:
+        logger.exception("Falha no aquecimento; /api/ready responderá 503 até o MongoDB responder")
+    tasks = await start_change_feed()
+    tasks.append(asyncio.ensure_future(metrics.explain_slow_commands(client, metrics.mongo_listener)))
+    if presenca_queue is not None:
+        # Also replays, in the background, journals left by a previous run
+        await presenca_queue.start()
+    folha.start_pool()
+    yield
+    for task in tasks:
+        task.cancel()
+    if presenca_queue is not None:
+        await presenca_queue.stop()
+    await folha.stop_pool()
+    await leader.stop()
+    await cache_backend.close()
+    client.close()
+
+# Set here rather than in FastAPI(): it needs everything defined above
+app.router.lifespan_context = lifespan
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""Write-behind queue with a local append-only journal.
+
+With write-behind on, a create is acknowledged once its document is in the
+worker's journal, a JSON-lines segment file fsynced to disk. Mongo is
+written later, in batches. Concurrent enqueues share one write+fsync
+(group commit to disk). A background task hands the journaled documents to
+`commit` when WRITE_BEHIND_BATCH_SIZE are waiting, or after
+WRITE_BEHIND_FLUSH_MS otherwise:
+
+    journal/presenca-<pid>-<random>.jsonl   one segment per worker, locked with flock
+
+Before each commit the worker switches to a fresh segment, so the previous
+one holds exactly the batch being committed and is deleted once `commit`
+returns. If Mongo is down the batch is retried and the segment is kept.
+In the background after start, each worker replays the segments no live
+worker holds a lock on (left by a crash or a killed worker), so `commit`
+must be idempotent.
+
+While MongoDB is unreachable a batch is retried for as long as it takes.
+Any other error (a document Mongo rejects) is retried
+WRITE_BEHIND_COMMIT_RETRIES times; then the batch is committed document
+by document and the ones still failing are moved to a dead-letter
+segment, so one bad document cannot stall the queue:
+
+    journal/dead/presenca-<pid>-<random>.jsonl
+
+Enqueueing while WRITE_BEHIND_MAX_PENDING documents are waiting raises
+QueueFull; the server answers 503 with Retry-After.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+import orjson
+from pymongo.errors import ConnectionFailure
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get("WRITE_BEHIND_FLUSH_MS", "50"))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "20000"))
+WRITE_BEHIND_COMMIT_RETRIES = int(os.environ.get("WRITE_BEHIND_COMMIT_RETRIES", "5"))
+RETRY_SECONDS = 1.0
+DEAD_LETTER_DIR = "dead"
+# How long shutdown waits for the last commit before leaving it to the replay
+STOP_TIMEOUT = float(os.environ.get("WRITE_BEHIND_STOP_TIMEOUT", "10"))
+
+pending_documents = metrics.registry.register(metrics.Gauge(
+    "write_behind_pending_documents", "Documents acknowledged but not yet committed to MongoDB",
+    labels=("queue",),
+))
+dead_letter_documents = metrics.registry.register(metrics.Counter(
+    "write_behind_dead_letter_documents_total", "Documents MongoDB kept rejecting, moved to the dead-letter directory",
+    labels=("queue",),
+))
+
+
+class QueueFull(Exception):
+    """Too many documents waiting for Mongo; the caller should back off."""
+
+
+def _open_segment(path: Path, create: bool = True):
+    """Open `path` under an exclusive flock; BlockingIOError if a live worker holds it.
+
+    Without `create` (replay) a segment another worker already replayed and
+    unlinked raises FileNotFoundError instead of being recreated, also when
+    the unlink happens between our open and our lock.
+    """
+    arquivo = open(path, "ab" if create else "rb")
+    try:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if not create and os.fstat(arquivo.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except BaseException:
+        arquivo.close()
+        raise
+    return arquivo
+
+
+def _append(arquivo, linhas: List[bytes]):
+    arquivo.write(b"".join(linhas))
+    arquivo.flush()
+    os.fsync(arquivo.fileno())
+
+
+def _read_segment(path: Path) -> List[dict]:
+    documentos = []
+    with open(path, "rb") as arquivo:
+        for linha in arquivo:
+            try:
+                documentos.append(orjson.loads(linha))
+            except orjson.JSONDecodeError:
+                # A torn last line was never acknowledged
+                logger.warning("Linha incompleta ignorada em %s", path.name)
+    return documentos
+
+
+class WriteBehindQueue:
+    """Journal-backed queue of JSON documents committed to Mongo in batches.
+
+    `commit(documentos)` receives the documents as enqueued (after a JSON
+    round trip) and must be idempotent: a crash between commit and segment
+    deletion replays the batch.
+    """
+
+    def __init__(self, name: str, directory: Path, commit: Callable[[List[dict]], Awaitable[None]],
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE, flush_ms: float = WRITE_BEHIND_FLUSH_MS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING, commit_retries: int = WRITE_BEHIND_COMMIT_RETRIES):
+        self.name = name
+        self.directory = Path(directory)
+        self.commit = commit
+        self.batch_size = batch_size
+        self.commit_retries = commit_retries
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self._buffer = []      # (line, future) waiting for the next fsync
+        self._journaled = []   # in the current segment, not yet committed
+        self._committing = 0   # in the rotated segment being committed
+        self._segment = None
+        self._segment_path = None
+        self._journal_lock = asyncio.Lock()
+        self._flushing = None
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + len(self._journaled) + self._committing
+
+    def _new_segment(self):
+        self._segment_path = self.directory / f"{self.name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        self._segment = _open_segment(self._segment_path)
+
+    async def start(self):
+        """Open this worker's segment and start committing, after replaying orphaned segments."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._closing = False
+        self._new_segment()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def replay(self) -> int:
+        """Commit and delete every segment of this queue no live worker holds."""
+        total = 0
+        for path in sorted(self.directory.glob(f"{self.name}-*.jsonl")):
+            try:
+                arquivo = _open_segment(path, create=False)
+            except (BlockingIOError, FileNotFoundError):
+                continue  # a live worker's segment, or replayed by another worker
+            try:
+                documentos = _read_segment(path)
+                await self._commit_documents(documentos)
+                path.unlink(missing_ok=True)
+                total += len(documentos)
+                logger.info("Journal %s reaplicado: %d documentos", path.name, len(documentos))
+            finally:
+                arquivo.close()
+        return total
+
+    async def enqueue(self, documento: dict):
+        """Return once `documento` is fsynced to the journal; QueueFull when too deep."""
+        if self.pending >= self.max_pending:
+            raise QueueFull(f"Fila {self.name} com {self.pending} documentos pendentes")
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((orjson.dumps(documento) + b"\n", future))
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush_journal())
+        await future
+
+    async def _flush_journal(self):
+        async with self._journal_lock:
+            # Everything enqueued while the previous fsync ran goes out in this one
+            self._flushing = None
+            lote, self._buffer = self._buffer, []
+            if not lote:
+                return
+            try:
+                await asyncio.to_thread(_append, self._segment, [linha for linha, _ in lote])
+            except Exception as e:
+                for _, future in lote:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self._journaled.extend(orjson.loads(linha) for linha, _ in lote)
+            pending_documents.set(self.pending, self.name)
+            for _, future in lote:
+                # A request cancelled while waiting is journaled all the same
+                if not future.done():
+                    future.set_result(None)
+        if len(self._journaled) >= self.batch_size:
+            self._wake.set()
+
+    async def _rotate(self):
+        """Take the journaled documents and their segment; new writes go to a fresh one."""
+        async with self._journal_lock:
+            documentos, self._journaled = self._journaled, []
+            self._committing = len(documentos)
+            segmento, path = self._segment, self._segment_path
+            self._new_segment()
+        return documentos, segmento, path
+
+    async def _commit_retrying(self, documentos: List[dict], tentativas: int) -> bool:
+        """Commit `documentos`; False after `tentativas` failures not caused by a lost connection."""
+        falhas = 0
+        while True:
+            try:
+                await self.commit(documentos)
+                return True
+            except ConnectionFailure:
+                # Mongo is down: wait for it, the queue pushes back with QueueFull meanwhile
+                logger.exception("MongoDB indisponível para a fila %s; nova tentativa em %.0fs", self.name, RETRY_SECONDS)
+            except Exception:
+                falhas += 1
+                if falhas >= tentativas:
+                    return False
+                logger.exception("Falha ao gravar lote da fila %s; nova tentativa em %.0fs", self.name, RETRY_SECONDS)
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _commit_documents(self, documentos: List[dict]):
+        """Commit in batches; documents that keep failing go to a dead-letter segment."""
+        for start in range(0, len(documentos), self.batch_size):
+            lote = documentos[start:start + self.batch_size]
+            if await self._commit_retrying(lote, self.commit_retries):
+                continue
+            rejeitados = [documento for documento in lote if not await self._commit_retrying([documento], 1)]
+            if rejeitados:
+                await asyncio.to_thread(self._dead_letter, rejeitados)
+
+    def _dead_letter(self, documentos: List[dict]):
+        directory = self.directory / DEAD_LETTER_DIR
+        directory.mkdir(exist_ok=True)
+        path = directory / f"{self.name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        with open(path, "ab") as arquivo:
+            _append(arquivo, [orjson.dumps(documento) + b"\n" for documento in documentos])
+        dead_letter_documents.inc(self.name, amount=len(documentos))
+        logger.error("Fila %s: %d documentos rejeitados pelo MongoDB movidos para %s", self.name, len(documentos), path)
+
+    async def _commit_segment(self, documentos, segmento, path):
+        try:
+            await self._commit_documents(documentos)
+        except asyncio.CancelledError:
+            # stop() gave up: keep the segment for the replay, but release its lock
+            segmento.close()
+            raise
+        # Unlink under the flock: once closed, another worker's replay could take the file
+        path.unlink(missing_ok=True)
+        segmento.close()
+        self._committing = 0
+        pending_documents.set(self.pending, self.name)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.replay()
+                break
+            except Exception:
+                logger.exception("Falha ao reaplicar journals da fila %s; nova tentativa em %.0fs", self.name, RETRY_SECONDS)
+                await asyncio.sleep(RETRY_SECONDS)
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if self._journaled:
+                    await self._commit_segment(*await self._rotate())
+            except Exception:
+                # Whatever was rotated stays in its segment and is replayed on the next start
+                logger.exception("Falha no ciclo de gravação da fila %s", self.name)
+                self._committing = 0
+            if self._closing:
+                return
+
+    async def stop(self):
+        """Commit what is journaled and close; anything left is replayed on the next start."""
+        if self._task is None:
+            return
+        if self._flushing:
+            await self._flushing
+        self._closing = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Fila %s encerrada com documentos no journal; serão reaplicados no próximo início", self.name)
+        self._task = None
+        if not self._journaled:
+            self._segment_path.unlink(missing_ok=True)
+        self._segment.close()
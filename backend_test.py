@@ -254,6 +254,49 @@ class WorkforceAPITester:
         )
         return success
 
+    def test_paginate_funcionarios(self):
+        """Test cursor pagination on the employee list"""
+        success, response = self.run_test(
+            "Paginate Funcionarios",
+            "GET",
+            "funcionarios?limit=1",
+            200
+        )
+        if success:
+            if not isinstance(response, list):
+                print("⚠️  Warning: paginated list is not a JSON array")
+                return False
+            next_cursor = requests.get(f"{self.api_url}/funcionarios?limit=1", timeout=10).headers.get('X-Next-Cursor')
+            if next_cursor:
+                success, _ = self.run_test(
+                    "Paginate Funcionarios (next page)",
+                    "GET",
+                    f"funcionarios?limit=1&after={next_cursor}",
+                    200
+                )
+        return success
+
+    def test_search_funcionarios(self):
+        """Test accent-insensitive name search and CPF lookup"""
+        if not self.created_ids['funcionario']:
+            print("❌ Cannot search funcionarios - no funcionario created")
+            return False
+
+        for label, query in (("nome", "joao da"), ("CPF", "12345678900")):
+            success, response = self.run_test(
+                f"Search Funcionarios ({label})",
+                "GET",
+                f"funcionarios/search?q={query}",
+                200
+            )
+            if not success:
+                return False
+            ids = [item['id'] for item in response]
+            if self.created_ids['funcionario'] not in ids:
+                print(f"⚠️  Warning: Created funcionario not found searching by {label}")
+                return False
+        return True
+
     def test_get_funcionario_by_id(self):
         """Test getting a specific employee"""
         if not self.created_ids['funcionario']:
@@ -293,6 +336,49 @@ class WorkforceAPITester:
             self.created_ids['presenca'] = response['id']
         return success
 
+    def test_bulk_presenca(self):
+        """Test bulk attendance upsert (sent twice to check idempotency)"""
+        if not self.created_ids['funcionario']:
+            print("❌ Cannot create bulk presenca - no funcionario created")
+            return False
+
+        registros = [
+            {
+                "funcionario_id": self.created_ids['funcionario'],
+                "data": "2024-07-01",
+                "presente": False,
+                "tipo_falta": "Justificada"
+            },
+            {
+                "funcionario_id": self.created_ids['funcionario'],
+                "data": "data-invalida",
+                "presente": True
+            }
+        ]
+
+        success, response = self.run_test(
+            "Bulk Presenca",
+            "POST",
+            "presenca/bulk",
+            200,
+            data=registros
+        )
+        if success and (response.get('created', 0) + response.get('updated', 0) != 1 or response.get('failed') != 1):
+            print(f"⚠️  Warning: Unexpected bulk report {response}")
+            return False
+
+        success, response = self.run_test(
+            "Bulk Presenca (retry)",
+            "POST",
+            "presenca/bulk",
+            200,
+            data=registros
+        )
+        if success and response.get('created') != 0:
+            print("⚠️  Warning: Retry created duplicate attendance records")
+            return False
+        return success
+
     def test_get_presenca(self):
         """Test getting attendance records"""
         success, response = self.run_test(
@@ -399,10 +485,13 @@ def main():
         tester.test_get_funcoes,
         tester.test_create_funcionario,
         tester.test_get_funcionarios,
+        tester.test_paginate_funcionarios,
+        tester.test_search_funcionarios,
         tester.test_get_funcionario_by_id,
         
         # Attendance and documents
         tester.test_create_presenca,
+        tester.test_bulk_presenca,
         tester.test_get_presenca,
         tester.test_create_atestado,
         tester.test_get_atestados,
@@ -14,6 +14,61 @@ import { Calendar, CalendarDays, Building, Users, UserCheck, FileText, Clipboard
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const PAGE_SIZE = 1000;
+// History lists show one page at a time; "Carregar mais" follows the X-Next-Cursor header
+const HISTORY_PAGE_SIZE = 100;
+const PRESENCA_WINDOW_DAYS = 30;
+
+const fetchPage = async (path, params = {}, after = null) => {
+  const response = await axios.get(`${API}/${path}`, {
+    params: { limit: HISTORY_PAGE_SIZE, ...params, ...(after ? { after } : {}) }
+  });
+  return { items: response.data, next_cursor: response.headers["x-next-cursor"] || null };
+};
+
+const presencaWindowStart = () => {
+  const inicio = new Date();
+  inicio.setDate(inicio.getDate() - PRESENCA_WINDOW_DAYS);
+  return inicio.toISOString().slice(0, 10);
+};
+
+// Reference lists (select options, name lookups) are small: follow next_cursor until exhausted
+const fetchAllPages = async (path, extraParams = {}) => {
+  const items = [];
+  let after = null;
+  do {
+    const params = { limit: PAGE_SIZE, ...extraParams };
+    if (after) params.after = after;
+    const response = await axios.get(`${API}/${path}`, { params });
+    items.push(...response.data);
+    after = response.headers["x-next-cursor"];
+  } while (after);
+  return items;
+};
+
+// Creates carry an Idempotency-Key: retrying after a lost response never duplicates the record
+const CREATE_RETRIES = 2;
+const idempotencyKey = () =>
+  window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const postCreate = async (path, data) => {
+  const headers = { "Idempotency-Key": idempotencyKey() };
+  for (let tentativa = 0; ; tentativa++) {
+    try {
+      return await axios.post(`${API}/${path}`, data, { headers });
+    } catch (error) {
+      const status = error.response?.status;
+      // Network errors, 5xx and 409 (same key still in progress) are retried
+      if (tentativa >= CREATE_RETRIES || (status !== undefined && status < 500 && status !== 409)) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 500 * 2 ** tentativa));
+    }
+  }
+};
+
+// Replace the item with the same id, or append it: a document may arrive both from its POST and from the feed
+const upsertById = (items, documento) => items.some(item => item.id === documento.id)
+  ? items.map(item => item.id === documento.id ? documento : item)
+  : [...items, documento];
 
 function App() {
   const [activeTab, setActiveTab] = useState("dashboard");
@@ -22,6 +77,10 @@ function App() {
   const [clientes, setClientes] = useState([]);
   const [funcoes, setFuncoes] = useState([]);
   const [funcionarios, setFuncionarios] = useState([]);
+  // id/nome of every funcionário, for selects and name lookups
+  const [funcionarioOpcoes, setFuncionarioOpcoes] = useState([]);
+  // next_cursor per paged list; absent when the list is fully loaded
+  const [cursores, setCursores] = useState({});
   const [registrosPresenca, setRegistrosPresenca] = useState([]);
   const [atestados, setAtestados] = useState([]);
   const [licencas, setLicencas] = useState([]);
@@ -131,8 +190,7 @@ function App() {
 
   const fetchEmpresas = async () => {
     try {
-      const response = await axios.get(`${API}/empresas`);
-      setEmpresas(response.data);
+      setEmpresas(await fetchAllPages("empresas"));
     } catch (error) {
       console.error("Erro ao buscar empresas:", error);
     }
@@ -140,8 +198,7 @@ function App() {
 
   const fetchClientes = async () => {
     try {
-      const response = await axios.get(`${API}/clientes`);
-      setClientes(response.data);
+      setClientes(await fetchAllPages("clientes"));
     } catch (error) {
       console.error("Erro ao buscar clientes:", error);
     }
@@ -149,54 +206,73 @@ function App() {
 
   const fetchFuncoes = async () => {
     try {
-      const response = await axios.get(`${API}/funcoes`);
-      setFuncoes(response.data);
+      setFuncoes(await fetchAllPages("funcoes"));
     } catch (error) {
       console.error("Erro ao buscar funções:", error);
     }
   };
 
-  const fetchFuncionarios = async () => {
+  // First page of a paged list, or the next one when `more` is set
+  const loadPage = async (path, params, setter, more) => {
+    const page = await fetchPage(path, params, more ? cursores[path] : null);
+    // Records pushed by the change feed may already be in the list
+    setter(items => more
+      ? [...items, ...page.items.filter(item => !items.some(atual => atual.id === item.id))]
+      : page.items);
+    setCursores(atuais => ({ ...atuais, [path]: page.next_cursor }));
+  };
+
+  const fetchFuncionarioOpcoes = async () => {
+    try {
+      setFuncionarioOpcoes(await fetchAllPages("funcionarios", { fields: "id,nome" }));
+    } catch (error) {
+      console.error("Erro ao buscar funcionários:", error);
+    }
+  };
+
+  const fetchFuncionarios = async (more = false) => {
     try {
-      const response = await axios.get(`${API}/funcionarios`);
-      setFuncionarios(response.data);
+      await loadPage("funcionarios", { expand: "funcao,cliente,empresa" }, setFuncionarios, more);
     } catch (error) {
       console.error("Erro ao buscar funcionários:", error);
     }
   };
 
-  const fetchRegistrosPresenca = async () => {
+  const fetchRegistrosPresenca = async (more = false) => {
     try {
-      const response = await axios.get(`${API}/presenca`);
-      setRegistrosPresenca(response.data);
+      await loadPage("presenca", { expand: "funcionario", data_inicio: presencaWindowStart() }, setRegistrosPresenca, more);
     } catch (error) {
       console.error("Erro ao buscar registros de presença:", error);
     }
   };
 
-  const fetchAtestados = async () => {
+  const fetchAtestados = async (more = false) => {
     try {
-      const response = await axios.get(`${API}/atestados`);
-      setAtestados(response.data);
+      await loadPage("atestados", { expand: "funcionario" }, setAtestados, more);
     } catch (error) {
       console.error("Erro ao buscar atestados:", error);
     }
   };
 
-  const fetchLicencas = async () => {
+  const fetchLicencas = async (more = false) => {
     try {
-      const response = await axios.get(`${API}/licencas`);
-      setLicencas(response.data);
+      await loadPage("licencas", { expand: "funcionario" }, setLicencas, more);
     } catch (error) {
       console.error("Erro ao buscar licenças:", error);
     }
   };
 
+  const loadMoreButton = (path, fetchMore) => cursores[path] ? (
+    <Button type="button" variant="outline" className="w-full mt-4" onClick={() => fetchMore(true)}>
+      Carregar mais
+    </Button>
+  ) : null;
+
   // Submit functions
   const handleEmpresaSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/empresas`, empresaForm);
+      const response = await postCreate("empresas", empresaForm);
       setEmpresaForm({
         razao_social: "",
         cnpj: "",
@@ -206,7 +282,7 @@ function App() {
         cidade: "",
         estado: ""
       });
-      fetchEmpresas();
+      applyDocument("empresas", response.data);
       fetchDashboardStats();
     } catch (error) {
       console.error("Erro ao criar empresa:", error);
@@ -216,7 +292,7 @@ function App() {
   const handleClienteSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/clientes`, {
+      const response = await postCreate("clientes", {
         ...clienteForm,
         valor_contrato: parseFloat(clienteForm.valor_contrato)
       });
@@ -232,7 +308,7 @@ function App() {
         descricao_servicos: "",
         sindico_responsavel: ""
       });
-      fetchClientes();
+      applyDocument("clientes", response.data);
       fetchDashboardStats();
     } catch (error) {
       console.error("Erro ao criar cliente:", error);
@@ -242,13 +318,13 @@ function App() {
   const handleFuncaoSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/funcoes`, funcaoForm);
+      const response = await postCreate("funcoes", funcaoForm);
       setFuncaoForm({
         nome: "",
         descricao: "",
         cbo: ""
       });
-      fetchFuncoes();
+      applyDocument("funcoes", response.data);
     } catch (error) {
       console.error("Erro ao criar função:", error);
     }
@@ -257,7 +333,7 @@ function App() {
   const handleFuncionarioSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/funcionarios`, {
+      const response = await postCreate("funcionarios", {
         ...funcionarioForm,
         salario: parseFloat(funcionarioForm.salario),
         quantidade_dependentes: parseInt(funcionarioForm.quantidade_dependentes) || 0,
@@ -299,7 +375,7 @@ function App() {
         cliente_id: "",
         posto_alocacao: ""
       });
-      fetchFuncionarios();
+      applyDocument("funcionarios", response.data);
       fetchDashboardStats();
     } catch (error) {
       console.error("Erro ao criar funcionário:", error);
@@ -309,7 +385,7 @@ function App() {
   const handlePresencaSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/presenca`, presencaForm);
+      const response = await postCreate("presenca", presencaForm);
       setPresencaForm({
         funcionario_id: "",
         data: "",
@@ -317,7 +393,7 @@ function App() {
         tipo_falta: "",
         observacoes: ""
       });
-      fetchRegistrosPresenca();
+      applyDocument("registros_presenca", response.data);
       fetchDashboardStats();
     } catch (error) {
       console.error("Erro ao registrar presença:", error);
@@ -327,7 +403,7 @@ function App() {
   const handleAtestadoSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/atestados`, {
+      const response = await postCreate("atestados", {
         ...atestadoForm,
         dias_afastamento: parseInt(atestadoForm.dias_afastamento)
       });
@@ -339,7 +415,7 @@ function App() {
         data_retorno_prevista: "",
         observacoes: ""
       });
-      fetchAtestados();
+      applyDocument("atestados", response.data);
       fetchDashboardStats();
     } catch (error) {
       console.error("Erro ao criar atestado:", error);
@@ -349,7 +425,7 @@ function App() {
   const handleLicencaSubmit = async (e) => {
     e.preventDefault();
     try {
-      await axios.post(`${API}/licencas`, licencaForm);
+      const response = await postCreate("licencas", licencaForm);
       setLicencaForm({
         funcionario_id: "",
         tipo: "",
@@ -358,25 +434,71 @@ function App() {
         motivo: "",
         observacoes: ""
       });
-      fetchLicencas();
+      applyDocument("licencas", response.data);
     } catch (error) {
       console.error("Erro ao criar licença:", error);
     }
   };
 
-  useEffect(() => {
+  const fetchAll = () => {
     fetchDashboardStats();
     fetchEmpresas();
     fetchClientes();
     fetchFuncoes();
     fetchFuncionarios();
+    fetchFuncionarioOpcoes();
     fetchRegistrosPresenca();
     fetchAtestados();
     fetchLicencas();
+  };
+
+  useEffect(() => {
+    fetchAll();
+  }, []);
+
+  // Created or updated documents, from a POST response or the change feed
+  const applyDocument = (colecao, documento) => {
+    const setters = {
+      empresas: setEmpresas,
+      clientes: setClientes,
+      funcoes: setFuncoes,
+      funcionarios: setFuncionarios,
+      registros_presenca: setRegistrosPresenca,
+      atestados: setAtestados,
+      licencas: setLicencas
+    };
+    const setter = setters[colecao];
+    if (!setter) return;
+    setter(items => upsertById(items, documento));
+    if (colecao === "funcionarios") {
+      setFuncionarioOpcoes(items => upsertById(items, { id: documento.id, nome: documento.nome }));
+    }
+  };
+
+  // Change feed: apply pushed creations and dashboard counters instead of refetching.
+  // Without change streams a worker only sees its own writes, so submits never rely on it.
+  useEffect(() => {
+    const applyEvent = (event) => {
+      const { colecao, documento } = JSON.parse(event.data);
+      applyDocument(colecao, documento);
+    };
+
+    const source = new EventSource(`${API}/eventos`);
+    source.addEventListener("criado", applyEvent);
+    source.addEventListener("atualizado", applyEvent);
+    source.addEventListener("lote", (event) => {
+      if (JSON.parse(event.data).colecao === "funcionarios") {
+        fetchFuncionarios();
+        fetchFuncionarioOpcoes();
+      } else fetchRegistrosPresenca();
+    });
+    source.addEventListener("dashboard", (event) => setDashboardStats(JSON.parse(event.data).dados));
+    source.addEventListener("ressincronizar", () => fetchAll());
+    return () => source.close();
   }, []);
 
   const getFuncionarioNome = (funcionarioId) => {
-    const funcionario = funcionarios.find(f => f.id === funcionarioId);
+    const funcionario = funcionarioOpcoes.find(f => f.id === funcionarioId);
     return funcionario ? funcionario.nome : "Não encontrado";
   };
 
@@ -1168,7 +1290,7 @@ function App() {
               <Card>
                 <CardHeader>
                   <CardTitle>Funcionários Cadastrados</CardTitle>
-                  <CardDescription>{funcionarios.length} funcionários no sistema</CardDescription>
+                  <CardDescription>{dashboardStats.total_funcionarios ?? funcionarios.length} funcionários no sistema</CardDescription>
                 </CardHeader>
                 <CardContent>
                   <Table>
@@ -1185,14 +1307,15 @@ function App() {
                       {funcionarios.map((funcionario) => (
                         <TableRow key={funcionario.id}>
                           <TableCell className="font-medium">{funcionario.nome}</TableCell>
-                          <TableCell>{getFuncaoNome(funcionario.funcao_id)}</TableCell>
-                          <TableCell>{getEmpresaNome(funcionario.empresa_id)}</TableCell>
-                          <TableCell>{getClienteNome(funcionario.cliente_id)}</TableCell>
+                          <TableCell>{funcionario.funcao?.nome ?? getFuncaoNome(funcionario.funcao_id)}</TableCell>
+                          <TableCell>{funcionario.empresa?.razao_social ?? getEmpresaNome(funcionario.empresa_id)}</TableCell>
+                          <TableCell>{funcionario.cliente?.razao_social ?? getClienteNome(funcionario.cliente_id)}</TableCell>
                           <TableCell>R$ {funcionario.salario?.toLocaleString('pt-BR')}</TableCell>
                         </TableRow>
                       ))}
                     </TableBody>
                   </Table>
+                  {loadMoreButton("funcionarios", fetchFuncionarios)}
                 </CardContent>
               </Card>
             </div>
@@ -1215,7 +1338,7 @@ function App() {
                           <SelectValue placeholder="Selecione o funcionário" />
                         </SelectTrigger>
                         <SelectContent>
-                          {funcionarios.map((funcionario) => (
+                          {funcionarioOpcoes.map((funcionario) => (
                             <SelectItem key={funcionario.id} value={funcionario.id}>{funcionario.nome}</SelectItem>
                           ))}
                         </SelectContent>
@@ -1273,14 +1396,14 @@ function App() {
               <Card>
                 <CardHeader>
                   <CardTitle>Registros de Presença</CardTitle>
-                  <CardDescription>{registrosPresenca.length} registros no sistema</CardDescription>
+                  <CardDescription>{registrosPresenca.length} registros carregados (últimos {PRESENCA_WINDOW_DAYS} dias)</CardDescription>
                 </CardHeader>
                 <CardContent>
                   <div className="space-y-4 max-h-96 overflow-y-auto">
                     {registrosPresenca.map((registro) => (
                       <div key={registro.id} className="p-4 border rounded-lg flex justify-between items-center">
                         <div>
-                          <h3 className="font-semibold">{getFuncionarioNome(registro.funcionario_id)}</h3>
+                          <h3 className="font-semibold">{registro.funcionario?.nome ?? getFuncionarioNome(registro.funcionario_id)}</h3>
                           <p className="text-sm text-gray-600">Data: {new Date(registro.data).toLocaleDateString('pt-BR')}</p>
                           {registro.observacoes && <p className="text-sm text-gray-600">Obs: {registro.observacoes}</p>}
                         </div>
@@ -1294,6 +1417,7 @@ function App() {
                       </div>
                     ))}
                   </div>
+                  {loadMoreButton("presenca", fetchRegistrosPresenca)}
                 </CardContent>
               </Card>
             </div>
@@ -1323,7 +1447,7 @@ function App() {
                               <SelectValue placeholder="Selecione o funcionário" />
                             </SelectTrigger>
                             <SelectContent>
-                              {funcionarios.map((funcionario) => (
+                              {funcionarioOpcoes.map((funcionario) => (
                                 <SelectItem key={funcionario.id} value={funcionario.id}>{funcionario.nome}</SelectItem>
                               ))}
                             </SelectContent>
@@ -1384,19 +1508,20 @@ function App() {
                   <Card>
                     <CardHeader>
                       <CardTitle>Atestados Registrados</CardTitle>
-                      <CardDescription>{atestados.length} atestados no sistema</CardDescription>
+                      <CardDescription>{atestados.length} atestados carregados</CardDescription>
                     </CardHeader>
                     <CardContent>
                       <div className="space-y-4 max-h-96 overflow-y-auto">
                         {atestados.map((atestado) => (
                           <div key={atestado.id} className="p-4 border rounded-lg">
-                            <h3 className="font-semibold">{getFuncionarioNome(atestado.funcionario_id)}</h3>
+                            <h3 className="font-semibold">{atestado.funcionario?.nome ?? getFuncionarioNome(atestado.funcionario_id)}</h3>
                             <p className="text-sm text-gray-600">CID: {atestado.cid}</p>
                             <p className="text-sm text-gray-600">Dias: {atestado.dias_afastamento}</p>
                             <p className="text-sm text-gray-600">Retorno: {new Date(atestado.data_retorno_prevista).toLocaleDateString('pt-BR')}</p>
                           </div>
                         ))}
                       </div>
+                      {loadMoreButton("atestados", fetchAtestados)}
                     </CardContent>
                   </Card>
                 </div>
@@ -1418,7 +1543,7 @@ function App() {
                               <SelectValue placeholder="Selecione o funcionário" />
                             </SelectTrigger>
                             <SelectContent>
-                              {funcionarios.map((funcionario) => (
+                              {funcionarioOpcoes.map((funcionario) => (
                                 <SelectItem key={funcionario.id} value={funcionario.id}>{funcionario.nome}</SelectItem>
                               ))}
                             </SelectContent>
@@ -1484,19 +1609,20 @@ function App() {
                   <Card>
                     <CardHeader>
                       <CardTitle>Licenças Registradas</CardTitle>
-                      <CardDescription>{licencas.length} licenças no sistema</CardDescription>
+                      <CardDescription>{licencas.length} licenças carregadas</CardDescription>
                     </CardHeader>
                     <CardContent>
                       <div className="space-y-4 max-h-96 overflow-y-auto">
                         {licencas.map((licenca) => (
                           <div key={licenca.id} className="p-4 border rounded-lg">
-                            <h3 className="font-semibold">{getFuncionarioNome(licenca.funcionario_id)}</h3>
+                            <h3 className="font-semibold">{licenca.funcionario?.nome ?? getFuncionarioNome(licenca.funcionario_id)}</h3>
                             <p className="text-sm text-gray-600">Tipo: {licenca.tipo}</p>
                             <p className="text-sm text-gray-600">Período: {new Date(licenca.data_inicio).toLocaleDateString('pt-BR')} - {new Date(licenca.data_fim).toLocaleDateString('pt-BR')}</p>
                             <p className="text-sm text-gray-600">Motivo: {licenca.motivo}</p>
                           </div>
                         ))}
                       </div>
+                      {loadMoreButton("licencas", fetchLicencas)}
                     </CardContent>
                   </Card>
                 </div>
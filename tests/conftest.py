@@ -0,0 +1,45 @@
+"""Shared fixtures: the backend modules on sys.path and an in-memory Motor database.
+
+Async tests run on anyio's pytest plugin (`@pytest.mark.anyio`).
+"""
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# server.py reads these at import time; no test talks to a real MongoDB
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "leme_test")
+os.environ.setdefault("ROLLUPS_REBUILD_GRACE_SECONDS", "0")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["leme_test"]
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """server.py bound to `db`, with empty caches and presença written inline."""
+    import server
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "presenca_queue", None)
+    for cache in (server.cache_backend, server.reference_bodies, server.funcionarios_com_ponto):
+        monkeypatch.setattr(cache, "_values", type(cache._values)())
+    return server
+
+
+@pytest.fixture
+async def api(server):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://t") as client:
+        yield client
@@ -0,0 +1,70 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+import analytics
+
+pytestmark = pytest.mark.anyio
+
+
+def dia(numero):
+    return datetime(2024, 3, numero)
+
+
+@pytest.fixture
+async def periodo(db):
+    await db.funcionarios.insert_many([
+        {"id": "f1", "cliente_id": "c1", "posto_alocacao": "p1", "funcao_id": "x"},
+        {"id": "f2", "cliente_id": "c2", "posto_alocacao": "p2", "funcao_id": "y"},
+    ])
+    registros = [("f1", 1, False, None), ("f1", 2, False, None), ("f1", 3, False, None), ("f1", 4, True, None),
+                 ("f1", 5, True, None), ("f2", 1, True, None), ("f2", 3, False, "Justificada"), ("f2", 5, False, None)]
+    await db.registros_presenca.insert_many([
+        {"funcionario_id": funcionario_id, "data": dia(numero), "presente": presente, "tipo_falta": tipo_falta}
+        for funcionario_id, numero, presente, tipo_falta in registros
+    ])
+    # Both outrank the presence record of the same day
+    await db.atestados.insert_one({"funcionario_id": "f2", "cid": " j11 ", "data_emissao": dia(2), "data_retorno_prevista": dia(4), "dias_afastamento": 2})
+    await db.licencas.insert_one({"funcionario_id": "f1", "data_inicio": dia(5), "data_fim": dia(9)})
+
+
+async def test_indicators_follow_status_precedence(db, periodo):
+    relatorio = await analytics.absenteeism(db, date(2024, 3, 1), date(2024, 3, 5))
+
+    assert relatorio["totais"] == {
+        "funcionarios": 2, "dias": 9, "presentes": 2, "faltas_justificadas": 0, "faltas_nao_justificadas": 4,
+        "dias_atestado": 2, "dias_licenca": 1, "taxa_absenteismo": 0.75,
+        "max_sequencia_faltas": 3, "sequencias_faltas": 1,
+    }
+    por_cliente = {linha["grupo"]: linha for linha in relatorio["por_cliente"]}
+    assert (por_cliente["c1"]["faltas_nao_justificadas"], por_cliente["c1"]["dias_licenca"]) == (3, 1)
+    assert (por_cliente["c2"]["dias_atestado"], por_cliente["c2"]["max_sequencia_faltas"]) == (2, 1)
+    assert relatorio["top_cids"] == [{"cid": "J11", "atestados": 1, "dias": 2}]
+
+
+async def test_cliente_filter_and_empty_periods(db, periodo):
+    relatorio = await analytics.absenteeism(db, date(2024, 3, 1), date(2024, 3, 5), cliente_id="c1")
+    assert [linha["grupo"] for linha in relatorio["por_cliente"]] == ["c1"]
+    assert relatorio["top_cids"] == []
+
+    vazio = await analytics.absenteeism(db, date(2023, 1, 1), date(2023, 1, 31))
+    assert vazio["totais"] is None and vazio["por_posto"] == []
+
+
+def test_intervals_expand_to_clipped_days():
+    frame = analytics.expand_intervals(
+        np.array(["f1", "f2"], dtype=object),
+        np.array(["2024-02-27", "2024-03-04"], dtype="datetime64[D]"),
+        np.array(["2024-03-02", "2024-03-03"], dtype="datetime64[D]"),
+        np.datetime64("2024-03-01"), np.datetime64("2024-03-31"),
+    )
+    assert frame["data"].astype(str).tolist() == ["2024-03-01", "2024-03-02"]
+    assert frame["funcionario_id"].tolist() == ["f1", "f1"]
+
+
+async def test_endpoint_validates_the_period(api, periodo):
+    resposta = await api.get("/api/analytics/absenteismo", params={"data_inicio": "2024-03-01", "data_fim": "2024-03-05"})
+    assert resposta.status_code == 200 and resposta.json()["totais"]["taxa_absenteismo"] == 0.75
+    invertido = await api.get("/api/analytics/absenteismo", params={"data_inicio": "2024-03-05", "data_fim": "2024-03-01"})
+    assert invertido.status_code == 400
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from cache import LeaderElection, LRUCache, MemoryBackend, TTLCache, backend_from_url
+
+pytestmark = pytest.mark.anyio
+
+
+class Loader:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"total": self.calls}
+
+
+async def test_ttl_cache_loads_once_and_serves_from_backend():
+    cache, loader = TTLCache(MemoryBackend(), "dashboard", ttl=60), Loader(delay=0.02)
+    valores = await asyncio.gather(*(cache.get_or_load("stats", loader) for _ in range(5)))
+    assert valores == [{"total": 1}] * 5
+    assert await cache.get_or_load("stats", loader) == {"total": 1}
+    assert loader.calls == 1
+
+
+async def test_invalidate_is_seen_by_every_cache_on_the_backend():
+    backend = MemoryBackend()
+    worker_a, worker_b = TTLCache(backend, "dashboard", 60), TTLCache(backend, "dashboard", 60)
+    loader = Loader()
+    await worker_a.get_or_load("stats", loader)
+    await worker_b.invalidate()
+    assert await worker_a.get_or_load("stats", loader) == {"total": 2}
+
+
+async def test_load_racing_an_invalidation_is_not_stored():
+    cache, loader = TTLCache(MemoryBackend(), "dashboard", 60), Loader(delay=0.05)
+    carregando = asyncio.ensure_future(cache.get_or_load("stats", loader))
+    await asyncio.sleep(0.01)
+    await cache.invalidate()
+    assert await carregando == {"total": 1}
+    assert await cache.get_or_load("stats", loader) == {"total": 2}
+
+
+async def test_memory_backend_expires_and_sweeps_unread_keys(monkeypatch):
+    monkeypatch.setattr(MemoryBackend, "SWEEP_INTERVAL", 0.01)
+    backend = MemoryBackend()
+    await backend.set("curta", "1", ttl=0.01)
+    await backend.set("fixa", "1")
+    await asyncio.sleep(0.02)
+    assert await backend.get("curta") is None
+    for numero in range(100):
+        await backend.set(f"geracao:{numero}", "x", ttl=0.01)
+        await asyncio.sleep(0.001)
+    # Keys never read again are dropped by the sweep instead of piling up
+    assert len(backend._values) < 50
+    assert await backend.get("fixa") == "1"
+
+
+async def test_memory_backend_set_nx_keeps_live_value():
+    backend = MemoryBackend()
+    await backend.set("chave", "a", nx=True)
+    await backend.set("chave", "b", nx=True)
+    assert await backend.get("chave") == "a"
+
+
+async def test_lease_belongs_to_one_owner_until_released():
+    backend = MemoryBackend()
+    assert await backend.acquire("lock:x", "a", ttl=60)
+    assert not await backend.acquire("lock:x", "b", ttl=60)
+    assert await backend.acquire("lock:x", "a", ttl=60)
+    await backend.release("lock:x", "b")
+    assert not await backend.acquire("lock:x", "b", ttl=60)
+    await backend.release("lock:x", "a")
+    assert await backend.acquire("lock:x", "b", ttl=60)
+
+
+async def test_expired_lease_can_be_taken_over():
+    backend = MemoryBackend()
+    assert await backend.acquire("lock:x", "a", ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await backend.acquire("lock:x", "b", ttl=60)
+
+
+async def test_one_leader_at_a_time():
+    backend = MemoryBackend()
+    primeiro, segundo = LeaderElection(backend, ttl=0.06), LeaderElection(backend, ttl=0.06)
+    assert await primeiro.start()
+    assert not await segundo.start()
+    await primeiro.stop()
+    assert not primeiro.is_leader
+    # The follower takes over on its next renewal (every ttl / 3)
+    await asyncio.sleep(0.05)
+    assert segundo.is_leader
+    await segundo.stop()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_backend_from_url():
+    assert isinstance(backend_from_url(None), MemoryBackend)
+    assert isinstance(backend_from_url("memory://"), MemoryBackend)
+    with pytest.raises(ValueError):
+        backend_from_url("memcached://localhost")
@@ -0,0 +1,69 @@
+from datetime import date, datetime
+
+import pytest
+
+import codec
+
+
+def test_encode_turns_dates_into_midnight_datetimes():
+    criado = datetime(2024, 5, 1, 13, 30)
+    documento = {"data": date(2024, 5, 1), "created_at": criado, "dias": [{"data": date(2024, 5, 2)}], "nome": "x"}
+    assert codec.encode(documento) == {
+        "data": datetime(2024, 5, 1), "created_at": criado, "dias": [{"data": datetime(2024, 5, 2)}], "nome": "x",
+    }
+
+
+def test_decode_restores_dates_on_date_fields_only():
+    folha = {"dias": [{"data": datetime(2024, 5, 2)}, {"data": "2024-05-03"}], "created_at": datetime(2024, 6, 1, 8)}
+    assert codec.decode("folhas_ponto", folha) == {
+        "dias": [{"data": date(2024, 5, 2)}, {"data": date(2024, 5, 3)}], "created_at": datetime(2024, 6, 1, 8),
+    }
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (datetime(2024, 5, 1, 10), date(2024, 5, 1)),
+    (date(2024, 5, 1), date(2024, 5, 1)),
+    ("2024-05-01", date(2024, 5, 1)),
+    ("2024-05-01T00:00:00", date(2024, 5, 1)),
+    ("", None),
+    (None, None),
+])
+def test_as_date(valor, esperado):
+    assert codec.as_date(valor) == esperado
+
+
+def test_date_range_leaves_open_ends_out():
+    assert codec.date_range(date(2024, 1, 1), None) == {"$gte": datetime(2024, 1, 1)}
+    assert codec.date_range(None, None) == {}
+
+
+@pytest.mark.anyio
+async def test_migrate_converts_legacy_strings_once(db):
+    await db.registros_presenca.insert_many([
+        {"id": "r1", "data": "2024-05-01"},
+        {"id": "r2", "data": datetime(2024, 5, 2)},
+    ])
+    await db.folhas_ponto.insert_one({"id": "f1", "dias": [{"data": "2024-05-01"}, {"data": "2024-05-02"}]})
+
+    assert (await codec.migrate(db, ["registros_presenca", "folhas_ponto"]))["registros_presenca"] == 1
+    assert (await db.registros_presenca.find_one({"id": "r1"}))["data"] == datetime(2024, 5, 1)
+    assert [dia["data"] for dia in (await db.folhas_ponto.find_one({"id": "f1"}))["dias"]] == [
+        datetime(2024, 5, 1), datetime(2024, 5, 2),
+    ]
+    assert await codec.migrate(db, ["registros_presenca", "folhas_ponto"]) == {"registros_presenca": 0, "folhas_ponto": 0}
+    assert not any((await codec.pending(db)).values())
+
+
+@pytest.mark.anyio
+async def test_migrate_folds_string_rollups_into_their_date_twin(db):
+    chave = {"cliente_id": "c1", "posto_alocacao": "p1"}
+    await db.rollups_presenca.insert_many([
+        {**chave, "data": "2024-05-01", "presentes": 2, "atestados": 1},
+        {**chave, "data": datetime(2024, 5, 1), "presentes": 3},
+    ])
+
+    assert await codec.migrate(db, ["rollups_presenca"]) == {"rollups_presenca": 1}
+    rollups = await db.rollups_presenca.find({}, {"_id": 0}).to_list(None)
+    assert len(rollups) == 1
+    assert rollups[0]["data"] == datetime(2024, 5, 1)
+    assert rollups[0]["presentes"] == 5 and rollups[0]["atestados"] == 1
@@ -0,0 +1,47 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def hoje(db):
+    dia = datetime.combine(date.today(), datetime.min.time())
+    await db.funcionarios.insert_many([
+        {"id": f"f{n}", "nome": f"F{n}", "cliente_id": "c1", "posto_alocacao": "p1"} for n in range(4)
+    ])
+    await db.clientes.insert_one({"id": "c1", "razao_social": "Cliente"})
+    await db.registros_presenca.insert_many([
+        {"id": "r0", "funcionario_id": "f0", "data": dia, "presente": True},
+        {"id": "r1", "funcionario_id": "f1", "data": dia, "presente": False},
+        {"id": "r2", "funcionario_id": "f2", "data": dia - timedelta(days=1), "presente": True},
+    ])
+    await db.atestados.insert_many([
+        {"id": "a0", "funcionario_id": "f1", "data_emissao": dia, "data_retorno_prevista": dia + timedelta(days=2)},
+        # Back at work today: the return day is a working day
+        {"id": "a1", "funcionario_id": "f3", "data_emissao": dia - timedelta(days=3), "data_retorno_prevista": dia},
+    ])
+    return dia
+
+
+async def test_counts_today(api, hoje):
+    assert (await api.get("/api/dashboard")).json() == {
+        "total_funcionarios": 4,
+        "total_clientes": 1,
+        "total_empresas": 0,
+        "funcionarios_presentes_hoje": 1,
+        "funcionarios_ausentes_hoje": 1,
+        "atestados_ativos": 1,
+    }
+
+
+async def test_cached_until_a_create_invalidates_it(db, api, hoje):
+    await api.get("/api/dashboard")
+    # Written behind the API's back: the cached value stands
+    await db.registros_presenca.insert_one({"id": "r9", "funcionario_id": "f9", "data": hoje, "presente": True})
+    assert (await api.get("/api/dashboard")).json()["funcionarios_presentes_hoje"] == 1
+
+    resposta = await api.post("/api/presenca", json={"funcionario_id": "f3", "data": hoje.date().isoformat(), "presente": True})
+    assert resposta.status_code == 200
+    assert (await api.get("/api/dashboard")).json()["funcionarios_presentes_hoje"] == 3
@@ -0,0 +1,49 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+EMPRESA = {"razao_social": "Alfa LTDA", "cnpj": "00.000.000/0001-00", "logradouro": "Rua A", "cep": "01000-000", "cidade": "São Paulo", "estado": "SP"}
+
+
+async def test_matching_etag_is_304_without_reading_mongo(server, api, monkeypatch):
+    await api.post("/api/empresas", json=EMPRESA)
+    primeira = await api.get("/api/empresas")
+    etag = primeira.headers["etag"]
+
+    async def paginate(*args, **kwargs):
+        raise AssertionError("304 must not query Mongo")
+
+    monkeypatch.setattr(server, "paginate", paginate)
+    resposta = await api.get("/api/empresas", headers={"If-None-Match": f'W/{etag}, "outro"'})
+    assert resposta.status_code == 304
+    assert resposta.headers["etag"] == etag and not resposta.content
+    # Cached body for a repeat without validators
+    assert (await api.get("/api/empresas")).json() == primeira.json()
+
+
+async def test_create_changes_the_etag(api):
+    await api.post("/api/empresas", json=EMPRESA)
+    antes = await api.get("/api/empresas")
+    await api.post("/api/empresas", json={**EMPRESA, "razao_social": "Beta LTDA"})
+
+    depois = await api.get("/api/empresas", headers={"If-None-Match": antes.headers["etag"]})
+    assert depois.status_code == 200
+    assert depois.headers["etag"] != antes.headers["etag"]
+    assert [empresa["razao_social"] for empresa in depois.json()] == ["Alfa LTDA", "Beta LTDA"]
+
+
+async def test_etag_depends_on_the_query(api):
+    await api.post("/api/empresas", json=EMPRESA)
+    completa = await api.get("/api/empresas")
+    projetada = await api.get("/api/empresas", params={"fields": "razao_social"})
+    assert completa.headers["etag"] != projetada.headers["etag"]
+    assert projetada.json()[0].keys() == {"id", "razao_social"}
+
+
+async def test_if_modified_since(api):
+    await api.post("/api/empresas", json=EMPRESA)
+    primeira = await api.get("/api/empresas")
+    resposta = await api.get("/api/empresas", headers={"If-Modified-Since": primeira.headers["last-modified"]})
+    assert resposta.status_code == 304
+    antiga = await api.get("/api/empresas", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+    assert antiga.status_code == 200
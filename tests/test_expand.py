@@ -0,0 +1,73 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class ContaConsultas:
+    """Wraps a database and counts find() calls per collection."""
+
+    def __init__(self, db):
+        self._db = db
+        self.consultas = Counter()
+
+    def __getitem__(self, nome):
+        colecao = self._db[nome]
+        consultas = self.consultas
+
+        class Contada:
+            def __getattr__(self, atributo):
+                return getattr(colecao, atributo)
+
+            def find(self, *args, **kwargs):
+                consultas[nome] += 1
+                return colecao.find(*args, **kwargs)
+
+        return Contada()
+
+    def __getattr__(self, nome):
+        return self[nome]
+
+
+@pytest.fixture
+async def cadastro(db):
+    await db.funcoes.insert_many([{"id": "x", "nome": "Porteiro", "cbo": "5174"}, {"id": "y", "nome": "Zelador", "cbo": "5141"}])
+    await db.clientes.insert_one({"id": "c1", "razao_social": "Cond. A", "cnpj": "1", "cidade": "SP", "estado": "SP", "valor_contrato": 9})
+    await db.funcionarios.insert_many([
+        {"id": f"f{n}", "nome": f"F{n}", "funcao_id": funcao, "cliente_id": cliente, "created_at": datetime(2024, 1, 1, n)}
+        for n, (funcao, cliente) in enumerate([("x", "c1"), ("y", "c1"), ("x", "c9")])
+    ])
+
+
+async def test_references_are_inlined_with_one_query_per_collection(server, db, api, cadastro, monkeypatch):
+    contador = ContaConsultas(db)
+    monkeypatch.setattr(server, "db", contador)
+
+    resposta = await api.get("/api/funcionarios", params={"expand": "funcao,cliente", "fields": "nome"})
+
+    assert resposta.json() == [
+        {"id": "f0", "nome": "F0", "funcao_id": "x", "cliente_id": "c1",
+         "funcao": {"id": "x", "nome": "Porteiro", "cbo": "5174"},
+         "cliente": {"id": "c1", "razao_social": "Cond. A", "cnpj": "1", "cidade": "SP", "estado": "SP"}},
+        {"id": "f1", "nome": "F1", "funcao_id": "y", "cliente_id": "c1",
+         "funcao": {"id": "y", "nome": "Zelador", "cbo": "5141"},
+         "cliente": {"id": "c1", "razao_social": "Cond. A", "cnpj": "1", "cidade": "SP", "estado": "SP"}},
+        # Dangling reference
+        {"id": "f2", "nome": "F2", "funcao_id": "x", "cliente_id": "c9",
+         "funcao": {"id": "x", "nome": "Porteiro", "cbo": "5174"}, "cliente": None},
+    ]
+    assert contador.consultas == Counter({"funcionarios": 1, "funcoes": 1, "clientes": 1})
+
+
+async def test_records_expand_their_funcionario(api, db, cadastro):
+    await db.registros_presenca.insert_one({"id": "r1", "funcionario_id": "f1", "data": datetime(2024, 3, 1), "presente": True})
+    [registro] = (await api.get("/api/presenca", params={"expand": "funcionario", "fields": "presente"})).json()
+    assert registro["funcionario"] == {"id": "f1", "nome": "F1", "funcao_id": "y", "cliente_id": "c1"}
+
+
+async def test_unknown_expansion_is_400(api):
+    resposta = await api.get("/api/presenca", params={"expand": "funcao"})
+    assert resposta.status_code == 400
+    assert "funcionario" in resposta.json()["detail"]
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def presencas(db):
+    await db.funcionarios.insert_many([
+        {"id": "f1", "nome": "Ana", "cliente_id": "c1", "busca_nome": "ana", "busca_tokens": ["ana"]},
+        {"id": "f2", "nome": "Bia", "cliente_id": "c2", "busca_nome": "bia", "busca_tokens": ["bia"]},
+    ])
+    await db.registros_presenca.insert_many([
+        {"id": f"r{n}", "funcionario_id": funcionario_id, "data": datetime(2024, 3, dia), "presente": True,
+         "created_at": datetime(2024, 3, dia, 8)}
+        for n, (funcionario_id, dia) in enumerate([("f1", 1), ("f2", 1), ("f1", 2), ("f1", 20)])
+    ])
+
+
+async def test_ndjson_filters_by_period_and_cliente(api, presencas):
+    resposta = await api.get("/api/export/presenca", params={"data_inicio": "2024-03-01", "data_fim": "2024-03-10", "cliente_id": "c1"})
+
+    assert resposta.headers["content-type"] == "application/x-ndjson"
+    assert resposta.headers["content-disposition"] == 'attachment; filename="presenca.ndjson"'
+    linhas = [json.loads(linha) for linha in resposta.text.splitlines()]
+    assert [(linha["id"], linha["data"]) for linha in linhas] == [("r0", "2024-03-01"), ("r2", "2024-03-02")]
+
+
+async def test_csv_has_a_header_of_model_fields(server, api, presencas):
+    resposta = await api.get("/api/export/funcionarios", params={"formato": "csv"})
+
+    linhas = list(csv.reader(io.StringIO(resposta.text)))
+    assert linhas[0] == list(server.Funcionario.model_fields)
+    assert sorted(linha[linhas[0].index("nome")] for linha in linhas[1:]) == ["Ana", "Bia"]
+    assert "busca_nome" not in resposta.text
+
+
+async def test_search_keys_stay_out_of_ndjson(api, presencas):
+    resposta = await api.get("/api/export/funcionarios")
+    assert all(not key.startswith("busca_") for linha in resposta.text.splitlines() for key in json.loads(linha))
+
+
+async def test_stream_yields_one_chunk_per_batch(server, monkeypatch):
+    async def cursor():
+        for n in range(5):
+            yield {"id": f"r{n}", "data": datetime(2024, 3, 1), "presente": True}
+
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", 2)
+    chunks = [chunk async for chunk in server.stream_export(cursor(), "registros_presenca", ["id"], server.ExportFormat.NDJSON)]
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+
+async def test_unknown_collection_is_404(api):
+    assert (await api.get("/api/export/empresas")).status_code == 404
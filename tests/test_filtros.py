@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def dados(db):
+    await db.funcionarios.insert_many([
+        {"id": "f1", "nome": "Ana", "cliente_id": "c1", "empresa_id": "e1", "funcao_id": "x", "created_at": datetime(2024, 1, 1)},
+        {"id": "f2", "nome": "Bia", "cliente_id": "c2", "empresa_id": "e1", "funcao_id": "x", "created_at": datetime(2024, 1, 2)},
+        {"id": "f3", "nome": "Caio", "cliente_id": "c1", "empresa_id": "e2", "funcao_id": "y", "created_at": datetime(2024, 1, 3)},
+    ])
+    await db.registros_presenca.insert_many([
+        {"id": f"r{n}", "funcionario_id": funcionario_id, "data": datetime(2024, 3, dia), "presente": True,
+         "created_at": datetime(2024, 3, dia, n)}
+        for n, (funcionario_id, dia) in enumerate([("f1", 1), ("f2", 1), ("f3", 5), ("f1", 9)])
+    ])
+
+
+async def ids(api, path, **params):
+    resposta = await api.get(path, params=params)
+    assert resposta.status_code == 200, resposta.text
+    return [item["id"] for item in resposta.json()]
+
+
+async def test_equality_filters_combine(api, dados):
+    assert await ids(api, "/api/funcionarios", cliente_id="c1") == ["f1", "f3"]
+    assert await ids(api, "/api/funcionarios", cliente_id="c1", empresa_id="e1") == ["f1"]
+    assert await ids(api, "/api/funcionarios", funcao_id="z") == []
+
+
+async def test_cliente_filter_reaches_records_through_funcionarios(api, dados):
+    assert await ids(api, "/api/presenca", cliente_id="c1") == ["r0", "r2", "r3"]
+    assert await ids(api, "/api/presenca", cliente_id="c1", funcionario_id="f3") == ["r2"]
+    assert await ids(api, "/api/presenca", cliente_id="c2", funcionario_id="f3") == []
+
+
+async def test_date_range_is_inclusive(api, dados):
+    assert await ids(api, "/api/presenca", data_inicio="2024-03-01", data_fim="2024-03-05") == ["r0", "r1", "r2"]
+    assert await ids(api, "/api/presenca", data_inicio="2024-03-06") == ["r3"]
+
+
+async def test_fields_projects_and_always_keeps_id(api, dados):
+    resposta = await api.get("/api/funcionarios", params={"fields": "nome", "limit": 1})
+    assert resposta.json() == [{"id": "f1", "nome": "Ana"}]
+
+
+async def test_unknown_field_is_400(api, dados):
+    resposta = await api.get("/api/funcionarios", params={"fields": "nome,senha"})
+    assert resposta.status_code == 400
+    assert "senha" in resposta.json()["detail"]
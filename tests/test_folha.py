@@ -0,0 +1,22 @@
+import threading
+
+import pytest
+
+import folha
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_inline_path_runs_off_the_event_loop(db, monkeypatch):
+    await db.funcionarios.insert_one({"id": "f1", "nome": "Ana", "cliente_id": "c1", "posto_alocacao": "Portaria"})
+    threads = []
+
+    def process_cliente(lote, inicio, fim):
+        threads.append(threading.current_thread())
+        return []
+
+    monkeypatch.setattr(folha, "process_cliente", process_cliente)
+    resumo = await folha.gerar_folha(db, 2024, 3, workers=1)
+
+    assert resumo["clientes"] == 1
+    assert threads and threading.main_thread() not in threads
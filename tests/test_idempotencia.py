@@ -0,0 +1,142 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import idempotencia
+
+pytestmark = pytest.mark.anyio
+
+PATH = "/api/presenca"
+
+
+class Handler:
+    """ASGI app standing in for the API: counts calls, answers `status` after `delay`."""
+
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        message = await receive()
+        await asyncio.sleep(self.delay)
+        corpo = json.dumps({"chamada": self.calls, "recebido": message["body"].decode()}).encode()
+        await send({"type": "http.response.start", "status": self.status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": corpo})
+
+
+def client_for(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t")
+
+
+@pytest.fixture
+def handler():
+    return Handler()
+
+
+@pytest.fixture
+def middleware(db, handler):
+    return idempotencia.IdempotencyMiddleware(handler, collection=lambda: db[idempotencia.COLLECTION], paths=[PATH])
+
+
+async def test_replays_stored_response(middleware, handler):
+    async with client_for(middleware) as client:
+        primeira = await client.post(PATH, json={"a": 1}, headers={"Idempotency-Key": "k1"})
+        segunda = await client.post(PATH, json={"a": 1}, headers={"Idempotency-Key": "k1"})
+    assert handler.calls == 1
+    assert segunda.status_code == primeira.status_code == 200
+    assert segunda.json() == primeira.json()
+    assert segunda.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in primeira.headers
+
+
+async def test_without_key_or_other_path_passes_through(middleware, handler):
+    async with client_for(middleware) as client:
+        await client.post(PATH, json={})
+        await client.post(PATH, json={})
+        await client.post("/api/outro", json={}, headers={"Idempotency-Key": "k1"})
+        await client.post("/api/outro", json={}, headers={"Idempotency-Key": "k1"})
+    assert handler.calls == 4
+
+
+async def test_key_reused_with_other_body_is_rejected(middleware, handler):
+    async with client_for(middleware) as client:
+        await client.post(PATH, json={"a": 1}, headers={"Idempotency-Key": "k1"})
+        resposta = await client.post(PATH, json={"a": 2}, headers={"Idempotency-Key": "k1"})
+    assert resposta.status_code == 422
+    assert handler.calls == 1
+
+
+@pytest.mark.parametrize("chave", [" ", "x" * (idempotencia.MAX_KEY_LENGTH + 1)])
+async def test_invalid_key_is_rejected(middleware, handler, chave):
+    async with client_for(middleware) as client:
+        resposta = await client.post(PATH, json={}, headers={"Idempotency-Key": chave})
+    assert resposta.status_code == 400
+    assert handler.calls == 0
+
+
+async def test_concurrent_attempts_share_one_execution(middleware, handler):
+    handler.delay = 0.05
+    async with client_for(middleware) as client:
+        respostas = await asyncio.gather(*(
+            client.post(PATH, json={"a": 1}, headers={"Idempotency-Key": "k1"}) for _ in range(5)
+        ))
+    assert handler.calls == 1
+    assert {resposta.json()["chamada"] for resposta in respostas} == {1}
+    assert sum(resposta.headers.get("idempotent-replayed") == "true" for resposta in respostas) == 4
+
+
+async def test_server_error_is_not_kept(db, middleware, handler):
+    handler.status = 503
+    async with client_for(middleware) as client:
+        await client.post(PATH, json={}, headers={"Idempotency-Key": "k1"})
+        handler.status = 200
+        resposta = await client.post(PATH, json={}, headers={"Idempotency-Key": "k1"})
+    assert resposta.status_code == 200
+    assert handler.calls == 2
+    assert (await db[idempotencia.COLLECTION].find_one({}))["estado"] == idempotencia.CONCLUIDO
+
+
+async def test_claim_of_another_worker_still_running_gets_409(db, middleware, handler, monkeypatch):
+    monkeypatch.setattr(idempotencia, "IDEMPOTENCY_WAIT", 0.1)
+    await db[idempotencia.COLLECTION].insert_one({
+        "_id": f"{PATH} k1", "hash": "h", "estado": idempotencia.PROCESSANDO, "created_at": datetime.utcnow(),
+    })
+    async with client_for(middleware) as client:
+        resposta = await client.post(PATH, json={}, headers={"Idempotency-Key": "k1"})
+    assert resposta.status_code == 409
+    assert handler.calls == 0
+
+
+async def test_stale_claim_is_taken_over(db, middleware, handler):
+    antigo = datetime.utcnow() - timedelta(seconds=idempotencia.IDEMPOTENCY_CLAIM_TTL + 1)
+    await db[idempotencia.COLLECTION].insert_one({
+        "_id": f"{PATH} k1", "hash": "h", "estado": idempotencia.PROCESSANDO, "created_at": antigo,
+    })
+    async with client_for(middleware) as client:
+        resposta = await client.post(PATH, json={}, headers={"Idempotency-Key": "k1"})
+    assert resposta.status_code == 200
+    assert handler.calls == 1
+
+
+async def test_server_replays_inside_cors(db, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "db", db)
+    empresa = {
+        "razao_social": "Leme", "cnpj": "00.000.000/0001-00", "logradouro": "Rua A",
+        "cep": "00000-000", "cidade": "Leme", "estado": "SP",
+    }
+    headers = {"Idempotency-Key": "k1", "Origin": "http://app.example"}
+    async with client_for(server.app) as client:
+        primeira = await client.post("/api/empresas", json=empresa, headers=headers)
+        segunda = await client.post("/api/empresas", json=empresa, headers=headers)
+    assert segunda.json()["id"] == primeira.json()["id"]
+    assert segunda.headers["idempotent-replayed"] == "true"
+    # CORS wraps the idempotency middleware, so replays carry its headers too
+    assert "access-control-allow-origin" in segunda.headers
+    assert await db.empresas.count_documents({}) == 1
@@ -0,0 +1,88 @@
+import io
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+
+import importacao
+from loadtest import funcionario_sintetico
+from search import search_fields
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def referencias(db):
+    await db.funcoes.insert_one({"id": "x"})
+    await db.empresas.insert_one({"id": "e1"})
+    await db.clientes.insert_one({"id": "c1"})
+
+
+def linha(server, numero, **campos):
+    """A FuncionarioCreate row as a spreadsheet would hold it."""
+    funcionario = {**funcionario_sintetico(numero, "x", "e1", "c1"), **campos}
+    return {campo: funcionario.get(campo) for campo in server.IMPORT_FIELDS}
+
+
+def planilha_csv(linhas):
+    campos = list(linhas[0])
+    texto = ";".join(campos) + "\n" + "".join(
+        ";".join("" if linha[campo] is None else str(linha[campo]) for campo in campos) + "\n" for linha in linhas
+    )
+    return {"arquivo": ("funcionarios.csv", texto.encode("utf-8-sig"), "text/csv")}
+
+
+def test_csv_headers_and_brazilian_values():
+    texto = "Nome;Matrícula  eSocial;Data Admissão;Salário;Tem dependentes;Coluna extra\nAna; 123 ;05/03/2024;2.500,50;Sim;x\n;;;;;\n"
+    fields = {"nome": str, "matricula_esocial": str, "data_admissao": date, "salario": float, "tem_dependentes": bool}
+    assert list(importacao.read_csv(io.BytesIO(texto.encode()), fields)) == [(2, {
+        "nome": "Ana", "matricula_esocial": "123", "data_admissao": "2024-03-05", "salario": "2500.50", "tem_dependentes": True,
+    })]
+
+
+async def test_each_row_is_reported(server, db, api, referencias):
+    cadastrado = funcionario_sintetico(90, "x", "e1", "c1")
+    await db.funcionarios.insert_one({**cadastrado, **search_fields(cadastrado)})
+    linhas = [
+        linha(server, 1, data_admissao="01/02/2024"),
+        linha(server, 2, nome=None),
+        linha(server, 3, funcao_id="nao-existe"),
+        linha(server, 4, cpf=linha(server, 1)["cpf"]),
+        linha(server, 5, cpf=cadastrado["cpf"]),
+    ]
+
+    resposta = await api.post("/api/funcionarios/import", files=planilha_csv(linhas))
+
+    relatorio = resposta.json()
+    assert (relatorio["created"], relatorio["duplicate"], relatorio["failed"]) == (1, 2, 2)
+    assert [(resultado["index"], resultado["status"]) for resultado in relatorio["results"]] == [
+        (2, "created"), (3, "error"), (4, "error"), (5, "duplicate"), (6, "duplicate"),
+    ]
+    assert relatorio["results"][1]["errors"][0]["loc"] == ["nome"]
+    assert relatorio["results"][2]["errors"] == [{"loc": ["funcao_id"], "msg": "Função não encontrada"}]
+    criado = await db.funcionarios.find_one({"id": relatorio["results"][0]["id"]})
+    assert criado["busca_nome"] == "funcionario 000001" and criado["data_admissao"].date() == date(2024, 2, 1)
+
+
+async def test_xlsx_numeric_documents_become_text(server, db, api, referencias):
+    dados = linha(server, 7, cpf=12345678909)
+    planilha = Workbook()
+    planilha.active.append(list(dados))
+    planilha.active.append(list(dados.values()))
+    arquivo = io.BytesIO()
+    planilha.save(arquivo)
+
+    resposta = await api.post("/api/funcionarios/import", files={"arquivo": ("equipe.xlsx", arquivo.getvalue(), "application/octet-stream")})
+
+    assert resposta.json()["created"] == 1
+    assert (await db.funcionarios.find_one({}))["cpf"] == "12345678909"
+
+
+async def test_oversized_or_unreadable_files_insert_nothing(server, db, api, referencias, monkeypatch):
+    monkeypatch.setattr(server, "MAX_IMPORT_ROWS", 1)
+    resposta = await api.post("/api/funcionarios/import", files=planilha_csv([linha(server, 1), linha(server, 2)]))
+    assert resposta.status_code == 413
+
+    resposta = await api.post("/api/funcionarios/import", files={"arquivo": ("equipe.pdf", b"%PDF", "application/pdf")})
+    assert resposta.status_code == 400
+    assert await db.funcionarios.count_documents({}) == 0
@@ -0,0 +1,33 @@
+import pytest
+from pymongo import ASCENDING, IndexModel
+
+import indexes
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_ensure_creates_every_index_once(db):
+    report = await indexes.ensure_indexes(db)
+
+    for collection_name, models in indexes.INDEX_SPECS.items():
+        assert sorted(report[collection_name]["created"]) == sorted(model.document["name"] for model in models)
+    assert "marcacoes_ponto" in await db.list_collection_names()
+
+    again = await indexes.ensure_indexes(db)
+    assert not any(entry.get("created") or entry["missing"] or entry["mismatched"] for entry in again.values())
+
+
+async def test_drift_is_reported_not_repaired(db):
+    # A deployment that built `id_unique` without the constraint, plus an index of its own
+    await db.empresas.create_indexes([
+        IndexModel([("id", ASCENDING)], name="id_unique"),
+        IndexModel([("cnpj", ASCENDING)], name="cnpj"),
+    ])
+
+    drift = (await indexes.check_indexes(db))["empresas"]
+    assert drift == {"missing": ["created_at_id"], "mismatched": ["id_unique"], "unmanaged": ["cnpj"]}
+
+    report = (await indexes.ensure_indexes(db))["empresas"]
+    assert report["created"] == ["created_at_id"] and report["mismatched"] == ["id_unique"]
+    existentes = {index["name"]: index async for index in db.empresas.list_indexes()}
+    assert not existentes["id_unique"].get("unique") and "cnpj" in existentes
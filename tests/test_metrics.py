@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import anyio
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+def evento(command_name, command, request_id, duration_ms=500.0):
+    return SimpleNamespace(
+        command_name=command_name, command=command, reply={"cursor": {"firstBatch": []}},
+        connection_id=("localhost", 27017), request_id=request_id,
+        database_name="leme_test", duration_micros=int(duration_ms * 1000),
+    )
+
+
+def executar(listener, command_name, command, request_id, duration_ms=500.0):
+    listener.started(evento(command_name, command, request_id))
+    listener.succeeded(evento(command_name, command, request_id, duration_ms))
+
+
+class ExplainClient:
+    def __init__(self, resposta):
+        self.resposta = resposta
+        self.comandos = []
+
+    def __getitem__(self, database):
+        return self
+
+    async def command(self, comando):
+        self.comandos.append(comando)
+        return self.resposta
+
+
+def test_slow_reads_are_sampled_once_per_interval():
+    listener = metrics.MongoCommandListener(explain_interval=60)
+    filtro = {"find": "funcionarios", "filter": {"status": "ativo"}, "lsid": {"id": 1}, "$db": "leme_test"}
+    executar(listener, "find", filtro, 1)
+    executar(listener, "find", filtro, 2)
+    executar(listener, "find", filtro, 3, duration_ms=1)
+    executar(listener, "insert", {"insert": "funcionarios", "documents": []}, 4)
+
+    assert list(listener.slow_samples) == [
+        ("leme_test", "funcionarios", "find", {"find": "funcionarios", "filter": {"status": "ativo"}}),
+    ]
+
+
+def test_sampling_disabled_with_zero_interval():
+    listener = metrics.MongoCommandListener(explain_interval=0)
+    executar(listener, "find", {"find": "clientes", "filter": {}}, 1)
+    assert not listener.slow_samples
+
+
+@pytest.mark.parametrize("colecao, resposta", [
+    ("funcionarios", {"executionStats": {"nReturned": 3, "totalDocsExamined": 1200}}),
+    ("registros_presenca", {"stages": [{"$cursor": {"executionStats": {"nReturned": 3, "totalDocsExamined": 1200}}}, {"$group": {}}]}),
+])
+async def test_explain_counts_examined_and_returned(colecao, resposta):
+    listener = metrics.MongoCommandListener(explain_interval=60)
+    executar(listener, "aggregate", {"aggregate": colecao, "pipeline": [], "cursor": {}}, 1)
+    client = ExplainClient(resposta)
+
+    with pytest.raises(TimeoutError):
+        with anyio.fail_after(0.2):
+            await metrics.explain_slow_commands(client, listener, poll_seconds=0.01)
+
+    assert client.comandos == [
+        {"explain": {"aggregate": colecao, "pipeline": [], "cursor": {}}, "verbosity": "executionStats"},
+    ]
+    assert metrics.mongo_documents_examined._values[(colecao, "aggregate")] == 1200
+    assert metrics.mongo_sampled_documents_returned._values[(colecao, "aggregate")] == 3
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+INICIO = datetime(2024, 1, 1)
+
+
+async def inserir(db, numeros):
+    await db.atestados.insert_many([
+        {"id": f"a{n:03d}", "funcionario_id": "f1", "data_emissao": INICIO, "data_retorno_prevista": INICIO,
+         "dias_afastamento": 1, "cid": None, "medico": "Dr", "crm": "1", "observacoes": None,
+         "created_at": INICIO + timedelta(minutes=n)}
+        for n in numeros
+    ])
+
+
+async def percorrer(api, path, limit, entre_paginas=None):
+    vistos, after = [], None
+    while True:
+        resposta = await api.get(path, params={"limit": limit, **({"after": after} if after else {})})
+        assert resposta.status_code == 200
+        assert isinstance(resposta.json(), list)
+        vistos += [item["id"] for item in resposta.json()]
+        after = resposta.headers.get("x-next-cursor")
+        if not after:
+            return vistos
+        if entre_paginas:
+            await entre_paginas()
+
+
+async def test_pages_are_arrays_with_the_cursor_in_a_header(db, api):
+    await inserir(db, range(5))
+    primeira = await api.get("/api/atestados", params={"limit": 2})
+    assert [item["id"] for item in primeira.json()] == ["a000", "a001"]
+    assert primeira.headers["x-next-cursor"] == "a001"
+
+    ultima = await api.get("/api/atestados", params={"limit": 10})
+    assert len(ultima.json()) == 5 and "x-next-cursor" not in ultima.headers
+
+
+async def test_inserts_between_pages_neither_repeat_nor_skip(db, api):
+    await inserir(db, range(0, 20, 2))
+    novos = iter(range(1, 40, 2))
+
+    async def inserir_intercalado():
+        # One row older than the cursor (already passed) and one at the end
+        await inserir(db, [next(novos), 100 + next(novos)])
+
+    vistos = await percorrer(api, "/api/atestados", 3, inserir_intercalado)
+
+    assert len(vistos) == len(set(vistos))
+    assert {f"a{n:03d}" for n in range(0, 20, 2)} <= set(vistos)
+    assert vistos == sorted(vistos, key=lambda id_: int(id_[1:]))
+
+
+async def test_ties_on_created_at_are_broken_by_id(db, api):
+    await db.atestados.insert_many([
+        {"id": id_, "funcionario_id": "f1", "data_emissao": INICIO, "data_retorno_prevista": INICIO,
+         "dias_afastamento": 1, "medico": "Dr", "crm": "1", "created_at": INICIO}
+        for id_ in ("c", "a", "d", "b")
+    ])
+    assert await percorrer(api, "/api/atestados", 1) == ["a", "b", "c", "d"]
+
+
+async def test_unknown_cursor_is_rejected(api):
+    resposta = await api.get("/api/atestados", params={"after": "nao-existe"})
+    assert resposta.status_code == 400
@@ -0,0 +1,104 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import ponto
+
+
+def local(*partes) -> datetime:
+    """A wall-clock instant in PONTO_TIMEZONE, as stored (naive UTC)."""
+    return ponto.as_utc(datetime(*partes))
+
+
+def punches(*instantes, tipo=None) -> list:
+    return [{"funcionario_id": "f1", "registrado_em": instante, **({"tipo": tipo} if tipo else {})} for instante in instantes]
+
+
+def test_untyped_punches_alternate_and_repeats_are_dropped():
+    marcacoes = punches(local(2024, 5, 1, 8), local(2024, 5, 1, 8, 0, 30), local(2024, 5, 1, 12), local(2024, 5, 1, 13), local(2024, 5, 1, 17))
+    assert ponto.pair_punches(marcacoes) == [
+        {"entrada": local(2024, 5, 1, 8), "saida": local(2024, 5, 1, 12)},
+        {"entrada": local(2024, 5, 1, 13), "saida": local(2024, 5, 1, 17)},
+    ]
+
+
+def test_unmatched_and_overlong_shifts_have_a_missing_end():
+    saida = punches(local(2024, 5, 1, 7), tipo=ponto.SAIDA)
+    esquecida = punches(local(2024, 5, 1, 8), tipo=ponto.ENTRADA)
+    depois = punches(local(2024, 5, 2, 8), tipo=ponto.ENTRADA)
+    assert ponto.pair_punches(saida + esquecida + depois) == [
+        {"entrada": None, "saida": local(2024, 5, 1, 7)},
+        {"entrada": local(2024, 5, 1, 8), "saida": None},
+        {"entrada": local(2024, 5, 2, 8), "saida": None},
+    ]
+
+
+def test_night_shift_counts_on_the_day_it_starts():
+    marcacoes = punches(local(2024, 5, 1, 22), local(2024, 5, 2, 6))
+    [jornada] = ponto.jornadas("f1", marcacoes, date(2024, 5, 1), date(2024, 5, 2))
+    assert jornada["data"] == date(2024, 5, 1)
+    assert jornada["minutos_trabalhados"] == 8 * 60
+    assert not jornada["incompleta"]
+    assert ponto.jornadas("f1", marcacoes, date(2024, 5, 2), date(2024, 5, 2)) == []
+
+
+def test_presenca_row_reports_hours_and_incomplete_days():
+    jornada = {"funcionario_id": "f1", "data": date(2024, 5, 1), "minutos_trabalhados": 485, "incompleta": True}
+    assert ponto.presenca_row(jornada) == {
+        "funcionario_id": "f1", "data": date(2024, 5, 1), "presente": True,
+        "observacoes": "Ponto eletrônico: 8h05 (marcações incompletas)",
+    }
+
+
+@pytest.mark.anyio
+async def test_consolidate_reduces_per_funcionario_and_replaces_the_period(db):
+    await db[ponto.COLLECTION].insert_many([
+        *punches(local(2024, 5, 1, 8), local(2024, 5, 1, 12)),
+        {"funcionario_id": "f2", "registrado_em": local(2024, 5, 1, 9)},
+        {"funcionario_id": "f2", "registrado_em": local(2024, 5, 1, 10)},
+        # Entrada of a shift that started the evening before the period
+        *punches(local(2024, 4, 30, 22), local(2024, 5, 1, 2), local(2024, 5, 2, 8)),
+    ])
+
+    jornadas = await ponto.consolidate(db, date(2024, 5, 1), date(2024, 5, 2))
+    resumo = {(jornada["funcionario_id"], jornada["data"]): (jornada["minutos_trabalhados"], jornada["incompleta"]) for jornada in jornadas}
+    assert resumo == {("f1", date(2024, 5, 1)): (240, False), ("f2", date(2024, 5, 1)): (60, False), ("f1", date(2024, 5, 2)): (0, True)}
+    assert await db[ponto.JORNADAS_COLLECTION].count_documents({}) == 3
+
+    await db[ponto.COLLECTION].delete_many({"funcionario_id": "f2"})
+    await ponto.consolidate(db, date(2024, 5, 1), date(2024, 5, 2))
+    assert await db[ponto.JORNADAS_COLLECTION].distinct("funcionario_id") == ["f1"]
+    armazenada = await db[ponto.JORNADAS_COLLECTION].find_one({"id": "2024-05-01-f1"})
+    assert armazenada["data"] == datetime(2024, 5, 1)
+    assert armazenada["turnos"][0]["saida"] - armazenada["turnos"][0]["entrada"] == timedelta(hours=4)
+
+
+@pytest.mark.anyio
+async def test_consolidation_fills_only_days_without_a_manual_record(db, api):
+    await db.funcionarios.insert_one({"id": "f1", "nome": "Ana", "cliente_id": "c1", "posto_alocacao": "p1"})
+    await api.post("/api/presenca", json={"funcionario_id": "f1", "data": "2024-05-01", "presente": False, "tipo_falta": "Justificada", "observacoes": "RH"})
+    await db[ponto.COLLECTION].insert_many(punches(
+        local(2024, 5, 1, 8), local(2024, 5, 1, 12), local(2024, 5, 2, 8), local(2024, 5, 2, 12),
+    ))
+
+    resumo = (await api.post("/api/ponto/consolidar", params={"data_inicio": "2024-05-01", "data_fim": "2024-05-02"})).json()
+    assert (resumo["presencas_criadas"], resumo["presencas_mantidas"]) == (1, 1)
+    manual = await db.registros_presenca.find_one({"data": datetime(2024, 5, 1)})
+    assert (manual["presente"], manual["tipo_falta"], manual["observacoes"]) == (False, "Justificada", "RH")
+
+    # A later run refreshes the day it wrote itself
+    await db[ponto.COLLECTION].insert_many(punches(local(2024, 5, 2, 13), local(2024, 5, 2, 14)))
+    resumo = (await api.post("/api/ponto/consolidar", params={"data_inicio": "2024-05-01", "data_fim": "2024-05-02"})).json()
+    assert (resumo["presencas_atualizadas"], resumo["presencas_mantidas"]) == (1, 1)
+    derivado = await db.registros_presenca.find_one({"data": datetime(2024, 5, 2)})
+    assert derivado["observacoes"] == "Ponto eletrônico: 5h00"
+
+
+@pytest.mark.anyio
+async def test_jornadas_report_shift_times_in_local_time(db, api):
+    await db.funcionarios.insert_one({"id": "f1", "nome": "Ana", "cliente_id": "c1"})
+    await db[ponto.COLLECTION].insert_many(punches(local(2024, 5, 1, 8), local(2024, 5, 1, 12)))
+    await ponto.consolidate(db, date(2024, 5, 1), date(2024, 5, 1))
+
+    [jornada] = (await api.get("/api/ponto/jornadas")).json()
+    assert jornada["turnos"] == [{"entrada": "2024-05-01T08:00:00-03:00", "saida": "2024-05-01T12:00:00-03:00"}]
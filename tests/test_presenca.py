@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+from pymongo import ASCENDING, IndexModel
+
+import indexes
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def funcionario(db):
+    await db.funcionarios.insert_one({"id": "f1", "nome": "Ana", "cliente_id": "c1", "posto_alocacao": "p1"})
+    return "f1"
+
+
+async def rollup(db, dia):
+    return await db.rollups_presenca.find_one({"cliente_id": "c1", "data": dia}, {"_id": 0, "cliente_id": 0, "posto_alocacao": 0, "data": 0})
+
+
+async def test_second_create_for_a_day_updates_the_first(db, api, funcionario):
+    primeiro = await api.post("/api/presenca", json={"funcionario_id": funcionario, "data": "2024-05-01", "presente": True})
+    segundo = await api.post("/api/presenca", json={
+        "funcionario_id": funcionario, "data": "2024-05-01", "presente": False, "tipo_falta": "Justificada",
+    })
+
+    assert segundo.status_code == 200
+    assert segundo.json()["id"] == primeiro.json()["id"]
+    [registro] = await db.registros_presenca.find({}, {"_id": 0}).to_list(None)
+    assert registro["presente"] is False and registro["tipo_falta"] == "Justificada"
+    contadores = await rollup(db, datetime(2024, 5, 1))
+    assert contadores["presentes"] == 0 and contadores["faltas_justificadas"] == 1
+
+
+async def test_bulk_rows_for_a_recorded_day_update_it(db, api, funcionario):
+    await api.post("/api/presenca", json={"funcionario_id": funcionario, "data": "2024-05-01", "presente": True})
+    resposta = await api.post("/api/presenca/bulk", json=[
+        {"funcionario_id": funcionario, "data": "2024-05-01", "presente": False},
+        {"funcionario_id": funcionario, "data": "2024-05-02", "presente": True},
+    ])
+    assert (resposta.json()["created"], resposta.json()["updated"]) == (1, 1)
+    assert await db.registros_presenca.count_documents({}) == 2
+
+
+async def test_ensure_dedupes_and_makes_the_day_index_unique(db, funcionario):
+    await db.registros_presenca.create_indexes([
+        IndexModel([("funcionario_id", ASCENDING), ("data", ASCENDING)], name="funcionario_id_data"),
+    ])
+    dia = datetime(2024, 5, 1)
+    await db.registros_presenca.insert_many([
+        {"id": "antigo", "funcionario_id": funcionario, "data": dia, "presente": True, "created_at": datetime(2024, 5, 1, 8)},
+        {"id": "novo", "funcionario_id": funcionario, "data": dia, "presente": False, "created_at": datetime(2024, 5, 1, 9)},
+    ])
+    await db.rollups_presenca.insert_one({"cliente_id": "c1", "posto_alocacao": "p1", "data": dia, "presentes": 1, "faltas_nao_justificadas": 1})
+
+    report = await indexes.ensure_indexes(db)
+
+    assert "funcionario_id_data" in report["registros_presenca"]["created"]
+    assert report["registros_presenca"]["mismatched"] == []
+    assert await db.registros_presenca.distinct("id") == ["novo"]
+    contadores = await rollup(db, dia)
+    assert (contadores["presentes"], contadores["faltas_nao_justificadas"]) == (0, 1)
+    assert (await indexes.check_indexes(db))["registros_presenca"]["mismatched"] == []
@@ -0,0 +1,66 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class Indisponivel:
+    """A database whose server never answers."""
+
+    async def command(self, *args, **kwargs):
+        raise TimeoutError("sem resposta")
+
+
+def eleicao(resultado):
+    async def start():
+        return resultado
+    return start
+
+
+@pytest.fixture
+def frio(server, monkeypatch):
+    """Not warmed up yet, and a follower unless a test says otherwise."""
+    monkeypatch.setattr(server.app.state, "warm", False)
+    monkeypatch.setattr(server.leader, "start", eleicao(False))
+    return server
+
+
+async def test_health_never_touches_mongo(frio, api, monkeypatch):
+    monkeypatch.setattr(frio, "db", Indisponivel())
+    assert (await api.get("/api/health")).json() == {"status": "ok"}
+
+
+async def test_ready_is_503_until_mongo_answers(frio, api, db, monkeypatch):
+    monkeypatch.setattr(frio, "db", Indisponivel())
+    resposta = await api.get("/api/ready")
+    assert resposta.status_code == 503
+    assert resposta.json() == {"status": "indisponível", "detail": "sem resposta"}
+    assert not frio.app.state.warm
+
+    monkeypatch.setattr(frio, "db", db)
+    resposta = await api.get("/api/ready")
+    assert resposta.status_code == 200 and frio.app.state.warm
+
+
+async def test_warm_up_bootstraps_indexes_only_in_the_leader(frio, db, monkeypatch):
+    await frio.warm_up()
+    assert "created_at_id" not in await db.funcionarios.index_information()
+
+    monkeypatch.setattr(frio.app.state, "warm", False)
+    monkeypatch.setattr(frio.leader, "start", eleicao(True))
+    await frio.warm_up()
+    assert "created_at_id" in await db.funcionarios.index_information()
+
+
+
+async def test_lifespan_warms_up_and_releases_on_shutdown(frio, monkeypatch):
+    fechados = []
+
+    class Cliente:
+        def close(self):
+            fechados.append("mongo")
+
+    monkeypatch.setattr(frio, "client", Cliente())
+    monkeypatch.setattr(frio.folha, "FOLHA_WORKERS", 2)
+    async with frio.lifespan(frio.app):
+        assert frio.app.state.warm and frio.folha._pool is not None
+    assert frio.folha._pool is None and fechados == ["mongo"]
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import rollups
+
+pytestmark = pytest.mark.anyio
+
+DIA = datetime(2024, 3, 4)
+
+
+@pytest.fixture
+async def funcionarios(db):
+    await db.funcionarios.insert_many([
+        {"id": f"f{n}", "nome": f"F{n}", "cliente_id": "c1", "posto_alocacao": "p1"} for n in range(3)
+    ])
+
+
+async def presentes(db):
+    rollup = await db.rollups_presenca.find_one({"cliente_id": "c1", "data": DIA})
+    return rollup["presentes"] if rollup else 0
+
+
+async def registrar(db, funcionario_id):
+    registro = {"id": f"r-{funcionario_id}", "funcionario_id": funcionario_id, "data": DIA, "presente": True}
+    await db.registros_presenca.insert_one(dict(registro))
+    await rollups.apply_presencas(db, [registro])
+
+
+async def test_rebuild_recounts_from_raw_records(db, funcionarios):
+    await db.registros_presenca.insert_many([
+        {"id": "r0", "funcionario_id": "f0", "data": DIA, "presente": True},
+        {"id": "r1", "funcionario_id": "f1", "data": DIA, "presente": False, "tipo_falta": "Justificada"},
+    ])
+    await db.rollups_presenca.insert_one({"cliente_id": "c1", "posto_alocacao": "p1", "data": DIA, "presentes": 9})
+
+    assert await rollups.rebuild_rollups(db, date(2024, 3, 1), date(2024, 3, 31)) == 1
+    rollup = await db.rollups_presenca.find_one({"cliente_id": "c1", "data": DIA}, {"_id": 0})
+    assert rollup["presentes"] == 1 and rollup["faltas_justificadas"] == 1
+    assert await db.rollups_controle.count_documents({}) == 0
+
+
+async def test_create_during_rebuild_is_recounted_not_lost(db, funcionarios, monkeypatch):
+    await registrar(db, "f0")
+    recount = rollups._recount
+    chamadas = []
+
+    async def recount_then_create(*args):
+        totais = await recount(*args)
+        chamadas.append(args)
+        if len(chamadas) == 1:
+            # Raw record after the rebuild read, rollup delta before it writes
+            await registrar(db, "f1")
+        return totais
+
+    monkeypatch.setattr(rollups, "_recount", recount_then_create)
+    await rollups.rebuild_rollups(db, date(2024, 3, 1), date(2024, 3, 31))
+
+    assert await presentes(db) == 2
+    assert chamadas[1][1:] == (DIA.date(), DIA.date())
+
+
+async def test_deltas_apply_once_the_rebuild_is_over(db, funcionarios):
+    await rollups.rebuild_rollups(db)
+    await registrar(db, "f2")
+    assert await presentes(db) == 1
+
+
+async def test_second_rebuild_is_refused_until_the_lock_expires(db, funcionarios):
+    await db.rollups_controle.insert_one({"_id": "rebuild", "expira_em": datetime.utcnow() + timedelta(minutes=5), "dias": []})
+    with pytest.raises(rollups.RebuildInProgress):
+        await rollups.rebuild_rollups(db)
+
+    await db.rollups_controle.update_one({"_id": "rebuild"}, {"$set": {"expira_em": datetime.utcnow() - timedelta(seconds=1)}})
+    await registrar(db, "f0")
+    assert await presentes(db) == 1
+    await rollups.rebuild_rollups(db)
+    assert await db.rollups_controle.count_documents({}) == 0
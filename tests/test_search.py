@@ -0,0 +1,63 @@
+import pytest
+
+import search
+
+pytestmark = pytest.mark.anyio
+
+FUNCIONARIOS = [
+    ("f1", "João da Silva", "123.456.789-09"),
+    ("f2", "Joana Prado", "111.111.111-11"),
+    ("f3", "Maria Joaquina", "222.222.222-22"),
+    ("f4", "Ana Souza", "333.333.333-33"),
+    ("f5", "José Silva Santos", "444.444.444-44"),
+]
+
+
+@pytest.fixture
+async def funcionarios(db):
+    documentos = [{"id": id_, "nome": nome, "cpf": cpf, "rg": "12.345.678-X"} for id_, nome, cpf in FUNCIONARIOS]
+    await db.funcionarios.insert_many([{**documento, **search.search_fields(documento)} for documento in documentos])
+
+
+def test_normalization():
+    assert search.normalize_text("  João  D'Ávila ") == "joao d avila"
+    assert search.normalize_document("123.456.789-09") == "12345678909"
+    assert search.search_fields({"nome": "Éric Ávila", "cpf": "1.2", "rg": "9-X"}) == {
+        "busca_nome": "eric avila", "busca_tokens": ["avila", "eric"], "busca_documentos": ["12", "9x"],
+    }
+
+
+async def test_name_prefix_ranks_before_word_prefix(db, funcionarios):
+    documentos, next_cursor = await search.search_funcionarios(db, "JOA", 10)
+    assert [(documento["id"], documento["relevancia"]) for documento in documentos] == [
+        ("f2", search.TIER_NOME), ("f1", search.TIER_NOME), ("f3", search.TIER_PALAVRA),
+    ]
+    assert next_cursor is None
+
+
+async def test_every_word_must_prefix_a_name_word(db, funcionarios):
+    documentos, _ = await search.search_funcionarios(db, "silva jo", 10)
+    assert [documento["id"] for documento in documentos] == ["f1", "f5"]
+
+
+async def test_documents_match_exactly_whatever_the_punctuation(db, funcionarios):
+    documentos, _ = await search.search_funcionarios(db, "12345678909", 10)
+    assert [(documento["id"], documento["relevancia"]) for documento in documentos] == [("f1", search.TIER_DOCUMENTO)]
+    assert await search.search_funcionarios(db, "123456789", 10) == ([], None)
+
+
+async def test_cursor_walks_across_tiers_without_repeats(db, funcionarios):
+    vistos, after = [], None
+    while True:
+        documentos, after = await search.search_funcionarios(db, "jo", 1, after)
+        vistos += [documento["id"] for documento in documentos]
+        if not after:
+            break
+    assert vistos == ["f2", "f1", "f5", "f3"]
+
+
+async def test_api_hides_search_keys_and_rejects_bad_cursors(api, funcionarios):
+    resposta = await api.get("/api/funcionarios/search", params={"q": "ana", "fields": "nome"})
+    assert resposta.json() == [{"id": "f4", "nome": "Ana Souza", "relevancia": search.TIER_NOME}]
+
+    assert (await api.get("/api/funcionarios/search", params={"q": "ana", "after": "???"})).status_code == 400
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pytest
+
+from loadtest import funcionario_sintetico
+from search import search_fields
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_list_matches_model_validation(server, db, api):
+    documentos = [
+        {**funcionario_sintetico(numero), "created_at": datetime(2024, 1, 1, numero, 30, 15, 123000)}
+        for numero in range(3)
+    ]
+    # Written before quantidade_dependentes existed
+    del documentos[0]["quantidade_dependentes"]
+    await db.funcionarios.insert_many([{**documento, **search_fields(documento)} for documento in documentos])
+
+    resposta = await api.get("/api/funcionarios")
+
+    esperado = [server.Funcionario(**documento).model_dump(mode="json") for documento in documentos]
+    assert resposta.json() == esperado
+    assert resposta.json()[0]["quantidade_dependentes"] == 0
+    assert resposta.json()[0]["data_admissao"] == "2020-01-01"
+
+
+async def test_optional_fields_missing_in_storage_come_back_as_defaults(api, db):
+    await db.registros_presenca.insert_one({
+        "id": "r1", "funcionario_id": "f1", "data": datetime(2024, 3, 1), "presente": True,
+        "created_at": datetime(2024, 3, 1, 8),
+    })
+    [registro] = (await api.get("/api/presenca")).json()
+    assert registro == {
+        "id": "r1", "funcionario_id": "f1", "data": "2024-03-01", "presente": True,
+        "tipo_falta": None, "observacoes": None, "origem": None, "created_at": "2024-03-01T08:00:00",
+    }
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+DIA = datetime(2024, 3, 4)
+
+
+@pytest.fixture
+async def equipe(db):
+    await db.funcionarios.insert_many([
+        {"id": f"f{n}", "nome": f"F{n}", "cliente_id": "c1", "posto_alocacao": "p1", "created_at": datetime(2024, 1, 1, n)}
+        for n in range(5)
+    ])
+    await db.registros_presenca.insert_many([
+        {"id": "r0", "funcionario_id": "f0", "data": DIA, "presente": True},
+        {"id": "r1", "funcionario_id": "f1", "data": DIA, "presente": False, "tipo_falta": "Justificada"},
+        # Also on atestado and licença that day: the licença wins
+        {"id": "r2", "funcionario_id": "f2", "data": DIA, "presente": True},
+    ])
+    await db.atestados.insert_many([
+        {"id": "a2", "funcionario_id": "f2", "data_emissao": DIA, "data_retorno_prevista": datetime(2024, 3, 6)},
+        {"id": "a3", "funcionario_id": "f3", "data_emissao": datetime(2024, 3, 1), "data_retorno_prevista": DIA},
+    ])
+    await db.licencas.insert_one({"id": "l2", "funcionario_id": "f2", "data_inicio": DIA, "data_fim": DIA})
+
+
+def por_funcionario(resposta):
+    assert resposta.status_code == 200, resposta.text
+    return {item["funcionario_id"]: [(dia["status"], dia["referencia_id"]) for dia in item["dias"]] for item in resposta.json()}
+
+
+async def test_status_precedence_on_a_day(api, equipe):
+    status = por_funcionario(await api.get("/api/funcionarios/status", params={"data": "2024-03-04"}))
+    assert status == {
+        "f0": [("Presente", "r0")],
+        "f1": [("Falta Justificada", "r1")],
+        "f2": [("Licença", "l2")],
+        # Back on the return day
+        "f3": [("Sem Registro", None)],
+        "f4": [("Sem Registro", None)],
+    }
+
+
+async def test_ausentes_lists_only_people_out_in_the_period(api, equipe):
+    status = por_funcionario(await api.get("/api/funcionarios/status", params={
+        "data_inicio": "2024-03-03", "data_fim": "2024-03-05", "ausentes": "true",
+    }))
+    assert sorted(status) == ["f1", "f2", "f3"]
+    assert status["f3"] == [("Atestado", "a3"), ("Sem Registro", None), ("Sem Registro", None)]
+    assert status["f2"][2] == ("Atestado", "a2")
+
+
+async def test_period_longer_than_a_month_is_400(api):
+    resposta = await api.get("/api/funcionarios/status", params={"data_inicio": "2024-03-01", "data_fim": "2024-04-01"})
+    assert resposta.status_code == 400
@@ -0,0 +1,146 @@
+import asyncio
+import os
+
+import orjson
+import pytest
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+import writebehind
+
+pytestmark = pytest.mark.anyio
+
+
+class Committer:
+    """`commit` callback recording batches; fails the first `falhas` calls, and any batch holding `rejeitado`."""
+
+    def __init__(self, falhas=0, rejeitado=None):
+        self.lotes = []
+        self.falhas = falhas
+        self.rejeitado = rejeitado
+
+    async def __call__(self, documentos):
+        if self.falhas:
+            self.falhas -= 1
+            raise AutoReconnect("mongo fora do ar")
+        if self.rejeitado in documentos:
+            raise DuplicateKeyError("E11000")
+        self.lotes.append(documentos)
+
+    @property
+    def documentos(self):
+        return [documento for lote in self.lotes for documento in lote]
+
+
+def segments(directory):
+    return sorted(directory.glob("presenca-*.jsonl"))
+
+
+async def test_enqueued_documents_are_committed_in_batches(tmp_path):
+    commit = Committer()
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, commit, batch_size=10, flush_ms=10)
+    await queue.start()
+    await asyncio.gather(*(queue.enqueue({"id": numero}) for numero in range(25)))
+    await queue.stop()
+
+    assert sorted(documento["id"] for documento in commit.documentos) == list(range(25))
+    assert all(len(lote) <= 10 for lote in commit.lotes)
+    assert queue.pending == 0
+    assert segments(tmp_path) == []
+
+
+async def test_orphaned_segment_is_replayed_on_start(tmp_path):
+    orfao = tmp_path / "presenca-99999-dead.jsonl"
+    # The torn last line was never acknowledged and is skipped
+    orfao.write_bytes(orjson.dumps({"id": "a"}) + b"\n" + orjson.dumps({"id": "b"}) + b"\n" + b'{"id": "c')
+    commit = Committer()
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, commit, flush_ms=10)
+    await queue.start()
+    await queue.stop()
+
+    assert commit.documentos == [{"id": "a"}, {"id": "b"}]
+    assert not orfao.exists()
+
+
+async def test_failed_commit_is_retried_and_counts_as_pending(tmp_path, monkeypatch):
+    monkeypatch.setattr(writebehind, "RETRY_SECONDS", 0.05)
+    commit = Committer(falhas=2)
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, commit, batch_size=100, flush_ms=10)
+    await queue.start()
+    await queue.enqueue({"id": 1})
+    await asyncio.sleep(0.03)
+    # Rotated out of the journal but not yet in Mongo
+    assert queue.pending == 1
+    await queue.stop()
+
+    assert commit.documentos == [{"id": 1}]
+    assert queue.pending == 0
+
+
+async def test_full_queue_refuses_new_documents(tmp_path):
+    bloqueio = asyncio.Event()
+
+    async def commit(documentos):
+        await bloqueio.wait()
+
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, commit, batch_size=1, flush_ms=10, max_pending=3)
+    await queue.start()
+    for numero in range(3):
+        await queue.enqueue({"id": numero})
+    with pytest.raises(writebehind.QueueFull):
+        await queue.enqueue({"id": 3})
+    bloqueio.set()
+    await queue.stop()
+
+
+async def test_segment_left_uncommitted_at_stop_survives_for_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(writebehind, "STOP_TIMEOUT", 0.1)
+    monkeypatch.setattr(writebehind, "RETRY_SECONDS", 0.05)
+    parado = Committer(falhas=10 ** 6)
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, parado, flush_ms=10)
+    await queue.start()
+    await queue.enqueue({"id": 1})
+    await queue.stop()
+    assert len(segments(tmp_path)) >= 1
+
+    commit = Committer()
+    proxima = writebehind.WriteBehindQueue("presenca", tmp_path, commit, flush_ms=10)
+    await proxima.start()
+    await proxima.stop()
+    assert commit.documentos == [{"id": 1}]
+    assert segments(tmp_path) == []
+
+
+async def test_rejected_document_is_dead_lettered_and_the_rest_committed(tmp_path, monkeypatch):
+    monkeypatch.setattr(writebehind, "RETRY_SECONDS", 0.01)
+    commit = Committer(rejeitado={"id": 2})
+    queue = writebehind.WriteBehindQueue("presenca", tmp_path, commit, batch_size=10, flush_ms=10, commit_retries=2)
+    await queue.start()
+    await asyncio.gather(*(queue.enqueue({"id": numero}) for numero in range(5)))
+    await queue.stop()
+
+    assert sorted(documento["id"] for documento in commit.documentos) == [0, 1, 3, 4]
+    [morto] = (tmp_path / writebehind.DEAD_LETTER_DIR).glob("presenca-*.jsonl")
+    assert morto.read_bytes() == b'{"id":2}\n'
+    assert segments(tmp_path) == []
+    # Later documents still go through
+    await queue.start()
+    await queue.enqueue({"id": 5})
+    await queue.stop()
+    assert commit.documentos[-1] == {"id": 5}
+
+
+def test_replay_does_not_recreate_an_unlinked_segment(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        writebehind._open_segment(tmp_path / "presenca-1-gone.jsonl", create=False)
+    assert not (tmp_path / "presenca-1-gone.jsonl").exists()
+
+
+def test_segment_held_by_a_live_worker_is_skipped_without_leaking(tmp_path):
+    path = tmp_path / "presenca-1-live.jsonl"
+    vivo = writebehind._open_segment(path)
+    abertos = len(os.listdir("/proc/self/fd"))
+    for _ in range(3):
+        with pytest.raises(BlockingIOError):
+            writebehind._open_segment(path, create=False)
+    assert len(os.listdir("/proc/self/fd")) == abertos
+    vivo.close()